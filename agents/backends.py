@@ -0,0 +1,401 @@
+"""Pluggable LLM backends behind BaseAgent.
+
+Agents never call the OpenAI SDK directly; they send chat completion requests
+to an LLMBackend, which returns OpenAI-shaped responses:
+
+- OpenAIBackend sends them to the API through the pooled clients (the default);
+- StubBackend answers offline by replaying recorded completions after a
+  latency drawn from a configurable distribution, so the whole triage path can
+  be load-tested and regression-tested without network access or cost;
+- RecordingBackend wraps another backend and appends every completion to a
+  JSONL file that StubBackend can replay later.
+
+The backend is chosen by LLM_BACKEND_SETTINGS in config.py (or the LLM_BACKEND
+and LLM_RECORD_PATH environment variables), or set in code with set_backend().
+"""
+import os
+import json
+import time
+import math
+import random
+import asyncio
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+
+import openai
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from config import LLM_BACKEND_SETTINGS
+from .clients import get_client, get_async_client
+
+
+def request_digest(request):
+    """Stable hash of a request's model and messages, used to match recordings."""
+    payload = json.dumps([request.get("model"), request.get("messages")], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMBackend(ABC):
+    """Where BaseAgent sends chat completion requests.
+
+    `request` is the keyword arguments of chat.completions.create (model,
+    messages, temperature, max_tokens, response_format), `timeout` the seconds
+    the attempt may take. Responses must look like the OpenAI SDK's.
+    """
+
+    # Whether agents need OPENAI_API_KEY to use this backend
+    requires_api_key = True
+
+    @abstractmethod
+    def complete(self, stage, request, timeout):
+        """Return a ChatCompletion for the request."""
+
+    @abstractmethod
+    async def acomplete(self, stage, request, timeout):
+        """Async variant of complete()."""
+
+    @abstractmethod
+    def stream(self, stage, request, timeout):
+        """Return an iterable of ChatCompletionChunk with a close() method; the last chunk carries usage."""
+
+
+class OpenAIBackend(LLMBackend):
+    """Sends requests to the OpenAI API through the shared client pool (agents/clients.py)."""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def complete(self, stage, request, timeout):
+        return get_client(self.api_key).chat.completions.create(**request, timeout=timeout)
+
+    async def acomplete(self, stage, request, timeout):
+        return await get_async_client(self.api_key).chat.completions.create(**request, timeout=timeout)
+
+    def stream(self, stage, request, timeout):
+        return get_client(self.api_key).chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}, timeout=timeout
+        )
+
+
+def load_recordings(path):
+    """Recorded completions from a JSONL file, grouped by stage."""
+    recordings = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                recordings.setdefault(record["stage"], []).append(record)
+    return recordings
+
+
+class LatencyModel:
+    """Per-stage latency distributions for StubBackend.
+
+    Each stage (or "default") maps to one of:
+        {"distribution": "fixed", "seconds": 1.0}
+        {"distribution": "uniform", "low": 0.5, "high": 2.0}
+        {"distribution": "lognormal", "median": 1.0, "sigma": 0.5}
+        {"distribution": "recorded"}  - the latencies stored with the stage's recordings
+    Every sample is multiplied by `scale`.
+    """
+
+    DISTRIBUTIONS = ("fixed", "uniform", "lognormal", "recorded")
+
+    def __init__(self, specs, scale=1.0):
+        self.specs = specs
+        self.scale = scale
+        for stage, spec in specs.items():
+            if spec["distribution"] not in self.DISTRIBUTIONS:
+                raise ValueError(
+                    f"Unknown latency distribution '{spec['distribution']}' for {stage}. "
+                    f"Options: {', '.join(self.DISTRIBUTIONS)}"
+                )
+
+    def sample(self, stage, rng, recordings=()):
+        spec = self.specs.get(stage, self.specs.get("default", {"distribution": "fixed", "seconds": 0.0}))
+        distribution = spec["distribution"]
+        if distribution == "fixed":
+            seconds = spec["seconds"]
+        elif distribution == "uniform":
+            seconds = rng.uniform(spec["low"], spec["high"])
+        elif distribution == "lognormal":
+            seconds = spec["median"] * math.exp(rng.gauss(0.0, spec["sigma"]))
+        else:
+            latencies = [record["latency"] for record in recordings if record.get("latency") is not None]
+            seconds = rng.choice(latencies) if latencies else 0.0
+        return max(0.0, seconds * self.scale)
+
+
+class _StubStream:
+    """Chunk iterator returned by StubBackend.stream()."""
+
+    def __init__(self, chunks, delay):
+        self._chunks = chunks
+        self._delay = delay
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self._closed:
+                return
+            if chunk.choices and self._delay:
+                time.sleep(self._delay)
+            yield chunk
+
+    def close(self):
+        self._closed = True
+
+
+class StubBackend(LLMBackend):
+    """Deterministic offline backend that replays recorded completions.
+
+    A request gets the recording made for exactly the same model and messages
+    when there is one, otherwise one of its stage's recordings picked by a hash
+    of the request, so the same request always gets the same answer. Latency
+    comes from a LatencyModel seeded the same way. Token usage is estimated from
+    the text (about 4 characters per token), with system messages of 1024+
+    tokens counted as cached after their first use, like the API's prompt cache.
+    """
+
+    requires_api_key = False
+
+    def __init__(self, recordings, latency=None, seed=0):
+        """Create the stub.
+
+        Args:
+            recordings: Path to a JSONL file of recorded completions, or {stage: [record, ...]}.
+            latency: LatencyModel (defaults to no delay).
+            seed: Seed for latency sampling and recording choice.
+        """
+        self.recordings = load_recordings(recordings) if isinstance(recordings, str) else recordings
+        self.by_digest = {
+            record["digest"]: record
+            for records in self.recordings.values() for record in records if record.get("digest")
+        }
+        self.latency = latency or LatencyModel({"default": {"distribution": "fixed", "seconds": 0.0}})
+        self.seed = seed
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, settings=None):
+        settings = settings or LLM_BACKEND_SETTINGS["stub"]
+        return cls(
+            settings["recordings"],
+            LatencyModel(settings["latency"], settings.get("latency_scale", 1.0)),
+            settings.get("seed", 0)
+        )
+
+    def _pick(self, stage, request):
+        digest = request_digest(request)
+        rng = random.Random(f"{self.seed}:{stage}:{digest}")
+        record = self.by_digest.get(digest)
+        if record is None:
+            records = self.recordings.get(stage)
+            if not records:
+                raise ValueError(f"No recorded completions for stage '{stage}'")
+            record = records[rng.randrange(len(records))]
+        latency = self.latency.sample(stage, rng, self.recordings.get(stage, ()))
+        return record, latency
+
+    def _usage(self, request, content):
+        messages = request.get("messages", [])
+        prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4 + 4 * len(messages)
+        cached_tokens = 0
+        system = messages[0]["content"] if messages and messages[0].get("role") == "system" else ""
+        system_tokens = len(system) // 4
+        if system_tokens >= 1024:
+            prefix = hashlib.sha256(system.encode('utf-8')).hexdigest()
+            with self._lock:
+                if prefix in self._seen_prefixes:
+                    cached_tokens = system_tokens // 128 * 128
+                self._seen_prefixes.add(prefix)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": max(1, len(content) // 4),
+            "total_tokens": prompt_tokens + max(1, len(content) // 4),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+
+    def _completion(self, request, record):
+        content = record["content"]
+        return ChatCompletion.model_validate({
+            "id": f"stub-{request_digest(request)[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", record.get("model", "stub")),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": record.get("finish_reason", "stop")
+            }],
+            "usage": self._usage(request, content)
+        })
+
+    @staticmethod
+    def _timed_out(latency, timeout):
+        return timeout is not None and latency > timeout
+
+    def complete(self, stage, request, timeout):
+        record, latency = self._pick(stage, request)
+        if self._timed_out(latency, timeout):
+            time.sleep(timeout)
+            raise openai.APITimeoutError(request=None)
+        time.sleep(latency)
+        return self._completion(request, record)
+
+    async def acomplete(self, stage, request, timeout):
+        record, latency = self._pick(stage, request)
+        if self._timed_out(latency, timeout):
+            await asyncio.sleep(timeout)
+            raise openai.APITimeoutError(request=None)
+        await asyncio.sleep(latency)
+        return self._completion(request, record)
+
+    def stream(self, stage, request, timeout):
+        record, latency = self._pick(stage, request)
+        if self._timed_out(latency, timeout):
+            time.sleep(timeout)
+            raise openai.APITimeoutError(request=None)
+
+        content = record["content"]
+        # Word-sized deltas, spread over the sampled latency
+        words = [word + " " for word in content.split(" ")]
+        words[-1] = words[-1][:-1]
+        base = {
+            "id": f"stub-{request_digest(request)[:24]}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", record.get("model", "stub"))
+        }
+        chunks = [
+            ChatCompletionChunk.model_validate(dict(base, choices=[
+                {"index": 0, "delta": {"content": word}, "finish_reason": None}
+            ]))
+            for word in words
+        ]
+        chunks.append(ChatCompletionChunk.model_validate(dict(base, choices=[
+            {"index": 0, "delta": {}, "finish_reason": record.get("finish_reason", "stop")}
+        ])))
+        chunks.append(ChatCompletionChunk.model_validate(dict(base, choices=[], usage=self._usage(request, content))))
+        return _StubStream(chunks, latency / len(words))
+
+
+class RecordingBackend(LLMBackend):
+    """Passes requests to another backend and appends each completion to a JSONL file for StubBackend."""
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        self.requires_api_key = backend.requires_api_key
+        self._lock = threading.Lock()
+
+    def _write(self, stage, request, content, finish_reason, usage, latency):
+        record = {
+            "stage": stage,
+            "model": request.get("model"),
+            "digest": request_digest(request),
+            "content": content,
+            "finish_reason": finish_reason,
+            "usage": usage.model_dump() if usage is not None else None,
+            "latency": round(latency, 3)
+        }
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+    def complete(self, stage, request, timeout):
+        start = time.perf_counter()
+        response = self.backend.complete(stage, request, timeout)
+        choice = response.choices[0]
+        self._write(stage, request, choice.message.content, choice.finish_reason, response.usage,
+                    time.perf_counter() - start)
+        return response
+
+    async def acomplete(self, stage, request, timeout):
+        start = time.perf_counter()
+        response = await self.backend.acomplete(stage, request, timeout)
+        choice = response.choices[0]
+        self._write(stage, request, choice.message.content, choice.finish_reason, response.usage,
+                    time.perf_counter() - start)
+        return response
+
+    def stream(self, stage, request, timeout):
+        start = time.perf_counter()
+        return _RecordedStream(self, stage, request, self.backend.stream(stage, request, timeout), start)
+
+
+class _RecordedStream:
+    """Passes chunks through and records the assembled completion once the stream is exhausted."""
+
+    def __init__(self, recorder, stage, request, stream, start):
+        self._recorder = recorder
+        self._stage = stage
+        self._request = request
+        self._stream = stream
+        self._start = start
+
+    def __iter__(self):
+        parts = []
+        usage = None
+        finish_reason = None
+        for chunk in self._stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices:
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                parts.append(chunk.choices[0].delta.content or "")
+            yield chunk
+        self._recorder._write(
+            self._stage, self._request, "".join(parts), finish_reason, usage, time.perf_counter() - self._start
+        )
+
+    def close(self):
+        self._stream.close()
+
+
+_override = None
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def backend_name():
+    """The configured backend, overridable with the LLM_BACKEND environment variable."""
+    return os.getenv("LLM_BACKEND") or LLM_BACKEND_SETTINGS["backend"]
+
+
+def _new_backend(api_key):
+    name = backend_name()
+    if name == "openai":
+        backend = OpenAIBackend(api_key)
+    elif name == "stub":
+        backend = StubBackend.from_config()
+    else:
+        raise ValueError(f"Unknown LLM backend '{name}'. Options: openai, stub")
+    record_path = os.getenv("LLM_RECORD_PATH") or LLM_BACKEND_SETTINGS["record_path"]
+    if record_path:
+        backend = RecordingBackend(backend, record_path)
+    return backend
+
+
+def get_backend(api_key=None):
+    """The backend agents should use: set_backend()'s, else the one LLM_BACKEND_SETTINGS selects."""
+    with _backends_lock:
+        if _override is not None:
+            return _override
+        # The stub is shared so its recordings are loaded once
+        key = api_key if backend_name() == "openai" else None
+        backend = _backends.get(key)
+        if backend is None:
+            backend = _new_backend(api_key)
+            _backends[key] = backend
+        return backend
+
+
+def set_backend(backend):
+    """Send every agent's requests to `backend` (None goes back to LLM_BACKEND_SETTINGS)."""
+    global _override
+    with _backends_lock:
+        _override = backend
+        _backends.clear()
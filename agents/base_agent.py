@@ -1,18 +1,57 @@
 import os
+import time
+import logging
 from abc import ABC, abstractmethod
+import httpx
 import openai
+from .clients import get_client, get_async_client
+from .backends import get_backend
+from .cache import get_default_cache, make_cache_key
+from .metrics import metrics
+from .instrumentation import CallRecord, current_call_context, get_call_recorder, take_queue_time
+from .model_settings import stage_settings, estimate_cost
+from .resilience import CallPolicy, StreamInterruptedError
+from .schemas import StructuredOutputError, response_format_for
+from config import STRUCTURED_OUTPUT_SETTINGS
+
+logger = logging.getLogger(__name__)
 
 class BaseAgent(ABC):
     """Base class for all agents in the dental follow-up system."""
 
-    def __init__(self, name, api_key=None):
+    # AI_SETTINGS stage this agent's calls are routed and reported under
+    stage = None
+
+    def __init__(self, name, api_key=None, cache=None):
         self.name = name
 
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
+        if not self.api_key and get_backend(self.api_key).requires_api_key:
             raise ValueError("OpenAI API key is required.")
-        
-        self.client = openai.OpenAI(api_key = self.api_key)
+
+        # Optional LLMCache; falls back to the process-wide one when CACHE_SETTINGS enables it
+        self.cache = cache if cache is not None else get_default_cache()
+
+        # Model, temperature and max_tokens for this agent's stage (AI_SETTINGS + env overrides)
+        self.settings = stage_settings(self.stage)
+
+        # Deadline, retries, hedging and circuit breaking (RESILIENCE_SETTINGS + env overrides)
+        self.policy = CallPolicy(self.stage)
+    
+    @property
+    def client(self):
+        """Shared, pooled OpenAI client from the process-wide registry."""
+        return get_client(self.api_key)
+    
+    @property
+    def async_client(self):
+        """Shared AsyncOpenAI client for the running event loop."""
+        return get_async_client(self.api_key)
+    
+    @property
+    def backend(self):
+        """LLMBackend this agent's completions go to (OpenAI unless configured otherwise)."""
+        return get_backend(self.api_key)
     
     @abstractmethod
     def process(self, input_data):
@@ -26,26 +65,354 @@ class BaseAgent(ABC):
         """
         pass
 
-    def call_gpt(self, prompt, system_message=None, model="gpt-4o-mini"):
+    def _build_messages(self, prompt, system_message=None):
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _call_params(self, model=None, temperature=None, max_tokens=None):
+        """Explicit arguments win over the stage settings."""
+        params = {
+            "model": model or self.settings["model"],
+            "temperature": self.settings["temperature"] if temperature is None else temperature,
+            "max_tokens": self.settings["max_tokens"] if max_tokens is None else max_tokens
+        }
+        return {key: value for key, value in params.items() if value is not None}
+
+    def _cache_key(self, prompt, system_message, params, use_cache, response_format=None):
+        if not (use_cache and self.cache):
+            return None
+        return make_cache_key(
+            params["model"], system_message, prompt,
+            response_format=response_format,
+            **{key: value for key, value in params.items() if key != "model"}
+        )
+
+    def _cache_get(self, cache_key, params):
+        if not cache_key:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            metrics.increment("llm_cache_hits", stage=self.stage, model=params["model"])
+        return cached
+
+    def _request_kwargs(self, messages, params, response_format=None):
+        kwargs = dict(params, messages=messages)
+        if response_format:
+            kwargs["response_format"] = response_format
+        return kwargs
+
+    def _record_usage(self, params, usage, finish_reason, elapsed, sent_at=None):
+        """Count tokens, estimated cost and latency per stage/model for stage_report(), and record the call.
+
+        Args:
+            sent_at: Epoch time the request went out, for the call's queue time.
+        """
+        labels = {"stage": self.stage, "model": params["model"]}
+        metrics.increment("llm_calls", **labels)
+        metrics.observe("llm_latency_seconds", elapsed, **labels)
+
+        prompt_tokens = completion_tokens = cached_tokens = 0
+        cost = 0.0
+        if usage:
+            prompt_tokens = usage.prompt_tokens or 0
+            completion_tokens = usage.completion_tokens or 0
+            # Prompt tokens served from the provider's prefix cache (billed at the cached-input rate)
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None) or 0
+            cost = estimate_cost(params["model"], prompt_tokens, completion_tokens, cached_tokens)
+            metrics.increment("llm_prompt_tokens", prompt_tokens, **labels)
+            metrics.increment("llm_cached_tokens", cached_tokens, **labels)
+            metrics.increment("llm_completion_tokens", completion_tokens, **labels)
+            metrics.increment("llm_cost_usd", cost, **labels)
+            logger.info(
+                "%s call (%s): %d prompt tokens, %d cached (%.0f%%), %d completion tokens, %.2fs",
+                self.stage, params["model"], prompt_tokens, cached_tokens,
+                100 * cached_tokens / prompt_tokens if prompt_tokens else 0, completion_tokens, elapsed
+            )
+
+        if finish_reason == "length":
+            # Hit the max_tokens cap; the reply is cut off
+            metrics.increment("llm_truncated", **labels)
+
+        sent_at = time.time() - elapsed if sent_at is None else sent_at
+        queue_time = take_queue_time(sent_at)
+        metrics.observe("llm_queue_seconds", queue_time, **labels)
+        tags = current_call_context()
+        get_call_recorder().record(CallRecord(
+            timestamp=sent_at,
+            agent=self.name,
+            stage=self.stage,
+            model=params["model"],
+            wall_time=elapsed,
+            queue_time=queue_time,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            completion_tokens=completion_tokens,
+            cost_usd=cost,
+            finish_reason=finish_reason,
+            patient_id=tags.get("patient_id"),
+            run_id=tags.get("run_id")
+        ))
+
+    def _complete(self, messages, params, response_format=None):
+        """One completion under self.policy; raises LLMUnavailableError if the API can't answer in time."""
+        kwargs = self._request_kwargs(messages, params, response_format)
+        sent_at = time.time()
+        start = time.perf_counter()
+        response = self.policy.call(
+            params["model"], lambda timeout: self.backend.complete(self.stage, kwargs, timeout)
+        )
+        self._record_usage(
+            params, response.usage, response.choices[0].finish_reason, time.perf_counter() - start, sent_at
+        )
+        return response.choices[0].message.content
+
+    async def _acomplete(self, messages, params, response_format=None):
+        kwargs = self._request_kwargs(messages, params, response_format)
+        sent_at = time.time()
+        start = time.perf_counter()
+        response = await self.policy.acall(
+            params["model"], lambda timeout: self.backend.acomplete(self.stage, kwargs, timeout)
+        )
+        self._record_usage(
+            params, response.usage, response.choices[0].finish_reason, time.perf_counter() - start, sent_at
+        )
+        return response.choices[0].message.content
+
+    def call_gpt(self, prompt, system_message=None, model=None, use_cache=True, response_format=None,
+                 temperature=None, max_tokens=None):
         """Call OpenAI GPT API with prompt
         
         Args:
             prompt: user prompt to send to api
             system_message: Optional system message to set context.
-            model: the model to use (default with gpt-3.5-turbo)
+            model: the model to use (defaults to this agent's stage setting)
+            use_cache: Serve/store the completion from self.cache when one is configured.
+            response_format: Optional OpenAI response_format (e.g. a json_schema spec).
+            temperature: Sampling temperature (defaults to the stage setting).
+            max_tokens: Output token cap (defaults to the stage setting).
 
         Returns:
             the response from API    
         """
-        messages = []
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
+        params = self._call_params(model, temperature, max_tokens)
+        cache_key = self._cache_key(prompt, system_message, params, use_cache, response_format)
+        cached = self._cache_get(cache_key, params)
+        if cached is not None:
+            return cached
+
+        messages = self._build_messages(prompt, system_message)
+        content = self._complete(messages, params, response_format)
+
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return content
+
+    async def acall_gpt(self, prompt, system_message=None, model=None, use_cache=True, response_format=None,
+                        temperature=None, max_tokens=None):
+        """Async variant of call_gpt using AsyncOpenAI.
         
-        messages.append({"role": "user", "content": prompt})
+        Args:
+            prompt: user prompt to send to api
+            system_message: Optional system message to set context.
+            model: the model to use (defaults to this agent's stage setting)
+            use_cache: Serve/store the completion from self.cache when one is configured.
+            response_format: Optional OpenAI response_format (e.g. a json_schema spec).
+            temperature: Sampling temperature (defaults to the stage setting).
+            max_tokens: Output token cap (defaults to the stage setting).
+
+        Returns:
+            the response from API
+        """
+        params = self._call_params(model, temperature, max_tokens)
+        cache_key = self._cache_key(prompt, system_message, params, use_cache, response_format)
+        cached = self._cache_get(cache_key, params)
+        if cached is not None:
+            return cached
+
+        messages = self._build_messages(prompt, system_message)
+        content = await self._acomplete(messages, params, response_format)
+
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return content
+
+    def call_gpt_stream(self, prompt, system_message=None, model=None, use_cache=True,
+                        temperature=None, max_tokens=None):
+        """Stream a completion, yielding text deltas as they arrive.
+        
+        The assembled text is cached like call_gpt once the stream finishes; a
+        cache hit is yielded as a single chunk. Time to first token is recorded
+        as the llm_ttft_seconds observation.
+        
+        Args:
+            prompt: user prompt to send to api
+            system_message: Optional system message to set context.
+            model: the model to use (defaults to this agent's stage setting)
+            use_cache: Serve/store the completion from self.cache when one is configured.
+            temperature: Sampling temperature (defaults to the stage setting).
+            max_tokens: Output token cap (defaults to the stage setting).
+
+        Yields:
+            str: Pieces of the response text, in order.
+        """
+        params = self._call_params(model, temperature, max_tokens)
+        cache_key = self._cache_key(prompt, system_message, params, use_cache)
+        cached = self._cache_get(cache_key, params)
+        if cached is not None:
+            yield cached
+            return
 
-        response = self.client.chat.completions.create(
-            model=model,
-            messages=messages
+        labels = {"stage": self.stage, "model": params["model"]}
+        messages = self._build_messages(prompt, system_message)
+        sent_at = time.time()
+        start = time.perf_counter()
+        # Opening the stream is retried like any call; a stream can't be hedged or resumed once it started
+        stream = self.policy.call(
+            params["model"],
+            lambda timeout: self.backend.stream(self.stage, self._request_kwargs(messages, params), timeout),
+            hedge=False
         )
 
-        return response.choices[0].message.content
\ No newline at end of file
+        parts = []
+        usage = None
+        finish_reason = None
+        try:
+            for chunk in stream:
+                # The final chunk carries usage and no choices
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        metrics.observe("llm_ttft_seconds", time.perf_counter() - start, **labels)
+                    parts.append(delta)
+                    yield delta
+        except (openai.APIError, httpx.TransportError) as e:
+            # Opening the stream was retried already; a cut-off stream can't be resumed
+            metrics.increment("llm_stream_interrupted", stage=self.stage, model=params["model"])
+            raise StreamInterruptedError(f"Stream interrupted after {len(parts)} chunks: {type(e).__name__}") from e
+        finally:
+            stream.close()
+
+        self._record_usage(params, usage, finish_reason, time.perf_counter() - start, sent_at)
+        content = "".join(parts)
+        if cache_key:
+            self.cache.set(cache_key, content)
+
+    def _validate(self, schema, content):
+        """Return (parsed model, None) or (None, error message) and count failures."""
+        try:
+            return schema.model_validate_json(content or ""), None
+        except ValueError as e:
+            metrics.increment("llm_parse_failures", agent=self.name, schema=schema.__name__)
+            return None, str(e)
+
+    def _repair_messages(self, messages, content, error):
+        return messages + [
+            {"role": "assistant", "content": content or ""},
+            {"role": "user", "content": (
+                "Your previous reply did not match the required JSON schema:\n"
+                f"{error}\n"
+                "Reply again with ONLY the corrected JSON object."
+            )}
+        ]
+
+    def _cached_structured(self, cache_key, params, schema):
+        cached = self._cache_get(cache_key, params)
+        if cached is None:
+            return None
+        parsed, _ = self._validate(schema, cached)
+        return parsed
+
+    def call_gpt_structured(self, prompt, schema, system_message=None, model=None, use_cache=True, max_repairs=None,
+                            temperature=None, max_tokens=None):
+        """Call GPT with a JSON-schema response_format and validate the reply with pydantic.
+        
+        Invalid replies are sent back to the model with the validation error for
+        up to `max_repairs` repair attempts; every invalid reply is counted in
+        metrics as llm_parse_failures.
+        
+        Args:
+            prompt: user prompt to send to api
+            schema: pydantic model class describing the expected JSON.
+            system_message: Optional system message to set context.
+            model: the model to use (defaults to this agent's stage setting)
+            use_cache: Serve/store the completion from self.cache when one is configured.
+            max_repairs: Repair attempts (defaults to STRUCTURED_OUTPUT_SETTINGS).
+            temperature: Sampling temperature (defaults to the stage setting).
+            max_tokens: Output token cap (defaults to the stage setting).
+
+        Returns:
+            An instance of `schema`.
+
+        Raises:
+            StructuredOutputError: if no valid reply was produced.
+        """
+        if max_repairs is None:
+            max_repairs = STRUCTURED_OUTPUT_SETTINGS["max_repair_attempts"]
+        response_format = response_format_for(schema)
+        params = self._call_params(model, temperature, max_tokens)
+
+        cache_key = self._cache_key(prompt, system_message, params, use_cache, response_format)
+        parsed = self._cached_structured(cache_key, params, schema)
+        if parsed is not None:
+            return parsed
+
+        messages = self._build_messages(prompt, system_message)
+        content = self._complete(messages, params, response_format)
+        parsed, error = self._validate(schema, content)
+
+        for _ in range(max_repairs):
+            if parsed is not None:
+                break
+            messages = self._repair_messages(messages, content, error)
+            content = self._complete(messages, params, response_format)
+            parsed, error = self._validate(schema, content)
+
+        if parsed is None:
+            metrics.increment("llm_structured_output_errors", agent=self.name, schema=schema.__name__)
+            raise StructuredOutputError(error, raw_response=content)
+
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return parsed
+
+    async def acall_gpt_structured(self, prompt, schema, system_message=None, model=None, use_cache=True, max_repairs=None,
+                                   temperature=None, max_tokens=None):
+        """Async variant of call_gpt_structured."""
+        if max_repairs is None:
+            max_repairs = STRUCTURED_OUTPUT_SETTINGS["max_repair_attempts"]
+        response_format = response_format_for(schema)
+        params = self._call_params(model, temperature, max_tokens)
+
+        cache_key = self._cache_key(prompt, system_message, params, use_cache, response_format)
+        parsed = self._cached_structured(cache_key, params, schema)
+        if parsed is not None:
+            return parsed
+
+        messages = self._build_messages(prompt, system_message)
+        content = await self._acomplete(messages, params, response_format)
+        parsed, error = self._validate(schema, content)
+
+        for _ in range(max_repairs):
+            if parsed is not None:
+                break
+            messages = self._repair_messages(messages, content, error)
+            content = await self._acomplete(messages, params, response_format)
+            parsed, error = self._validate(schema, content)
+
+        if parsed is None:
+            metrics.increment("llm_structured_output_errors", agent=self.name, schema=schema.__name__)
+            raise StructuredOutputError(error, raw_response=content)
+
+        if cache_key:
+            self.cache.set(cache_key, content)
+        return parsed
@@ -0,0 +1,230 @@
+import os
+import re
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import CACHE_SETTINGS
+
+_WHITESPACE = re.compile(r'\s+')
+_PUNCTUATION_SPACING = re.compile(r'\s*([^\w\s])\s*')
+
+
+def normalize_prompt(text):
+    """Collapse whitespace, spacing around punctuation and case so trivially different prompts share a cache entry."""
+    text = _WHITESPACE.sub(' ', text or '').strip().lower()
+    return _PUNCTUATION_SPACING.sub(r'\1', text)
+
+
+def make_cache_key(model, system_message, prompt, **params):
+    """Content-addressed key over model, system message, normalized prompt and call params."""
+    payload = json.dumps(
+        [model, normalize_prompt(system_message), normalize_prompt(prompt), params],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryLRU:
+    """Small thread-safe in-memory LRU tier."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, created = item
+            if ttl and time.time() - created > ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, created=None):
+        with self._lock:
+            self._data[key] = (value, created or time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteDiskCache:
+    """On-disk tier with TTL and a total size budget (least recently used goes first)."""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, "
+            "accessed REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._conn.commit()
+
+    def get(self, key, ttl=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            now = time.time()
+            if ttl and now - created > ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value, created
+
+    def set(self, key, value):
+        now = time.time()
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, size)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed ASC")
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", doomed)
+
+    def purge_expired(self, ttl):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - ttl,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LLMCache:
+    """Two-tier (memory LRU + SQLite) cache for GPT completions with hit/miss stats."""
+
+    def __init__(self, memory_entries=None, disk_path=None, ttl=None, max_disk_bytes=None):
+        """Create the cache.
+
+        Args:
+            memory_entries: Max entries in the in-memory tier.
+            disk_path: SQLite file for the disk tier, or None for memory only.
+            ttl: Seconds an entry stays valid, or None for no expiry.
+            max_disk_bytes: Size budget for the disk tier.
+        """
+        self.ttl = ttl if ttl is not None else CACHE_SETTINGS["ttl_seconds"]
+        self.memory = MemoryLRU(memory_entries or CACHE_SETTINGS["memory_entries"])
+        self.disk = None
+        if disk_path:
+            self.disk = SQLiteDiskCache(disk_path, max_disk_bytes or CACHE_SETTINGS["max_disk_bytes"])
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0}
+
+    def _count(self, *names):
+        with self._stats_lock:
+            for name in names:
+                self._stats[name] += 1
+
+    def get(self, key):
+        """Look a key up in memory, then on disk (promoting disk hits to memory).
+
+        Returns:
+            str: The cached completion, or None on a miss.
+        """
+        value = self.memory.get(key, self.ttl)
+        if value is not None:
+            self._count("hits", "memory_hits")
+            return value
+
+        if self.disk is not None:
+            row = self.disk.get(key, self.ttl)
+            if row is not None:
+                value, created = row
+                self.memory.set(key, value, created)
+                self._count("hits", "disk_hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        if value is None:
+            return
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+        self._count("sets")
+
+    def stats(self):
+        """Return hit/miss counters plus hit rate and tier sizes."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["disk_entries"] = len(self.disk) if self.disk is not None else 0
+        return stats
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Process-wide cache built from CACHE_SETTINGS, or None when caching is disabled."""
+    global _default_cache
+    if not CACHE_SETTINGS["enabled"]:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache(disk_path=CACHE_SETTINGS["disk_path"])
+        return _default_cache
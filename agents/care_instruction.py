@@ -1,11 +1,37 @@
 from .base_agent import BaseAgent
+from .prompts import CARE_SIGNATURE, system_prompt, patient_context, symptoms_context, risk_context
+from .resilience import LLMUnavailableError
+from .fallbacks import fallback_care_instructions
 from config import DENTAL_PROFESSIONAL
 
+_CHECKUP_LINK_INSTRUCTION = (
+    "IMPORTANT: If the risk level is HIGH, include the following link for the patient "
+    f"to schedule an immediate appointment: {DENTAL_PROFESSIONAL['checkuplink']}\n"
+    "Make it clear that they should use this link to book an appointment as soon as possible."
+) if 'checkuplink' in DENTAL_PROFESSIONAL else ""
+
+SYSTEM_MESSAGE = system_prompt(
+    "You are a dental professional providing post-operative care instructions. "
+    "Your advice should be clear, specific, and tailored to the patient's symptoms and risk level. "
+    "For high-risk cases, emphasize the importance of contacting the clinic immediately. "
+    "For medium-risk cases, provide specific monitoring instructions. "
+    "For low-risk cases, provide reassurance and general care advice. "
+    "Return plain text and not markdown format. "
+    "MAKE SURE TO RETURN IN PLAIN TEXT WITH NO MARKDOWN",
+    "Generate personalized care instructions for the patient based on their symptoms and risk level. "
+    "The instructions should be written directly to the patient in a clear, compassionate tone. "
+    "Include specific advice for managing their symptoms and clear guidance on when to seek professional help.",
+    _CHECKUP_LINK_INSTRUCTION,
+    f'Sign the message with "{CARE_SIGNATURE}".'
+)
+
 class CareInstructionAgent(BaseAgent):
     """Agent responsible for generating personalized care instructions based on symptoms and risk level."""
     
-    def __init__(self, name="Care Instruction Agent", api_key=None):
-        super().__init__(name, api_key)
+    stage = "care_instructions"
+
+    def __init__(self, name="Care Instruction Agent", api_key=None, cache=None):
+        super().__init__(name, api_key, cache)
     
     def process(self, patient, extracted_symptoms, risk_assessment):
         """Generate personalized care instructions based on symptoms and risk level.
@@ -18,53 +44,56 @@ class CareInstructionAgent(BaseAgent):
         Returns:
             str: Personalized care instructions.
         """
-        system_message = (
-            "You are a dental professional providing post-operative care instructions. "
-            "Your advice should be clear, specific, and tailored to the patient's symptoms and risk level. "
-            "For high-risk cases, emphasize the importance of contacting the clinic immediately. "
-            "For medium-risk cases, provide specific monitoring instructions. "
-            "For low-risk cases, provide reassurance and general care advice."
-            "Return plain text and not markdown format"
-            "MAKE SURE TO RETURN IN PLAIN TEXT WITH NO MARKDOWN"
-        )
-         
-        is_high_risk = risk_assessment.get('risk_level', '').lower() == 'high'
-        
-        checkup_link_instruction = ""
-        if is_high_risk and 'checkuplink' in DENTAL_PROFESSIONAL:
-            checkup_link_instruction = (
-                f"\n\nIMPORTANT: Since this is a HIGH RISK situation, include the following link for the patient "
-                f"to schedule an immediate appointment: {DENTAL_PROFESSIONAL['checkuplink']}\n"
-                f"Make it clear that they should use this link to book an appointment as soon as possible."
-            )
-        
-        prompt = f"""
-        Patient: {patient.name}
-        Procedure: {patient.procedure}
-        Procedure Date: {patient.procedure_date.strftime('%Y-%m-%d')}
-        Medical History: {patient.medical_history}
-        
-        Extracted Symptoms:
-        - Pain Level: {extracted_symptoms.get('pain_level', 'Not mentioned')}
-        - Bleeding: {extracted_symptoms.get('bleeding', 'Not mentioned')}
-        - Swelling: {extracted_symptoms.get('swelling', 'Not mentioned')}
-        - Fever: {extracted_symptoms.get('fever', False)}
-        - Medication Taken: {extracted_symptoms.get('medication_taken', 'None')}
-        - Other Symptoms: {', '.join(extracted_symptoms.get('other_symptoms', [])) or 'None'}
-        
-        Risk Assessment:
-        - Risk Level: {risk_assessment.get('risk_level', 'Unknown')}
-        - Justification: {risk_assessment.get('justification', 'Not provided')}
+        prompt, system_message = self.build_prompt(patient, extracted_symptoms, risk_assessment)
+        try:
+            care_instructions = self.call_gpt(prompt, system_message)
+        except LLMUnavailableError:
+            care_instructions = fallback_care_instructions(risk_assessment)
+        return self.handle_result(patient, care_instructions)
+    
+    async def aprocess(self, patient, extracted_symptoms, risk_assessment):
+        """Async variant of process() used by the triage pipeline."""
+        prompt, system_message = self.build_prompt(patient, extracted_symptoms, risk_assessment)
+        try:
+            care_instructions = await self.acall_gpt(prompt, system_message)
+        except LLMUnavailableError:
+            care_instructions = fallback_care_instructions(risk_assessment)
+        return self.handle_result(patient, care_instructions)
+    
+    def process_stream(self, patient, extracted_symptoms, risk_assessment):
+        """Streaming variant of process() for the UI.
         
-        Generate personalized care instructions for this patient based on their symptoms and risk level.
-        The instructions should be written directly to the patient in a clear, compassionate tone.
-        Include specific advice for managing their symptoms and clear guidance on when to seek professional help.{checkup_link_instruction}
+        Yields the care instructions piece by piece; once the stream is exhausted
+        the full text is stored on the patient's latest interaction.
         
-        Sign the message with "Warm regards, {DENTAL_PROFESSIONAL['name']}, {DENTAL_PROFESSIONAL['title']}".
+        If the stream can't be opened, or fails partway, the local fallback is
+        yielded and stored instead; whatever had streamed is discarded, and
+        self.stream_result holds the stored text so the UI can redraw it.
         """
-        
-        care_instructions = self.call_gpt(prompt, system_message)
-        
+        prompt, system_message = self.build_prompt(patient, extracted_symptoms, risk_assessment)
+        parts = []
+        try:
+            for delta in self.call_gpt_stream(prompt, system_message):
+                parts.append(delta)
+                yield delta
+        except LLMUnavailableError:
+            # Never store a cut-off answer with the fallback appended to it
+            streamed = bool(parts)
+            parts = [fallback_care_instructions(risk_assessment)]
+            yield ("\n\n" if streamed else "") + parts[0]
+        self.stream_result = self.handle_result(patient, "".join(parts))
+    
+    def build_prompt(self, patient, extracted_symptoms, risk_assessment):
+        """Build the (prompt, system_message) pair for care instructions."""
+        prompt = (
+            f"{patient_context(patient)}\n\n"
+            f"{symptoms_context(extracted_symptoms)}\n\n"
+            f"{risk_context(risk_assessment)}"
+        )
+        return prompt, SYSTEM_MESSAGE
+    
+    def handle_result(self, patient, care_instructions):
+        """Store the care instructions on the patient's latest interaction."""
         interaction = patient.get_latest_interaction()
         if interaction:
             interaction.care_instructions = care_instructions
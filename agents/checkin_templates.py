@@ -0,0 +1,105 @@
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+from config import DENTAL_PROFESSIONAL, CHECKIN_TEMPLATE_SETTINGS
+from .cache import LLMCache, make_cache_key
+
+# Medical-history categories that change what a check-in should ask about,
+# checked in order; the first match wins
+HISTORY_CATEGORIES = [
+    ("anticoagulant", re.compile(r"\b(warfarin|coumadin|eliquis|apixaban|xarelto|rivaroxaban|heparin|clopidogrel|plavix|blood thinners?|anticoagula\w*)\b"),
+     "takes blood thinners, so ask carefully about bleeding"),
+    ("diabetes", re.compile(r"\b(diabet\w*|insulin|metformin|type [12])\b"),
+     "has diabetes, so mention slower healing and ask about signs of infection"),
+    ("immunocompromised", re.compile(r"\b(immuno\w*|chemo\w*|transplant|hiv|steroids?|prednisone|bisphosphonate\w*)\b"),
+     "has a weakened immune response, so ask about fever and signs of infection"),
+    ("cardiac", re.compile(r"\b(heart|cardiac|hypertension|high blood pressure|valve|pacemaker|stent)\b"),
+     "has a heart condition or high blood pressure, so ask about bleeding and how they feel overall"),
+    ("smoker", re.compile(r"\b(smok\w*|tobacco|cigarettes?|vap\w*|nicotine)\b"),
+     "smokes, so mention dry socket and ask about worsening pain"),
+    ("allergy", re.compile(r"\b(allerg\w*)\b"),
+     "has allergies, so ask about any reaction to prescribed medication"),
+]
+NO_HISTORY = re.compile(r"^\s*(none|n/?a|no(ne)? (significant|known|relevant)[\w\s.,]*|nothing)?\s*\.?\s*$")
+
+# Fields filled in locally; the generated template must use these exact placeholders
+PLACEHOLDERS = ("patient_name", "first_name", "procedure_date", "days_since_procedure")
+_PLACEHOLDER = re.compile(r"\{([a-z_]+)\}")
+
+
+def history_category(medical_history):
+    """Coarse category of a free-text medical history ("none", "diabetes", ..., "other")."""
+    text = (medical_history or "").lower()
+    for category, pattern, _ in HISTORY_CATEGORIES:
+        if pattern.search(text):
+            return category
+    if NO_HISTORY.match(text) or "no significant" in text:
+        return "none"
+    return "other"
+
+
+def category_guidance(category):
+    for name, _, guidance in HISTORY_CATEGORIES:
+        if name == category:
+            return guidance
+    if category == "none":
+        return "has no significant medical history"
+    return "has a medical history worth keeping in mind, so invite them to mention anything unusual"
+
+
+def clinic_fingerprint():
+    """Hash of DENTAL_PROFESSIONAL, so editing the clinic config invalidates every template."""
+    return hashlib.sha256(json.dumps(DENTAL_PROFESSIONAL, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def template_key(procedure, category, model, prompt_text):
+    """Cache key of the template for one procedure and history category.
+
+    prompt_text is the generation prompt (system message included) with the
+    procedure left as a placeholder, so editing the check-in prompt
+    regenerates every template while "Root canal" and "root canal" share one.
+    """
+    prompt_hash = hashlib.sha256(prompt_text.encode('utf-8')).hexdigest()[:16]
+    return make_cache_key(
+        model, "checkin-template", procedure.strip().lower(),
+        category=category, clinic=clinic_fingerprint(), prompt_hash=prompt_hash
+    )
+
+
+def is_valid_template(template):
+    """A usable template greets by name and uses no placeholders we can't fill."""
+    found = set(_PLACEHOLDER.findall(template or ""))
+    return bool(found & {"patient_name", "first_name"}) and found <= set(PLACEHOLDERS)
+
+
+def fill_template(template, patient, today=None):
+    """Fill a check-in template with one patient's fields."""
+    today = today or datetime.now()
+    values = {
+        "patient_name": patient.name,
+        "first_name": patient.name.split()[0] if patient.name.strip() else patient.name,
+        "procedure_date": patient.procedure_date.strftime('%Y-%m-%d'),
+        "days_since_procedure": str(max(0, (today.date() - patient.procedure_date.date()).days)),
+    }
+    # Plain replacement rather than str.format so stray braces in the text are harmless
+    return _PLACEHOLDER.sub(lambda match: values.get(match.group(1), match.group(0)), template)
+
+
+_template_cache = None
+_template_cache_lock = threading.Lock()
+
+
+def get_template_cache():
+    """Process-wide template store built from CHECKIN_TEMPLATE_SETTINGS."""
+    global _template_cache
+    with _template_cache_lock:
+        if _template_cache is None:
+            _template_cache = LLMCache(
+                memory_entries=CHECKIN_TEMPLATE_SETTINGS["memory_entries"],
+                disk_path=CHECKIN_TEMPLATE_SETTINGS["disk_path"],
+                ttl=CHECKIN_TEMPLATE_SETTINGS["ttl_seconds"]
+            )
+        return _template_cache
@@ -0,0 +1,133 @@
+# Process-wide registry of pooled OpenAI clients shared by every agent.
+# All agents talk to the API through one httpx connection pool (keep-alive, HTTP/2
+# when the h2 package is installed). Tests can swap the network out with
+# set_transport(httpx.MockTransport(handler)).
+import asyncio
+import importlib.util
+import threading
+
+import httpx
+import openai
+
+from config import CLIENT_SETTINGS
+
+_lock = threading.Lock()
+_settings = dict(CLIENT_SETTINGS)
+_transport = None
+
+_http_client = None
+_clients = {}
+# Async clients are bound to the event loop they were created on
+_async_http_clients = {}
+_async_clients = {}
+
+
+def _http2_enabled():
+    if _settings["http2"] is None:
+        return importlib.util.find_spec("h2") is not None
+    return _settings["http2"]
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=_settings["max_connections"],
+        max_keepalive_connections=_settings["max_keepalive_connections"],
+        keepalive_expiry=_settings["keepalive_expiry"]
+    )
+
+
+def _timeout():
+    return httpx.Timeout(_settings["timeout"], connect=_settings["connect_timeout"])
+
+
+def _new_http_client():
+    if _transport is not None:
+        return httpx.Client(transport=_transport, timeout=_timeout())
+    return httpx.Client(http2=_http2_enabled(), limits=_limits(), timeout=_timeout())
+
+
+def _new_async_http_client():
+    if _transport is not None:
+        return httpx.AsyncClient(transport=_transport, timeout=_timeout())
+    return httpx.AsyncClient(http2=_http2_enabled(), limits=_limits(), timeout=_timeout())
+
+
+def configure(**settings):
+    """Override pool settings (see CLIENT_SETTINGS) and drop existing clients.
+
+    Args:
+        **settings: Any of max_connections, max_keepalive_connections,
+            keepalive_expiry, timeout, connect_timeout, http2, max_retries.
+    """
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError(f"Unknown client settings: {', '.join(sorted(unknown))}")
+    with _lock:
+        _settings.update(settings)
+    reset()
+
+
+def set_transport(transport):
+    """Route every client through a custom httpx transport (e.g. httpx.MockTransport).
+
+    Args:
+        transport: The transport to use, or None to go back to the network.
+    """
+    global _transport
+    with _lock:
+        _transport = transport
+    reset()
+
+
+def get_client(api_key):
+    """Get the shared synchronous OpenAI client for an API key."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = _new_http_client()
+        client = _clients.get(api_key)
+        if client is None:
+            client = openai.OpenAI(api_key=api_key, http_client=_http_client, max_retries=_settings["max_retries"])
+            _clients[api_key] = client
+        return client
+
+
+def get_async_client(api_key):
+    """Get the AsyncOpenAI client for an API key on the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        http_client = _async_http_clients.get(loop)
+        if http_client is None:
+            http_client = _new_async_http_client()
+            _async_http_clients[loop] = http_client
+        key = (loop, api_key)
+        client = _async_clients.get(key)
+        if client is None:
+            client = openai.AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=_settings["max_retries"])
+            _async_clients[key] = client
+        return client
+
+
+async def aclose_async_clients():
+    """Close the async pool of the running loop; call before the loop shuts down."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        http_client = _async_http_clients.pop(loop, None)
+        for key in [key for key in _async_clients if key[0] is loop]:
+            del _async_clients[key]
+    if http_client is not None:
+        await http_client.aclose()
+
+
+def reset():
+    """Close the shared synchronous pool and forget every cached client."""
+    global _http_client
+    with _lock:
+        http_client = _http_client
+        _http_client = None
+        _clients.clear()
+        # Async pools can only be closed from their own loop; just let them go
+        _async_http_clients.clear()
+        _async_clients.clear()
+    if http_client is not None:
+        http_client.close()
@@ -0,0 +1,99 @@
+"""Local stand-ins for each agent's output when the API is unavailable.
+
+Used when a call raises LLMUnavailableError (deadline passed, retries
+exhausted or circuit open), so a degraded API slows nothing down and never
+aborts a batch. The results are deliberately conservative: risk is never
+assessed below Medium without the model, and every text tells the patient how
+to reach the clinic. Results are marked with a "fallback" decision path so
+the clinic can see which patients were handled without the model.
+"""
+from .checkin_templates import fill_template
+from .prompts import CARE_SIGNATURE, CHECKIN_SIGNATURE
+from config import DENTAL_PROFESSIONAL
+
+FALLBACK_PATH = "fallback"
+
+CHECKIN_TEMPLATE = (
+    "Hi {first_name}, this is " + DENTAL_PROFESSIONAL['clinic_name'] + " checking in after your procedure on "
+    "{procedure_date}. How are you feeling? Please let us know about any pain (on a scale of 0-10), bleeding, "
+    "swelling, fever or anything else that worries you.\n\n"
+    + CHECKIN_SIGNATURE + ", " + DENTAL_PROFESSIONAL['clinic_name']
+)
+
+_CONTACT = (
+    f"If anything gets worse or you are worried, call us at {DENTAL_PROFESSIONAL.get('phone', 'the clinic')}."
+)
+
+CARE_INSTRUCTIONS = {
+    "High": (
+        "Thank you for your reply. Based on what you described, we would like to see you as soon as possible. "
+        "Please contact the clinic right away"
+        + (f" or book an immediate appointment here: {DENTAL_PROFESSIONAL['checkuplink']}"
+           if 'checkuplink' in DENTAL_PROFESSIONAL else "")
+        + ". If you have heavy bleeding that does not stop with firm pressure, trouble breathing or swallowing, "
+        "or swelling that is spreading quickly, go to the nearest emergency department."
+    ),
+    "Medium": (
+        "Thank you for your reply. A member of our team will review your message shortly. In the meantime, "
+        "rest, take your pain medication as prescribed, apply a cold compress for 20 minutes at a time for "
+        "swelling, and bite gently on gauze if there is bleeding. Avoid smoking, straws and hot or hard foods. "
+        + _CONTACT
+    ),
+    "Low": (
+        "Thank you for your reply. What you describe sounds like normal healing. Keep taking your medication as "
+        "prescribed, stick to soft foods, rinse gently with warm salt water after meals from the day after your "
+        "procedure, and avoid smoking and straws. " + _CONTACT
+    ),
+}
+
+
+def fallback_checkin(patient):
+    """Generic check-in message for the patient."""
+    return fill_template(CHECKIN_TEMPLATE, patient)
+
+
+def fallback_risk(extracted_symptoms):
+    """Conservative risk assessment for symptoms the rules engine didn't decide."""
+    symptoms = extracted_symptoms or {}
+    try:
+        pain_level = int(symptoms.get("pain_level") or 0)
+    except (TypeError, ValueError):
+        pain_level = 0
+    severe = "severe" in (str(symptoms.get("bleeding")).lower(), str(symptoms.get("swelling")).lower())
+    if symptoms.get("fever") is True or severe or pain_level >= 7:
+        risk_level = "High"
+        reason = "fever, severe bleeding or swelling, or pain of 7/10 or more was reported"
+    else:
+        risk_level = "Medium"
+        reason = "nothing alarming was reported, but the reply could not be reviewed by the model"
+    return {
+        "risk_level": risk_level,
+        "justification": f"Automated assessment unavailable; rated {risk_level} because {reason}. "
+                         "Please review manually.",
+        "decision_path": FALLBACK_PATH
+    }
+
+
+def fallback_care_instructions(risk_assessment):
+    """Standard care instructions for the assessed risk level."""
+    risk_level = (risk_assessment or {}).get("risk_level")
+    text = CARE_INSTRUCTIONS.get(risk_level, CARE_INSTRUCTIONS["Medium"])
+    return f"{text}\n\n{CARE_SIGNATURE}"
+
+
+def fallback_summary(patient, extracted_symptoms, risk_assessment, care_instructions):
+    """Structured clinical summary assembled from the triage fields."""
+    symptoms = extracted_symptoms or {}
+    other = ", ".join(symptoms.get("other_symptoms") or []) or "none"
+    return (
+        f"Follow-up summary for {patient.name} ({patient.procedure}, {patient.procedure_date.strftime('%Y-%m-%d')})\n"
+        "Generated without the AI model; please review.\n\n"
+        f"Symptoms: pain {symptoms.get('pain_level', 'not mentioned')}/10, "
+        f"bleeding {symptoms.get('bleeding', 'not mentioned')}, swelling {symptoms.get('swelling', 'not mentioned')}, "
+        f"fever {'yes' if symptoms.get('fever') else 'no'}, medication {symptoms.get('medication_taken', 'none')}, "
+        f"other {other}.\n"
+        f"Assessment: {(risk_assessment or {}).get('risk_level', 'Unknown')} risk. "
+        f"{(risk_assessment or {}).get('justification', '')}\n"
+        f"Care provided: {care_instructions}\n"
+        "Follow-up: clinician to review this patient's reply."
+    )
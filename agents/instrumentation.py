@@ -0,0 +1,369 @@
+"""Per-call records of every LLM request, and their Prometheus export.
+
+Each completion the agents make becomes a CallRecord: wall time, time spent
+queued before the request was sent, prompt/cached/completion tokens, model and
+estimated cost, tagged with the agent and whatever call_context() the caller
+set (patient_id, run_id). The most recent records are kept in memory for the
+dashboard and, when INSTRUMENTATION_SETTINGS has a call_log_path, appended to a
+SQLite CallLog so the webhook server can export what the triage workers spent
+as Prometheus text. Both are bounded: the memory buffer to recent_calls records
+and the log to call_log_max_rows rows (its running totals keep counting).
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from config import INSTRUMENTATION_SETTINGS
+
+_context = contextvars.ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def call_context(**tags):
+    """Tag the LLM calls made inside the block, e.g. call_context(patient_id=..., run_id=...).
+
+    Contexts nest (inner tags win) and follow asyncio tasks. A `queued_at`
+    epoch timestamp marks when the work was requested: the next call made in
+    the block reports the time from then until its request went out as queue
+    time.
+    """
+    token = _context.set({**_context.get(), **tags})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def set_call_context(**tags):
+    """Like call_context() for the rest of the current thread or task (e.g. a Streamlit rerun)."""
+    _context.set({**_context.get(), **tags})
+
+
+def current_call_context():
+    return _context.get()
+
+
+def take_queue_time(sent_at):
+    """Seconds between the context's queued_at and `sent_at`, consuming queued_at (0.0 if unset)."""
+    tags = _context.get()
+    queued_at = tags.get("queued_at")
+    if queued_at is None:
+        return 0.0
+    # Repair or follow-up calls in the same block weren't queued
+    _context.set({**tags, "queued_at": None})
+    return max(0.0, sent_at - queued_at)
+
+
+def new_run_id():
+    return datetime.now().strftime("%Y%m%d-%H%M%S-") + secrets.token_hex(3)
+
+
+@dataclass(slots=True)
+class CallRecord:
+    """One completed LLM request."""
+    timestamp: float
+    agent: str
+    stage: str
+    model: str
+    wall_time: float
+    queue_time: float = 0.0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    finish_reason: Optional[str] = None
+    patient_id: Optional[str] = None
+    run_id: Optional[str] = None
+
+
+RECORD_FIELDS = tuple(CallRecord.__dataclass_fields__)
+
+# Totals kept per (agent, stage, model) in the call log and exported as counters
+TOTAL_FIELDS = ("calls", "prompt_tokens", "cached_tokens", "completion_tokens", "cost_usd", "wall_time", "queue_time")
+
+
+class CallLog:
+    """SQLite log of CallRecords shared by every process that makes LLM calls.
+
+    Besides the per-call rows it maintains running totals and latency-histogram
+    buckets per (agent, stage, model), so a Prometheus scrape is a read of a
+    few rows however many calls have been logged. Only the newest max_rows
+    per-call rows are kept; older ones are pruned every PRUNE_EVERY appends.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path, buckets=None, max_rows=None):
+        self.path = path
+        self.buckets = tuple(sorted(buckets or INSTRUMENTATION_SETTINGS["latency_buckets"]))
+        self.max_rows = max_rows or INSTRUMENTATION_SETTINGS["call_log_max_rows"]
+        self._appends = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_calls ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "timestamp REAL NOT NULL, "
+            "agent TEXT NOT NULL, "
+            "stage TEXT NOT NULL, "
+            "model TEXT NOT NULL, "
+            "wall_time REAL NOT NULL, "
+            "queue_time REAL NOT NULL, "
+            "prompt_tokens INTEGER NOT NULL, "
+            "cached_tokens INTEGER NOT NULL, "
+            "completion_tokens INTEGER NOT NULL, "
+            "cost_usd REAL NOT NULL, "
+            "finish_reason TEXT, "
+            "patient_id TEXT, "
+            "run_id TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_calls_run ON llm_calls (run_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_call_totals ("
+            "agent TEXT NOT NULL, stage TEXT NOT NULL, model TEXT NOT NULL, "
+            + ", ".join(f"{name} REAL NOT NULL DEFAULT 0" for name in TOTAL_FIELDS) + ", "
+            "PRIMARY KEY (agent, stage, model))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_call_buckets ("
+            "agent TEXT NOT NULL, stage TEXT NOT NULL, model TEXT NOT NULL, le REAL NOT NULL, "
+            "count INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (agent, stage, model, le))"
+        )
+
+    def append(self, record):
+        key = (record.agent, record.stage, record.model)
+        totals = (1, record.prompt_tokens, record.cached_tokens, record.completion_tokens,
+                  record.cost_usd, record.wall_time, record.queue_time)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    f"INSERT INTO llm_calls ({', '.join(RECORD_FIELDS)}) "
+                    f"VALUES ({', '.join('?' * len(RECORD_FIELDS))})",
+                    tuple(getattr(record, name) for name in RECORD_FIELDS)
+                )
+                self._conn.execute(
+                    f"INSERT INTO llm_call_totals (agent, stage, model, {', '.join(TOTAL_FIELDS)}) "
+                    f"VALUES (?, ?, ?, {', '.join('?' * len(TOTAL_FIELDS))}) "
+                    "ON CONFLICT (agent, stage, model) DO UPDATE SET "
+                    + ", ".join(f"{name} = {name} + excluded.{name}" for name in TOTAL_FIELDS),
+                    key + totals
+                )
+                # Cumulative buckets, as Prometheus histograms expect
+                self._conn.executemany(
+                    "INSERT INTO llm_call_buckets (agent, stage, model, le, count) VALUES (?, ?, ?, ?, 1) "
+                    "ON CONFLICT (agent, stage, model, le) DO UPDATE SET count = count + 1",
+                    [key + (le,) for le in self.buckets if record.wall_time <= le]
+                )
+                self._appends += 1
+                if self._appends % self.PRUNE_EVERY == 1:
+                    # Totals and buckets above already include the pruned calls
+                    self._conn.execute(
+                        "DELETE FROM llm_calls WHERE id <= (SELECT MAX(id) FROM llm_calls) - ?", (self.max_rows,)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def records(self, run_id=None, since=None, limit=1000):
+        """Logged calls, newest first, optionally for one run or after an epoch timestamp."""
+        clauses, params = [], []
+        if run_id is not None:
+            clauses.append("run_id = ?")
+            params.append(run_id)
+        if since is not None:
+            clauses.append("timestamp > ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(RECORD_FIELDS)} FROM llm_calls {where}ORDER BY id DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [CallRecord(**dict(row)) for row in rows]
+
+    def totals(self):
+        """Running totals as a list of dicts with agent, stage, model, the TOTAL_FIELDS and `buckets` {le: count}."""
+        with self._lock:
+            totals = [dict(row) for row in self._conn.execute("SELECT * FROM llm_call_totals ORDER BY agent, model")]
+            buckets = self._conn.execute("SELECT * FROM llm_call_buckets").fetchall()
+        by_key = {(row["agent"], row["stage"], row["model"]): row for row in totals}
+        for row in totals:
+            row["buckets"] = dict.fromkeys(self.buckets, 0)
+        for bucket in buckets:
+            row = by_key.get((bucket["agent"], bucket["stage"], bucket["model"]))
+            if row is not None:
+                row["buckets"][bucket["le"]] = bucket["count"]
+        return totals
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CallRecorder:
+    """Recent CallRecords in memory, plus the optional shared CallLog."""
+
+    def __init__(self, max_records=None, call_log=None):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=max_records or INSTRUMENTATION_SETTINGS["recent_calls"])
+        self.call_log = call_log
+
+    def record(self, record):
+        with self._lock:
+            self._records.append(record)
+        if self.call_log is not None:
+            try:
+                self.call_log.append(record)
+            except sqlite3.Error:
+                # Losing a metrics row must never fail the patient's triage
+                pass
+
+    def recent(self, run_id=None, patient_id=None):
+        """In-memory records of this process, oldest first."""
+        with self._lock:
+            records = list(self._records)
+        return [
+            record for record in records
+            if (run_id is None or record.run_id == run_id) and (patient_id is None or record.patient_id == patient_id)
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_call_recorder():
+    """Process-wide CallRecorder, logging to INSTRUMENTATION_SETTINGS["call_log_path"] when set."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            path = INSTRUMENTATION_SETTINGS["call_log_path"]
+            _recorder = CallRecorder(call_log=CallLog(path) if path else None)
+        return _recorder
+
+
+def run_table(records):
+    """Rows for a per-run table: one per call plus a final "Total" row."""
+    rows = [
+        {
+            "Time": datetime.fromtimestamp(record.timestamp).strftime("%H:%M:%S"),
+            "Agent": record.agent,
+            "Patient": record.patient_id or "",
+            "Model": record.model,
+            "Wall (s)": round(record.wall_time, 2),
+            "Queued (s)": round(record.queue_time, 2),
+            "Tokens in": record.prompt_tokens,
+            "Cached in": record.cached_tokens,
+            "Tokens out": record.completion_tokens,
+            "Cost ($)": round(record.cost_usd, 5)
+        }
+        for record in records
+    ]
+    if rows:
+        rows.append({
+            "Time": "", "Agent": "Total", "Patient": "", "Model": "",
+            "Wall (s)": round(sum(record.wall_time for record in records), 2),
+            "Queued (s)": round(sum(record.queue_time for record in records), 2),
+            "Tokens in": sum(record.prompt_tokens for record in records),
+            "Cached in": sum(record.cached_tokens for record in records),
+            "Tokens out": sum(record.completion_tokens for record in records),
+            "Cost ($)": round(sum(record.cost_usd for record in records), 5)
+        })
+    return rows
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+# Registry metrics the call log already covers across processes
+_LOGGED_METRICS = {"llm_calls", "llm_prompt_tokens", "llm_cached_tokens", "llm_completion_tokens", "llm_cost_usd",
+                   "llm_latency_seconds", "llm_queue_seconds"}
+
+
+def prometheus_text(registry=None, call_log=None, prefix="followcare_"):
+    """Prometheus text exposition (format 0.0.4) of the metrics registry and the call log.
+
+    LLM call counters and the latency histogram come from the call log when one
+    is given, so they include every worker process. Patient and run ids are
+    left out: they would give every patient its own time series.
+    """
+    from .metrics import metrics
+    registry = registry or metrics
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        if not samples:
+            return
+        lines.append(f"# HELP {prefix}{name} {help_text}")
+        lines.append(f"# TYPE {prefix}{name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{prefix}{name}{suffix}{_labels(labels)} {value:.10g}")
+
+    skip = _LOGGED_METRICS if call_log is not None else set()
+    counters = {}
+    for name, labels, value in registry.counters():
+        if name not in skip:
+            counters.setdefault(name, []).append(("", labels, value))
+    for name, samples in sorted(counters.items()):
+        family(f"{name}_total", "counter", f"{name} counter.", samples)
+
+    for name, labels, summary in sorted(registry.summaries(), key=lambda item: item[0]):
+        if name in skip:
+            continue
+        family(name, "summary", f"Recent {name} observations.", [
+            ("", dict(labels, quantile="0.5"), summary["p50"]),
+            ("", dict(labels, quantile="0.95"), summary["p95"]),
+            ("_count", labels, summary["count"])
+        ])
+
+    if call_log is not None:
+        totals = call_log.totals()
+        help_texts = {
+            "calls": "LLM requests completed.",
+            "prompt_tokens": "Prompt tokens sent.",
+            "cached_tokens": "Prompt tokens served from the provider's prompt cache.",
+            "completion_tokens": "Completion tokens received.",
+            "cost_usd": "Estimated spend in USD.",
+            "queue_time": "Seconds calls spent queued before their request was sent."
+        }
+        for name, help_text in help_texts.items():
+            metric = "llm_queue_seconds" if name == "queue_time" else f"llm_{name}"
+            family(f"{metric}_total", "counter", help_text, [
+                ("", {key: row[key] for key in ("agent", "stage", "model")}, row[name]) for row in totals
+            ])
+
+        histogram = []
+        for row in totals:
+            labels = {key: row[key] for key in ("agent", "stage", "model")}
+            histogram.extend(("_bucket", dict(labels, le=f"{le:g}"), count) for le, count in row["buckets"].items())
+            histogram.append(("_bucket", dict(labels, le="+Inf"), row["calls"]))
+            histogram.append(("_sum", labels, row["wall_time"]))
+            histogram.append(("_count", labels, row["calls"]))
+        family("llm_request_duration_seconds", "histogram", "Wall time of LLM requests.", histogram)
+
+    return "\n".join(lines) + "\n"
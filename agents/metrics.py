@@ -0,0 +1,105 @@
+import threading
+from collections import defaultdict, deque
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _percentile(ordered, pct):
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Metrics:
+    """Minimal thread-safe counters and observations, keyed by metric name and label set."""
+
+    def __init__(self, max_samples=1000):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        # Recent samples per observation, enough for p50/p95 without unbounded growth
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+
+    def increment(self, name, value=1, **labels):
+        """Add `value` to the counter `name` for the given labels (e.g. agent="Summary Agent")."""
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name, value, **labels):
+        """Record one sample (e.g. a latency in seconds) for `name`."""
+        with self._lock:
+            self._samples[(name, _label_key(labels))].append(value)
+
+    def get(self, name, **labels):
+        """Current value of one counter (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def counters(self):
+        """Snapshot as a list of (name, labels dict, value)."""
+        with self._lock:
+            return [(name, dict(labels), value) for (name, labels), value in self._counters.items()]
+
+    def summaries(self):
+        """Snapshot of observations as a list of (name, labels dict, {count, mean, p50, p95, max})."""
+        with self._lock:
+            samples = [(name, dict(labels), sorted(values)) for (name, labels), values in self._samples.items()]
+        return [
+            (name, labels, {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": _percentile(values, 50),
+                "p95": _percentile(values, 95),
+                "max": values[-1]
+            })
+            for name, labels, values in samples if values
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+
+
+# Process-wide instance shared by all agents
+metrics = Metrics()
+
+
+def stage_report(registry=None):
+    """Per-stage/model LLM usage: calls, cache hits, tokens (and prompt-cached tokens), estimated cost, latency and time to first token.
+
+    Returns:
+        list: One dict per (stage, model), sorted by estimated cost (highest first).
+    """
+    registry = registry or metrics
+    rows = {}
+
+    def row(labels):
+        key = (labels.get("stage"), labels.get("model"))
+        return rows.setdefault(key, {
+            "stage": key[0], "model": key[1], "calls": 0, "cache_hits": 0,
+            "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+            "latency_p50": None, "latency_p95": None, "ttft_p50": None
+        })
+
+    fields = {
+        "llm_calls": "calls",
+        "llm_cache_hits": "cache_hits",
+        "llm_prompt_tokens": "prompt_tokens",
+        "llm_cached_tokens": "cached_tokens",
+        "llm_completion_tokens": "completion_tokens",
+        "llm_cost_usd": "cost_usd"
+    }
+    for name, labels, value in registry.counters():
+        if name in fields and "stage" in labels:
+            row(labels)[fields[name]] += value
+
+    for name, labels, summary in registry.summaries():
+        if name == "llm_latency_seconds" and "stage" in labels:
+            entry = row(labels)
+            entry["latency_p50"] = summary["p50"]
+            entry["latency_p95"] = summary["p95"]
+        elif name == "llm_ttft_seconds" and "stage" in labels:
+            row(labels)["ttft_p50"] = summary["p50"]
+
+    return sorted(rows.values(), key=lambda entry: entry["cost_usd"], reverse=True)
@@ -0,0 +1,62 @@
+import os
+
+from config import AI_SETTINGS, MODEL_PRICING
+
+
+def _env(stage, name):
+    value = os.getenv(f"AI_{stage.upper()}_{name}")
+    return value if value not in (None, "") else None
+
+
+def stage_settings(stage):
+    """Resolve the model, temperature and max_tokens for a stage.
+
+    Looks up AI_SETTINGS (e.g. "summary_model", max_tokens["summary"]) and lets
+    AI_<STAGE>_MODEL / AI_<STAGE>_TEMPERATURE / AI_<STAGE>_MAX_TOKENS environment
+    variables override each value.
+
+    Args:
+        stage: Stage name such as "symptom_analysis" or "summary"; None uses the defaults.
+
+    Returns:
+        dict: {"model", "temperature", "max_tokens"}; max_tokens may be None (no cap).
+    """
+    stage = stage or "default"
+
+    model = AI_SETTINGS.get(f"{stage}_model") or AI_SETTINGS.get("default_model", "gpt-4o-mini")
+
+    temperature = AI_SETTINGS.get("temperature")
+    if isinstance(temperature, dict):
+        temperature = temperature.get(stage, temperature.get("default"))
+
+    max_tokens = AI_SETTINGS.get("max_tokens", {}).get(stage)
+
+    if _env(stage, "MODEL"):
+        model = _env(stage, "MODEL")
+    if _env(stage, "TEMPERATURE"):
+        temperature = float(_env(stage, "TEMPERATURE"))
+    if _env(stage, "MAX_TOKENS"):
+        max_tokens = int(_env(stage, "MAX_TOKENS"))
+
+    return {"model": model, "temperature": temperature, "max_tokens": max_tokens}
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """Estimated USD cost of one call from MODEL_PRICING (0.0 for unknown models).
+
+    cached_tokens is the part of prompt_tokens read from the provider's prompt
+    cache, priced at the model's "cached_input" rate when it has one.
+    """
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        # Dated snapshots ("gpt-4o-mini-2024-07-18") are priced like their base model
+        matches = [name for name in MODEL_PRICING if model.startswith(name + "-")]
+        if not matches:
+            return 0.0
+        pricing = MODEL_PRICING[max(matches, key=len)]
+    cached_rate = pricing.get("cached_input", pricing["input"])
+    return (
+        (prompt_tokens - cached_tokens) * pricing["input"]
+        + cached_tokens * cached_rate
+        + completion_tokens * pricing["output"]
+    ) / 1_000_000
@@ -0,0 +1,253 @@
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from config import PIPELINE_SETTINGS
+from .clients import aclose_async_clients
+from .instrumentation import call_context, set_call_context
+from .response_analyzer import ResponseAnalyzerAgent
+from .risk_assessment import RiskAssessmentAgent
+from .care_instruction import CareInstructionAgent
+from .summary import SummaryAgent
+from .triage import TriageAgent
+
+# Stage names match the keys of AI_SETTINGS["max_tokens"]
+STAGES = ("symptom_analysis", "risk_assessment", "care_instructions", "summary")
+MODES = ("chain", "combined")
+
+
+@dataclass
+class TriageJob:
+    """One patient reply waiting to go through the triage chain."""
+    patient: object
+    response_text: str
+    phone_number: Optional[str] = None
+    # Epoch time the reply was queued (e.g. by the triage queue); defaults to when the pipeline got it
+    queued_at: Optional[float] = None
+
+
+@dataclass
+class TriageResult:
+    """Outcome of running one TriageJob through the pipeline."""
+    job: TriageJob
+    extracted_symptoms: Dict[str, any] = field(default_factory=dict)
+    risk_assessment: Dict[str, any] = field(default_factory=dict)
+    care_instructions: str = ""
+    summary: str = ""
+    error: Optional[str] = None
+    duration: float = 0.0
+    stage_durations: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class RateLimiter:
+    """Async token bucket allowing `rate` acquisitions per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TriagePipeline:
+    """Runs ResponseAnalyzer -> RiskAssessment -> CareInstruction -> Summary for many patients at once.
+
+    Patients are processed concurrently (bounded by `concurrency`); within one
+    patient the stages still run in order since each depends on the previous one.
+    Each stage can additionally be capped to a number of calls per second. In
+    "combined" mode the four stages collapse into a single TriageAgent call.
+    """
+
+    def __init__(self, api_key=None, concurrency=None, stage_rate_limits=None, mode=None):
+        """Create the pipeline and its agents.
+
+        Args:
+            api_key: OpenAI API key (defaults to OPENAI_API_KEY).
+            concurrency: Max patients in flight (defaults to PIPELINE_SETTINGS).
+            stage_rate_limits: Dict of stage name -> calls per second; None disables a limit.
+            mode: "chain" or "combined" (defaults to PIPELINE_SETTINGS["mode"]).
+        """
+        self.mode = mode or PIPELINE_SETTINGS["mode"]
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown triage mode '{self.mode}'. Options: {', '.join(MODES)}")
+        self.concurrency = concurrency or PIPELINE_SETTINGS["concurrency"]
+        self.stage_rate_limits = dict(PIPELINE_SETTINGS["stage_rate_limits"])
+        if stage_rate_limits:
+            self.stage_rate_limits.update(stage_rate_limits)
+
+        self.response_analyzer = ResponseAnalyzerAgent(api_key=api_key)
+        self.risk_assessment_agent = RiskAssessmentAgent(api_key=api_key)
+        self.care_instruction_agent = CareInstructionAgent(api_key=api_key)
+        self.summary_agent = SummaryAgent(api_key=api_key)
+        self.triage_agent = TriageAgent(api_key=api_key)
+
+    async def _run_stage(self, limiters, stage, result, coro_factory):
+        if result.stage_durations:
+            # Later stages are only queued behind their rate limiter
+            set_call_context(queued_at=time.time())
+        limiter = limiters.get(stage)
+        if limiter:
+            await limiter.acquire()
+        start = time.perf_counter()
+        value = await coro_factory()
+        result.stage_durations[stage] = time.perf_counter() - start
+        return value
+
+    async def _process(self, job, semaphore, limiters):
+        result = TriageResult(job=job)
+        start = time.perf_counter()
+
+        # Each job runs in its own task, so its calls are tagged with its own patient
+        with call_context(patient_id=job.patient.id, queued_at=job.queued_at or time.time()):
+            async with semaphore:
+                try:
+                    if self.mode == "combined":
+                        await self._process_combined(job, result, limiters)
+                    else:
+                        await self._process_chain(job, result, limiters)
+                except Exception as e:
+                    result.error = f"{type(e).__name__}: {e}"
+
+        result.duration = time.perf_counter() - start
+        return result
+
+    async def _process_combined(self, job, result, limiters):
+        triage = await self._run_stage(
+            limiters, "triage", result,
+            lambda: self.triage_agent.aprocess(job.patient, job.response_text)
+        )
+        result.extracted_symptoms = triage["extracted_symptoms"]
+        result.risk_assessment = triage["risk_assessment"]
+        result.care_instructions = triage["care_instructions"]
+        result.summary = triage["summary"]
+        if "error" in result.extracted_symptoms:
+            result.error = "Triage output failed schema validation"
+
+    async def _process_chain(self, job, result, limiters):
+        patient = job.patient
+
+        result.extracted_symptoms = await self._run_stage(
+            limiters, "symptom_analysis", result,
+            lambda: self.response_analyzer.aprocess(patient, job.response_text)
+        )
+        if "error" in result.extracted_symptoms:
+            # Don't spend three more calls on an unparseable extraction
+            result.error = "Symptom extraction failed schema validation"
+            return
+
+        try:
+            result.risk_assessment = await self._run_stage(
+                limiters, "risk_assessment", result,
+                lambda: self.risk_assessment_agent.aprocess(patient, result.extracted_symptoms)
+            )
+        except Exception as e:
+            # Keep going with a fallback so the clinic still gets instructions and a summary
+            result.risk_assessment = {
+                "risk_level": "Unknown",
+                "justification": f"Error during analysis: {str(e)}"
+            }
+
+        result.care_instructions = await self._run_stage(
+            limiters, "care_instructions", result,
+            lambda: self.care_instruction_agent.aprocess(
+                patient, result.extracted_symptoms, result.risk_assessment
+            )
+        )
+
+        result.summary = await self._run_stage(
+            limiters, "summary", result,
+            lambda: self.summary_agent.aprocess(
+                patient, result.extracted_symptoms, result.risk_assessment, result.care_instructions
+            )
+        )
+
+    async def stream(self, jobs):
+        """Process jobs concurrently, yielding each TriageResult as soon as it finishes.
+
+        Args:
+            jobs: Iterable of TriageJob.
+
+        Yields:
+            TriageResult: In completion order, not submission order.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiters = {
+            stage: RateLimiter(rate)
+            for stage, rate in self.stage_rate_limits.items() if rate
+        }
+
+        tasks = [asyncio.ensure_future(self._process(job, semaphore, limiters)) for job in jobs]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Wait for the cancellations to land, so no job is still running (or holding
+            # a semaphore slot or a pooled connection) once the caller moves on
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run_async(self, jobs):
+        """Process all jobs and return the results in completion order."""
+        return [result async for result in self.stream(jobs)]
+
+    async def _run_owned_loop(self, coro):
+        # The pooled async clients belong to this loop; close them before it shuts down
+        try:
+            return await coro
+        finally:
+            await aclose_async_clients()
+
+    def run(self, jobs):
+        """Blocking wrapper around run_async for synchronous callers."""
+        return asyncio.run(self._run_owned_loop(self.run_async(jobs)))
+
+    def iter_results(self, jobs):
+        """Synchronous generator over results as they finish (e.g. for Streamlit).
+
+        The event loop runs on a background thread so the caller can render each
+        result while the remaining patients are still being processed.
+        """
+        results = queue.Queue()
+        done = object()
+
+        async def drain():
+            try:
+                async for result in self.stream(jobs):
+                    results.put(result)
+            finally:
+                results.put(done)
+
+        # Carry the caller's call_context() (e.g. its run_id) over to the loop's thread
+        worker = threading.Thread(
+            target=contextvars.copy_context().run, args=(asyncio.run, self._run_owned_loop(drain())), daemon=True
+        )
+        worker.start()
+
+        while True:
+            item = results.get()
+            if item is done:
+                break
+            yield item
+
+        worker.join()
@@ -0,0 +1,68 @@
+"""Shared pieces of the agents' prompts.
+
+Providers cache the longest prompt prefix they have seen recently, so every
+agent puts what never changes between patients (instructions, examples,
+clinic details, output format) in its system message, built once at import,
+and sends only the patient's own details in the user message after it.
+Nothing per-patient or date-dependent may go into a system message.
+"""
+from config import DENTAL_PROFESSIONAL
+
+CLINIC_CONTEXT = (
+    f"Clinic: {DENTAL_PROFESSIONAL['clinic_name']}\n"
+    f"Dentist: {DENTAL_PROFESSIONAL['name']}, {DENTAL_PROFESSIONAL['title']}\n"
+    f"Phone: {DENTAL_PROFESSIONAL.get('phone', 'not provided')}\n"
+    f"Email: {DENTAL_PROFESSIONAL.get('email', 'not provided')}\n"
+    f"Appointment booking link: {DENTAL_PROFESSIONAL.get('checkuplink', 'not provided')}"
+)
+
+# Sign-offs the agents are asked to use
+CARE_SIGNATURE = f"Warm regards, {DENTAL_PROFESSIONAL['name']}, {DENTAL_PROFESSIONAL['title']}"
+CHECKIN_SIGNATURE = f"Best regards, {DENTAL_PROFESSIONAL['name']}, {DENTAL_PROFESSIONAL['title']}"
+
+
+def system_prompt(*sections):
+    """Join static prompt sections, always ending with the clinic details."""
+    sections += (f"CLINIC DETAILS:\n{CLINIC_CONTEXT}",)
+    return "\n\n".join(section.strip() for section in sections if section.strip())
+
+
+def patient_context(patient):
+    """The patient's details, in the same order for every agent."""
+    return (
+        f"Patient: {patient.name}\n"
+        f"Procedure: {patient.procedure}\n"
+        f"Procedure Date: {patient.procedure_date.strftime('%Y-%m-%d')}\n"
+        f"Medical History: {patient.medical_history}"
+    )
+
+
+def symptoms_context(extracted_symptoms, fields=("pain_level", "bleeding", "swelling", "fever", "medication_taken",
+                                                 "other_symptoms")):
+    """Extracted symptoms as a bullet list (only the given fields)."""
+    labels = {
+        "pain_level": ("Pain Level", "Not mentioned"),
+        "bleeding": ("Bleeding", "Not mentioned"),
+        "swelling": ("Swelling", "Not mentioned"),
+        "fever": ("Fever", False),
+        "medication_taken": ("Medication Taken", "None"),
+        "other_symptoms": ("Other Symptoms", []),
+        "patient_concerns": ("Patient Concerns", "None"),
+        "overall_sentiment": ("Overall Sentiment", "Not analyzed")
+    }
+    lines = []
+    for name in fields:
+        label, default = labels[name]
+        value = extracted_symptoms.get(name, default)
+        if name == "other_symptoms":
+            value = ", ".join(value or []) or "None"
+        lines.append(f"- {label}: {value}")
+    return "Extracted Symptoms:\n" + "\n".join(lines)
+
+
+def risk_context(risk_assessment):
+    return (
+        "Risk Assessment:\n"
+        f"- Risk Level: {risk_assessment.get('risk_level', 'Unknown')}\n"
+        f"- Justification: {risk_assessment.get('justification', 'Not provided')}"
+    )
@@ -0,0 +1,324 @@
+"""Deadlines, retries, hedged requests and circuit breaking for LLM calls.
+
+Every completion goes through a CallPolicy for its stage:
+
+- the whole call, retries included, has a deadline, and each attempt's HTTP
+  timeout is whatever is left of it, so a call can never hang;
+- rate limits (429), 5xx, timeouts and connection errors are retried with
+  exponential backoff and full jitter (tenacity), honouring Retry-After;
+- optionally, when the first request hasn't answered after `hedge_after`
+  seconds a duplicate is sent and whichever answers first wins;
+- a circuit breaker per model opens after consecutive failures and fails
+  calls immediately until a trial call succeeds again.
+
+When a call can't be completed the policy raises LLMUnavailableError, which
+the agents turn into their local fallback (see agents/fallbacks.py).
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import httpx
+import openai
+from tenacity import (
+    Retrying, AsyncRetrying, retry_if_exception, stop_after_attempt, stop_after_delay, wait_random_exponential
+)
+
+from config import RESILIENCE_SETTINGS
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """No completion could be obtained: retries exhausted, deadline passed or circuit open."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """The model's circuit breaker is open; the call was not attempted."""
+
+
+class StreamInterruptedError(LLMUnavailableError):
+    """A stream that had started failed before it finished; the text received so far is incomplete."""
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth another attempt."""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait (Retry-After header), or None."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures -> half-open after `reset_seconds`.
+
+    While open, calls fail immediately. Once reset_seconds have passed a single
+    trial call is let through; its success closes the circuit, its failure
+    opens it again.
+    """
+
+    def __init__(self, name, failure_threshold, reset_seconds):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go out now.
+
+        Returns:
+            bool: True if this call is the half-open trial. The caller must then
+                end it with record_success() or record_failure(), even when it is
+                cancelled, or the circuit never closes again.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self.reset_seconds and not self._trial_running:
+                self._trial_running = True
+                return True
+        metrics.increment("llm_circuit_rejections", model=self.name)
+        raise CircuitOpenError(f"Circuit for {self.name} is open after repeated API failures")
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_running
+            self._trial_running = False
+            if trial_failed or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                metrics.increment("llm_circuit_opened", model=self.name)
+                logger.warning(f"Circuit for {self.name} opened after {self._failures} consecutive failures")
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model):
+    """Process-wide CircuitBreaker for a model."""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                model,
+                RESILIENCE_SETTINGS["breaker_failure_threshold"],
+                RESILIENCE_SETTINGS["breaker_reset_seconds"]
+            )
+            _breakers[model] = breaker
+        return breaker
+
+
+def _stage_value(name, stage, cast):
+    """RESILIENCE_SETTINGS[name] for a stage, overridable with AI_<STAGE>_<NAME>."""
+    env = os.getenv(f"AI_{(stage or 'default').upper()}_{name.upper()}")
+    if env not in (None, ""):
+        return None if env.lower() == "none" else cast(env)
+    value = RESILIENCE_SETTINGS[name]
+    if isinstance(value, dict):
+        value = value.get(stage, value.get("default"))
+    return value
+
+
+# Hedged sync requests run on these threads; the caller's thread waits for the winner
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+class CallPolicy:
+    """Deadline, retry, hedging and circuit-breaker policy for one stage's calls."""
+
+    def __init__(self, stage, deadline=None, max_attempts=None, backoff_initial=None, backoff_max=None,
+                 hedge_after=None):
+        """Build the policy; arguments left as None come from RESILIENCE_SETTINGS for the stage."""
+        self.stage = stage
+        self.deadline = deadline if deadline is not None else _stage_value("deadline", stage, float)
+        self.max_attempts = max_attempts or RESILIENCE_SETTINGS["max_attempts"]
+        self.backoff_initial = backoff_initial or RESILIENCE_SETTINGS["backoff_initial"]
+        self.backoff_max = backoff_max or RESILIENCE_SETTINGS["backoff_max"]
+        self.hedge_after = hedge_after if hedge_after is not None else _stage_value("hedge_after", stage, float)
+
+    def _retrying(self, retrying_class, model, deadline_at):
+        jitter = wait_random_exponential(multiplier=self.backoff_initial, max=self.backoff_max)
+
+        def wait_for(retry_state):
+            delay = jitter(retry_state)
+            retry_after = _retry_after(retry_state.outcome.exception())
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            # Never sleep past the deadline; the stop condition then ends the call
+            return max(0.0, min(delay, deadline_at - time.monotonic()))
+
+        def before_sleep(retry_state):
+            metrics.increment("llm_retries", stage=self.stage, model=model)
+            logger.warning(
+                f"{self.stage} call to {model} failed (attempt {retry_state.attempt_number}): "
+                f"{retry_state.outcome.exception()!r}; retrying"
+            )
+
+        return retrying_class(
+            stop=stop_after_attempt(self.max_attempts) | stop_after_delay(self.deadline),
+            wait=wait_for,
+            retry=retry_if_exception(is_retryable),
+            before_sleep=before_sleep,
+            reraise=True
+        )
+
+    def _unavailable(self, model, error):
+        metrics.increment("llm_unavailable", stage=self.stage, model=model)
+        return LLMUnavailableError(f"{self.stage} call to {model} failed: {error!r}")
+
+    def call(self, model, request, hedge=True):
+        """Run `request(timeout)` under the policy and return its result.
+
+        Args:
+            model: Model name, which selects the circuit breaker.
+            request: Callable taking the attempt's timeout in seconds and making one API request.
+            hedge: Allow a duplicate request for slow attempts (when the stage has hedge_after).
+
+        Raises:
+            LLMUnavailableError: If no attempt succeeded in time or the circuit is open.
+        """
+        breaker = get_breaker(model)
+        deadline_at = time.monotonic() + self.deadline
+        try:
+            for attempt in self._retrying(Retrying, model, deadline_at):
+                with attempt:
+                    # Before allow(), so an expired call never takes the half-open trial
+                    remaining = deadline_at - time.monotonic()
+                    if remaining <= 0:
+                        raise openai.APITimeoutError(request=None)
+                    # Checked per attempt so a call stops retrying once the circuit opens
+                    trial = breaker.allow()
+                    try:
+                        result = self._hedged(request, remaining, model, hedge)
+                    except Exception as e:
+                        if is_retryable(e):
+                            breaker.record_failure()
+                        else:
+                            # The API answered (e.g. a 400), so it isn't degraded
+                            breaker.record_success()
+                        raise
+                    except BaseException:
+                        # Interrupted: says nothing about the API, but a trial must give its slot back
+                        if trial:
+                            breaker.record_failure()
+                        raise
+            breaker.record_success()
+            return result
+        except Exception as e:
+            if is_retryable(e):
+                raise self._unavailable(model, e) from e
+            raise
+
+    async def acall(self, model, request, hedge=True):
+        """Async variant of call(); `request(timeout)` returns an awaitable."""
+        breaker = get_breaker(model)
+        deadline_at = time.monotonic() + self.deadline
+        try:
+            async for attempt in self._retrying(AsyncRetrying, model, deadline_at):
+                with attempt:
+                    remaining = deadline_at - time.monotonic()
+                    if remaining <= 0:
+                        raise openai.APITimeoutError(request=None)
+                    trial = breaker.allow()
+                    try:
+                        result = await self._ahedged(request, remaining, model, hedge)
+                    except Exception as e:
+                        if is_retryable(e):
+                            breaker.record_failure()
+                        else:
+                            # The API answered (e.g. a 400), so it isn't degraded
+                            breaker.record_success()
+                        raise
+                    except BaseException:
+                        # Cancelled (e.g. by TriagePipeline.stream): a trial must give its slot back
+                        if trial:
+                            breaker.record_failure()
+                        raise
+            breaker.record_success()
+            return result
+        except Exception as e:
+            if is_retryable(e):
+                raise self._unavailable(model, e) from e
+            raise
+
+    def _should_hedge(self, remaining, hedge):
+        return hedge and self.hedge_after is not None and self.hedge_after < remaining
+
+    def _hedged(self, request, remaining, model, hedge):
+        if not self._should_hedge(remaining, hedge):
+            return request(remaining)
+
+        first = _hedge_executor.submit(request, remaining)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+
+        # The loser can't be cancelled mid-request; its result is dropped
+        metrics.increment("llm_hedged_requests", stage=self.stage, model=model)
+        pending = {first, _hedge_executor.submit(request, remaining - self.hedge_after)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    async def _ahedged(self, request, remaining, model, hedge):
+        if not self._should_hedge(remaining, hedge):
+            return await request(remaining)
+
+        first = asyncio.ensure_future(request(remaining))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+            if done:
+                return first.result()
+
+            metrics.increment("llm_hedged_requests", stage=self.stage, model=model)
+            pending.add(asyncio.ensure_future(request(remaining - self.hedge_after)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # The slower request (or both, if we were cancelled) is abandoned
+            for task in pending:
+                task.cancel()
@@ -1,10 +1,109 @@
 from .base_agent import BaseAgent
+from .symptom_extractor import LocalSymptomExtractor
+from .schemas import SymptomPayload, StructuredOutputError
+from .prompts import system_prompt, patient_context
+from .resilience import LLMUnavailableError
+from .fallbacks import FALLBACK_PATH
+from config import SYMPTOM_EXTRACTOR_SETTINGS
+
+SYSTEM_MESSAGE = system_prompt(
+    "You are a dental professional analyzing patient responses after procedures. "
+    "Extract specific symptoms and their severity from the patient's message. "
+    "Focus on pain (scale 1-10), bleeding (none/mild/moderate/severe), "
+    "swelling (none/mild/moderate/severe), fever, and any other symptoms mentioned. "
+    "Be thorough - if a patient mentions ANY symptom, you must capture it. "
+    "Infer severity from context clues like 'significant', 'a lot', 'very', 'terrible', etc.",
+    """Extract symptom information from patient responses. Here are examples:
+
+---
+EXAMPLE 1:
+Patient's Response: "Im bleeding a significant amount still. Very concerned and in pain"
+Output:
+{
+    "pain_level": 7,
+    "bleeding": "severe",
+    "swelling": "not mentioned",
+    "fever": false,
+    "medication_taken": "none",
+    "other_symptoms": [],
+    "patient_concerns": "Very concerned about bleeding and pain",
+    "overall_sentiment": "negative"
+}
+
+---
+EXAMPLE 2:
+Patient's Response: "Doing okay, just a little sore. Took some ibuprofen this morning."
+Output:
+{
+    "pain_level": 3,
+    "bleeding": "not mentioned",
+    "swelling": "not mentioned",
+    "fever": false,
+    "medication_taken": "ibuprofen",
+    "other_symptoms": [],
+    "patient_concerns": "none",
+    "overall_sentiment": "positive"
+}
+
+---
+EXAMPLE 3:
+Patient's Response: "The swelling is really bad and I think I have a fever. Pain is about a 6. Noticed some blood when I rinsed."
+Output:
+{
+    "pain_level": 6,
+    "bleeding": "mild",
+    "swelling": "severe",
+    "fever": true,
+    "medication_taken": "none",
+    "other_symptoms": [],
+    "patient_concerns": "none",
+    "overall_sentiment": "concerned"
+}
+
+---
+EXAMPLE 4:
+Patient's Response: "Everything hurts so bad I can barely function. My face is huge and I'm terrified something is wrong."
+Output:
+{
+    "pain_level": 9,
+    "bleeding": "not mentioned",
+    "swelling": "severe",
+    "fever": false,
+    "medication_taken": "none",
+    "other_symptoms": ["difficulty functioning"],
+    "patient_concerns": "Terrified something is wrong",
+    "overall_sentiment": "negative"
+}
+
+---
+EXAMPLE 5:
+Patient's Response: "Fine"
+Output:
+{
+    "pain_level": 0,
+    "bleeding": "none",
+    "swelling": "none",
+    "fever": false,
+    "medication_taken": "none",
+    "other_symptoms": [],
+    "patient_concerns": "none",
+    "overall_sentiment": "positive"
+}
+---""",
+    'When severity is implied but not explicit (e.g., "significant amount", "a lot", "terrible"), '
+    "infer the appropriate level. Provide ONLY the JSON with no additional text."
+)
+
 
 class ResponseAnalyzerAgent(BaseAgent):
     """Agent responsible for analyzing patient responses and extracting structured symptom data."""
     
-    def __init__(self, name="Response Analyzer Agent", api_key=None):
-        super().__init__(name, api_key)
+    stage = "symptom_analysis"
+
+    def __init__(self, name="Response Analyzer Agent", api_key=None, cache=None):
+        super().__init__(name, api_key, cache)
+        self.local_extractor = LocalSymptomExtractor() if SYMPTOM_EXTRACTOR_SETTINGS["enabled"] else None
+        self.confidence_threshold = SYMPTOM_EXTRACTOR_SETTINGS["confidence_threshold"]
     
     def process(self, patient, response_text):
         """Analyze a patient's response and extract structured symptom data.
@@ -16,119 +115,87 @@ class ResponseAnalyzerAgent(BaseAgent):
         Returns:
             dict: Structured data about the patient's symptoms.
         """
-        system_message = (
-            "You are a dental professional analyzing patient responses after procedures. "
-            "Extract specific symptoms and their severity from the patient's message. "
-            "Focus on pain (scale 1-10), bleeding (none/mild/moderate/severe), "
-            "swelling (none/mild/moderate/severe), fever, and any other symptoms mentioned. "
-            "Be thorough - if a patient mentions ANY symptom, you must capture it. "
-            "Infer severity from context clues like 'significant', 'a lot', 'very', 'terrible', etc."
-        )
+        # Confident local extraction skips the GPT round-trip entirely
+        extracted_symptoms = self.extract_locally(patient, response_text)
+        if extracted_symptoms is not None:
+            return extracted_symptoms
         
-        prompt = f"""
-        Extract symptom information from patient responses. Here are examples:
-
-        ---
-        EXAMPLE 1:
-        Patient's Response: "Im bleeding a significant amount still. Very concerned and in pain"
-        Output:
-        {{
-            "pain_level": 7,
-            "bleeding": "severe",
-            "swelling": "not mentioned",
-            "fever": false,
-            "medication_taken": "none",
-            "other_symptoms": [],
-            "patient_concerns": "Very concerned about bleeding and pain",
-            "overall_sentiment": "negative"
-        }}
-
-        ---
-        EXAMPLE 2:
-        Patient's Response: "Doing okay, just a little sore. Took some ibuprofen this morning."
-        Output:
-        {{
-            "pain_level": 3,
-            "bleeding": "not mentioned",
-            "swelling": "not mentioned",
-            "fever": false,
-            "medication_taken": "ibuprofen",
-            "other_symptoms": [],
-            "patient_concerns": "none",
-            "overall_sentiment": "positive"
-        }}
-
-        ---
-        EXAMPLE 3:
-        Patient's Response: "The swelling is really bad and I think I have a fever. Pain is about a 6. Noticed some blood when I rinsed."
-        Output:
-        {{
-            "pain_level": 6,
-            "bleeding": "mild",
-            "swelling": "severe",
-            "fever": true,
-            "medication_taken": "none",
-            "other_symptoms": [],
-            "patient_concerns": "none",
-            "overall_sentiment": "concerned"
-        }}
-
-        ---
-        EXAMPLE 4:
-        Patient's Response: "Everything hurts so bad I can barely function. My face is huge and I'm terrified something is wrong."
-        Output:
-        {{
-            "pain_level": 9,
-            "bleeding": "not mentioned",
-            "swelling": "severe",
-            "fever": false,
-            "medication_taken": "none",
-            "other_symptoms": ["difficulty functioning"],
-            "patient_concerns": "Terrified something is wrong",
-            "overall_sentiment": "negative"
-        }}
-
-        ---
-        EXAMPLE 5:
-        Patient's Response: "Fine"
-        Output:
-        {{
-            "pain_level": 0,
-            "bleeding": "none",
-            "swelling": "none",
-            "fever": false,
-            "medication_taken": "none",
-            "other_symptoms": [],
-            "patient_concerns": "none",
-            "overall_sentiment": "positive"
-        }}
-
-        ---
-        NOW ANALYZE THIS PATIENT:
-        Patient: {patient.name}
-        Procedure: {patient.procedure}
-        Procedure Date: {patient.procedure_date.strftime('%Y-%m-%d')}
-        Medical History: {patient.medical_history}
+        prompt, system_message = self.build_prompt(patient, response_text)
+        try:
+            payload = self.call_gpt_structured(prompt, SymptomPayload, system_message)
+        except StructuredOutputError as e:
+            return self.handle_result(patient, response_text, None, e)
+        except LLMUnavailableError:
+            return self.fallback(patient, response_text)
+        return self.handle_result(patient, response_text, payload)
+    
+    async def aprocess(self, patient, response_text):
+        """Async variant of process() used by the triage pipeline."""
+        extracted_symptoms = self.extract_locally(patient, response_text)
+        if extracted_symptoms is not None:
+            return extracted_symptoms
         
-        Patient's Response: "{response_text}"
+        prompt, system_message = self.build_prompt(patient, response_text)
+        try:
+            payload = await self.acall_gpt_structured(prompt, SymptomPayload, system_message)
+        except StructuredOutputError as e:
+            return self.handle_result(patient, response_text, None, e)
+        except LLMUnavailableError:
+            return self.fallback(patient, response_text)
+        return self.handle_result(patient, response_text, payload)
+    
+    def build_prompt(self, patient, response_text):
+        """Build the (prompt, system_message) pair for symptom extraction.
 
-        Extract the symptom information. When severity is implied but not explicit (e.g., "significant amount", "a lot", "terrible"), infer the appropriate level. Provide ONLY the JSON with no additional text.
+        Instructions and examples are in the shared system message; the
+        prompt carries only this patient's details and reply.
+        """
+        prompt = (
+            "NOW ANALYZE THIS PATIENT:\n"
+            f"{patient_context(patient)}\n\n"
+            f"Patient's Response: \"{response_text}\""
+        )
+        return prompt, SYSTEM_MESSAGE
+    
+    def extract_locally(self, patient, response_text):
+        """Run the local extractor; store and return its result only if it is confident enough.
+        
+        Returns:
+            dict: Extracted symptoms, or None when the LLM should be used instead.
         """
+        if not self.local_extractor:
+            return None
         
-        analysis_result = self.call_gpt(prompt, system_message)
+        extracted_symptoms, confidence = self.local_extractor.extract(response_text)
+        if confidence < self.confidence_threshold:
+            return None
         
-        try:
-            import json
-            extracted_symptoms = json.loads(analysis_result)
-        except json.JSONDecodeError:
+        self._store(patient, response_text, extracted_symptoms, f"local:{confidence:.2f}")
+        return extracted_symptoms
+    
+    def fallback(self, patient, response_text):
+        """Use the local extraction whatever its confidence when the API is unavailable."""
+        extractor = self.local_extractor or LocalSymptomExtractor()
+        extracted_symptoms, confidence = extractor.extract(response_text)
+        self._store(patient, response_text, extracted_symptoms, f"{FALLBACK_PATH}:{confidence:.2f}")
+        return extracted_symptoms
+    
+    def handle_result(self, patient, response_text, payload, error=None):
+        """Store the validated SymptomPayload (or the parse error) on the patient's latest interaction."""
+        if payload is not None:
+            extracted_symptoms = payload.as_dict()
+        else:
             extracted_symptoms = {
                 "error": "Failed to parse response",
-                "raw_response": analysis_result
+                "raw_response": error.raw_response if error else None
             }
         
+        self._store(patient, response_text, extracted_symptoms, "llm")
+        return extracted_symptoms
+    
+    def _store(self, patient, response_text, extracted_symptoms, extraction_path):
         interaction = patient.get_latest_interaction()
         if interaction:
             interaction.patient_response = response_text
             interaction.extracted_symptoms = extracted_symptoms
-        
-        return extracted_symptoms
+            interaction.symptom_extraction_path = extraction_path
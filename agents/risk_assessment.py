@@ -1,10 +1,34 @@
 from .base_agent import BaseAgent
+from .risk_rules import RiskRulesEngine
+from .schemas import RiskPayload, StructuredOutputError
+from .prompts import system_prompt, patient_context, symptoms_context
+from .resilience import LLMUnavailableError
+from .fallbacks import fallback_risk
+
+SYSTEM_MESSAGE = system_prompt(
+    "You are a dental professional specializing in post-operative risk assessment. "
+    "Evaluate the patient's symptoms and classify their condition as Low, Medium, or High risk. "
+    "Consider the type of procedure, time since procedure, and severity of symptoms. "
+    "Provide clear justification for your risk assessment.",
+    """Assess the risk level for the patient based on their symptoms and provide justification.
+Return your assessment in JSON format:
+{
+    "risk_level": ("Low", "Medium", or "High"),
+    "justification": (detailed explanation of your assessment)
+}
+
+Provide ONLY the JSON with no additional text."""
+)
 
 class RiskAssessmentAgent(BaseAgent):
     """Agent responsible for assessing the risk level based on patient symptoms."""
     
-    def __init__(self, name="Risk Assessment Agent", api_key=None):
-        super().__init__(name, api_key)
+    stage = "risk_assessment"
+
+    def __init__(self, name="Risk Assessment Agent", api_key=None, cache=None, rules_engine=None):
+        super().__init__(name, api_key, cache)
+        # Obvious Low/High cases are decided locally; pass rules_engine to override config.RISK_RULES
+        self.rules_engine = rules_engine if rules_engine is not None else RiskRulesEngine.from_config()
     
     def process(self, patient, extracted_symptoms):
         """Assess the risk level based on the patient's symptoms.
@@ -16,59 +40,92 @@ class RiskAssessmentAgent(BaseAgent):
         Returns:
             dict: Risk assessment with level and justification.
         """
-        # Create a system message that guides the AI's behavior
-        system_message = (
-            "You are a dental professional specializing in post-operative risk assessment. "
-            "Evaluate the patient's symptoms and classify their condition as Low, Medium, or High risk. "
-            "Consider the type of procedure, time since procedure, and severity of symptoms. "
-            "Provide clear justification for your risk assessment."
-        )
-        
-        # Create a prompt with patient context and their symptoms
-        prompt = f"""
-        Patient: {patient.name}
-        Procedure: {patient.procedure}
-        Procedure Date: {patient.procedure_date.strftime('%Y-%m-%d')}
-        Medical History: {patient.medical_history}
+        # Skip the LLM entirely when a deterministic rule already decides
+        rule_assessment = self.assess_with_rules(patient, extracted_symptoms)
+        if rule_assessment:
+            return rule_assessment
         
-        Extracted Symptoms:
-        - Pain Level: {extracted_symptoms.get('pain_level', 'Not mentioned')}
-        - Swelling: {extracted_symptoms.get('swelling', 'Not mentioned')}
-        - Fever: {extracted_symptoms.get('fever', False)}
-        - Medication Taken: {extracted_symptoms.get('medication_taken', 'None')}
-        - Other Symptoms: {', '.join(extracted_symptoms.get('other_symptoms', [])) or 'None'}
-        - Patient Concerns: {extracted_symptoms.get('patient_concerns', 'None')}
-        - Overall Sentiment: {extracted_symptoms.get('overall_sentiment', 'Not analyzed')}
-        
-        Assess the risk level for this patient based on their symptoms and provide justification.
-        Return your assessment in JSON format:
-        {{
-            "risk_level": ("Low", "Medium", or "High"),
-            "justification": (detailed explanation of your assessment)
-        }}
-        
-        Provide ONLY the JSON with no additional text.
-        """
+        prompt, system_message = self.build_prompt(patient, extracted_symptoms)
         
         # Call the GPT API to assess the risk
-        assessment_result = self.call_gpt(prompt, system_message)
+        try:
+            payload = self.call_gpt_structured(prompt, RiskPayload, system_message)
+        except StructuredOutputError as e:
+            return self.handle_result(patient, None, e)
+        except LLMUnavailableError:
+            return self.fallback(patient, extracted_symptoms)
+        return self.handle_result(patient, payload)
+    
+    async def aprocess(self, patient, extracted_symptoms):
+        """Async variant of process() used by the triage pipeline."""
+        rule_assessment = self.assess_with_rules(patient, extracted_symptoms)
+        if rule_assessment:
+            return rule_assessment
         
-        # Try to parse the result as a dictionary (it should be JSON)
+        prompt, system_message = self.build_prompt(patient, extracted_symptoms)
         try:
-            import json
-            risk_assessment = json.loads(assessment_result)
-        except json.JSONDecodeError:
+            payload = await self.acall_gpt_structured(prompt, RiskPayload, system_message)
+        except StructuredOutputError as e:
+            return self.handle_result(patient, None, e)
+        except LLMUnavailableError:
+            return self.fallback(patient, extracted_symptoms)
+        return self.handle_result(patient, payload)
+    
+    def assess_with_rules(self, patient, extracted_symptoms):
+        """Try the rules engine; store and return the assessment if a rule matched, else None."""
+        if not self.rules_engine:
+            return None
+        
+        match = self.rules_engine.evaluate(extracted_symptoms)
+        if not match:
+            return None
+        
+        risk_assessment = {
+            "risk_level": match["risk_level"],
+            "justification": match["justification"],
+            "decision_path": f"rule:{match['rule']}"
+        }
+        self._store(patient, risk_assessment)
+        return risk_assessment
+    
+    def fallback(self, patient, extracted_symptoms):
+        """Conservative local assessment when the API is unavailable (rules were already tried)."""
+        risk_assessment = fallback_risk(extracted_symptoms)
+        self._store(patient, risk_assessment)
+        return risk_assessment
+    
+    def build_prompt(self, patient, extracted_symptoms):
+        """Build the (prompt, system_message) pair for risk assessment."""
+        prompt = (
+            f"{patient_context(patient)}\n\n"
+            + symptoms_context(extracted_symptoms, fields=(
+                "pain_level", "swelling", "fever", "medication_taken", "other_symptoms",
+                "patient_concerns", "overall_sentiment"
+            ))
+        )
+        return prompt, SYSTEM_MESSAGE
+    
+    def handle_result(self, patient, payload, error=None):
+        """Store the validated RiskPayload (or the parse error) on the patient's latest interaction."""
+        if payload is not None:
+            risk_assessment = payload.as_dict()
+        else:
             # If parsing fails, return a basic structure with an error
             risk_assessment = {
                 "risk_level": "Unknown",
                 "justification": "Error in risk assessment",
                 "error": "Failed to parse response",
-                "raw_response": assessment_result
+                "raw_response": error.raw_response if error else None
             }
         
+        risk_assessment["decision_path"] = "llm"
+        self._store(patient, risk_assessment)
+        return risk_assessment
+    
+    def _store(self, patient, risk_assessment):
         # Store the risk assessment in the patient's latest interaction
         interaction = patient.get_latest_interaction()
         if interaction:
             interaction.risk_level = risk_assessment.get("risk_level", "Unknown")
             interaction.risk_justification = risk_assessment.get("justification", "")
-        return risk_assessment
\ No newline at end of file
+            interaction.risk_decision_path = risk_assessment.get("decision_path", "")
\ No newline at end of file
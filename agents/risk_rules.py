@@ -0,0 +1,85 @@
+from config import RISK_RULES
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _condition_matches(value, condition):
+    """Check one extracted_symptoms field against one rule condition."""
+    if isinstance(condition, bool):
+        # A missing or non-boolean value is unknown, not False: "fever": None must not read as no fever
+        return isinstance(value, bool) and value == condition
+
+    if isinstance(condition, (list, tuple)):
+        if value is None:
+            return False
+        return str(value).strip().lower() in [str(option).lower() for option in condition]
+
+    if isinstance(condition, dict):
+        if "empty" in condition:
+            # Likewise a field that was never extracted isn't known to be empty
+            if value is None:
+                return False
+            return (not value) == condition["empty"]
+
+        number = _to_number(value)
+        if number is None:
+            return False
+        if "min" in condition and number < condition["min"]:
+            return False
+        if "max" in condition and number > condition["max"]:
+            return False
+        return True
+
+    return value == condition
+
+
+class RiskRulesEngine:
+    """Deterministic classifier for the obvious Low/High cases.
+
+    Rules are evaluated in order against the extracted_symptoms dict and the first
+    rule whose conditions all match decides. Returns None when nothing matches so
+    the ambiguous middle can be sent to the LLM.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    @classmethod
+    def from_config(cls):
+        """Build the engine from config.RISK_RULES, or None if rules are disabled."""
+        if not RISK_RULES.get("enabled"):
+            return None
+        return cls(RISK_RULES["rules"])
+
+    def evaluate(self, extracted_symptoms):
+        """Classify the symptoms if a rule applies.
+
+        Args:
+            extracted_symptoms: Dictionary of extracted symptoms from the ResponseAnalyzerAgent.
+
+        Returns:
+            dict: risk_level, justification and the matching rule name, or None.
+        """
+        # Never short-circuit on a failed extraction
+        if not extracted_symptoms or "error" in extracted_symptoms:
+            return None
+
+        for rule in self.rules:
+            conditions = rule["when"]
+            if all(_condition_matches(extracted_symptoms.get(field), condition)
+                   for field, condition in conditions.items()):
+                return {
+                    "risk_level": rule["risk_level"],
+                    "justification": rule["justification"],
+                    "rule": rule["name"]
+                }
+        return None
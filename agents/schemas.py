@@ -0,0 +1,119 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, field_validator
+
+Severity = Literal["none", "mild", "moderate", "severe", "not mentioned"]
+RiskLevel = Literal["Low", "Medium", "High"]
+
+# JSON-schema keywords OpenAI strict mode rejects; pydantic still enforces them locally
+_UNSUPPORTED_KEYWORDS = {
+    "title", "default", "minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum",
+    "minLength", "maxLength", "pattern", "format", "minItems", "maxItems"
+}
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a completion still fails schema validation after the repair retries."""
+
+    def __init__(self, message, raw_response=None):
+        super().__init__(message)
+        self.raw_response = raw_response
+
+
+class SymptomPayload(BaseModel):
+    """Structured symptom data extracted from a patient reply."""
+    model_config = ConfigDict(extra="forbid")
+
+    pain_level: Optional[int]
+    bleeding: Severity
+    swelling: Severity
+    fever: bool
+    medication_taken: str
+    other_symptoms: List[str]
+    patient_concerns: str
+    overall_sentiment: str
+
+    @field_validator("pain_level", mode="before")
+    @classmethod
+    def _pain_level(cls, value):
+        # Models sometimes answer "not mentioned" or "6/10" instead of a number
+        if value is None or isinstance(value, (int, float)):
+            return None if value is None else max(0, min(10, int(round(value))))
+        digits = "".join(ch for ch in str(value).split("/")[0] if ch.isdigit())
+        return max(0, min(10, int(digits))) if digits else None
+
+    @field_validator("bleeding", "swelling", mode="before")
+    @classmethod
+    def _severity(cls, value):
+        return str(value).strip().lower() if value is not None else "not mentioned"
+
+    def as_dict(self):
+        """Dict in the shape the agents have always produced (pain "not mentioned" instead of None)."""
+        data = self.model_dump()
+        if data["pain_level"] is None:
+            data["pain_level"] = "not mentioned"
+        return data
+
+
+class RiskPayload(BaseModel):
+    """Risk level and justification for a patient's symptoms."""
+    model_config = ConfigDict(extra="forbid")
+
+    risk_level: RiskLevel
+    justification: str
+
+    @field_validator("risk_level", mode="before")
+    @classmethod
+    def _risk_level(cls, value):
+        return str(value).strip().capitalize()
+
+    def as_dict(self):
+        return self.model_dump()
+
+
+class TriagePayload(BaseModel):
+    """Combined output of the single-call triage mode."""
+    model_config = ConfigDict(extra="forbid")
+
+    extracted_symptoms: SymptomPayload
+    risk_assessment: RiskPayload
+    care_instructions: str
+    summary: str
+
+    def as_dict(self):
+        return {
+            "extracted_symptoms": self.extracted_symptoms.as_dict(),
+            "risk_assessment": self.risk_assessment.as_dict(),
+            "care_instructions": self.care_instructions,
+            "summary": self.summary
+        }
+
+
+def _strict(schema):
+    """Recursively adapt a pydantic JSON schema to OpenAI strict structured-output rules."""
+    if isinstance(schema, list):
+        return [_strict(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    strict = {key: _strict(value) for key, value in schema.items() if key not in _UNSUPPORTED_KEYWORDS}
+    for container in ("properties", "$defs"):
+        # These map names to sub-schemas, so their keys are never keywords
+        if container in schema:
+            strict[container] = {name: _strict(sub) for name, sub in schema[container].items()}
+    if strict.get("type") == "object" and "properties" in strict:
+        strict["additionalProperties"] = False
+        strict["required"] = list(strict["properties"])
+    return strict
+
+
+def response_format_for(model):
+    """Build an OpenAI json_schema response_format from a pydantic model class."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "strict": True,
+            "schema": _strict(model.model_json_schema())
+        }
+    }
@@ -1,11 +1,26 @@
 from .base_agent import BaseAgent
+from .prompts import system_prompt, patient_context, symptoms_context, risk_context
+from .resilience import LLMUnavailableError
+from .fallbacks import fallback_summary
 from config import DENTAL_PROFESSIONAL
 
+SYSTEM_MESSAGE = system_prompt(
+    f"You are {DENTAL_PROFESSIONAL['name']}, {DENTAL_PROFESSIONAL['title']} at {DENTAL_PROFESSIONAL['clinic_name']}, "
+    "creating a clinical summary for a patient's dental follow-up. "
+    "Your summary should be professional, concise, and include all relevant clinical information. "
+    "Format the summary with clear sections for symptoms, assessment, care provided, and follow-up recommendations.",
+    "Generate a comprehensive clinical summary of the follow-up interaction.\n"
+    "Include relevant symptoms, your assessment, care instructions provided, and any recommended follow-up.\n"
+    "This summary will be added to the patient's medical record."
+)
+
 class SummaryAgent(BaseAgent):
     """Agent responsible for generating a clinical summary of the patient interaction."""
     
-    def __init__(self, name="Summary Agent", api_key=None):
-        super().__init__(name, api_key)
+    stage = "summary"
+
+    def __init__(self, name="Summary Agent", api_key=None, cache=None):
+        super().__init__(name, api_key, cache)
     
     def process(self, patient, extracted_symptoms, risk_assessment, care_instructions):
         """Generate a clinical summary of the patient interaction.
@@ -19,44 +34,59 @@ class SummaryAgent(BaseAgent):
         Returns:
             str: Clinical summary.
         """
-        # Create a system message that guides the AI's behavior
-        system_message = (
-            f"You are {DENTAL_PROFESSIONAL['name']}, {DENTAL_PROFESSIONAL['title']} at {DENTAL_PROFESSIONAL['clinic_name']}, "
-            "creating a clinical summary for a patient's dental follow-up. "
-            "Your summary should be professional, concise, and include all relevant clinical information. "
-            "Format the summary with clear sections for symptoms, assessment, care provided, and follow-up recommendations."
-        )
-        
-        # Create a prompt with all the context
-        prompt = f"""
-        Patient: {patient.name}
-        Procedure: {patient.procedure}
-        Procedure Date: {patient.procedure_date.strftime('%Y-%m-%d')}
-        Medical History: {patient.medical_history}
+        prompt, system_message = self.build_prompt(patient, extracted_symptoms, risk_assessment, care_instructions)
         
-        Extracted Symptoms:
-        - Pain Level: {extracted_symptoms.get('pain_level', 'Not mentioned')}
-        - Bleeding: {extracted_symptoms.get('bleeding', 'Not mentioned')}
-        - Swelling: {extracted_symptoms.get('swelling', 'Not mentioned')}
-        - Fever: {extracted_symptoms.get('fever', False)}
-        - Medication Taken: {extracted_symptoms.get('medication_taken', 'None')}
-        - Other Symptoms: {', '.join(extracted_symptoms.get('other_symptoms', [])) or 'None'}
-        
-        Risk Assessment:
-        - Risk Level: {risk_assessment.get('risk_level', 'Unknown')}
-        - Justification: {risk_assessment.get('justification', 'Not provided')}
+        # Call the GPT API to generate the summary
+        try:
+            summary = self.call_gpt(prompt, system_message)
+        except LLMUnavailableError:
+            summary = fallback_summary(patient, extracted_symptoms, risk_assessment, care_instructions)
+        return self.handle_result(patient, summary)
+    
+    async def aprocess(self, patient, extracted_symptoms, risk_assessment, care_instructions):
+        """Async variant of process() used by the triage pipeline."""
+        prompt, system_message = self.build_prompt(patient, extracted_symptoms, risk_assessment, care_instructions)
+        try:
+            summary = await self.acall_gpt(prompt, system_message)
+        except LLMUnavailableError:
+            summary = fallback_summary(patient, extracted_symptoms, risk_assessment, care_instructions)
+        return self.handle_result(patient, summary)
+    
+    def process_stream(self, patient, extracted_symptoms, risk_assessment, care_instructions):
+        """Streaming variant of process() for the UI.
         
-        Care Instructions Provided:
-        {care_instructions}
+        Yields the summary piece by piece; once the stream is exhausted the full
+        text is stored on the patient's latest interaction.
         
-        Generate a comprehensive clinical summary of this follow-up interaction.
-        Include relevant symptoms, your assessment, care instructions provided, and any recommended follow-up.
-        This summary will be added to the patient's medical record.
+        If the stream can't be opened, or fails partway, the local fallback is
+        yielded and stored instead; whatever had streamed is discarded, and
+        self.stream_result holds the stored text so the UI can redraw it.
         """
-        
-        # Call the GPT API to generate the summary
-        summary = self.call_gpt(prompt, system_message)
-        
+        prompt, system_message = self.build_prompt(patient, extracted_symptoms, risk_assessment, care_instructions)
+        parts = []
+        try:
+            for delta in self.call_gpt_stream(prompt, system_message):
+                parts.append(delta)
+                yield delta
+        except LLMUnavailableError:
+            # Never store a cut-off answer with the fallback appended to it
+            streamed = bool(parts)
+            parts = [fallback_summary(patient, extracted_symptoms, risk_assessment, care_instructions)]
+            yield ("\n\n" if streamed else "") + parts[0]
+        self.stream_result = self.handle_result(patient, "".join(parts))
+    
+    def build_prompt(self, patient, extracted_symptoms, risk_assessment, care_instructions):
+        """Build the (prompt, system_message) pair for the clinical summary."""
+        prompt = (
+            f"{patient_context(patient)}\n\n"
+            f"{symptoms_context(extracted_symptoms)}\n\n"
+            f"{risk_context(risk_assessment)}\n\n"
+            f"Care Instructions Provided:\n{care_instructions}"
+        )
+        return prompt, SYSTEM_MESSAGE
+    
+    def handle_result(self, patient, summary):
+        """Store the summary on the patient's latest interaction."""
         # Store the summary in the patient's latest interaction
         interaction = patient.get_latest_interaction()
         if interaction:
@@ -1,44 +1,80 @@
+import time
+import threading
+
 from .base_agent import BaseAgent
-from config import DENTAL_PROFESSIONAL
+from .checkin_templates import (
+    PLACEHOLDERS, history_category, category_guidance, template_key,
+    is_valid_template, fill_template, get_template_cache
+)
+from .prompts import CHECKIN_SIGNATURE, system_prompt, patient_context
+from .resilience import LLMUnavailableError
+from .fallbacks import fallback_checkin
+from config import DENTAL_PROFESSIONAL, CHECKIN_TEMPLATE_SETTINGS
+
+_BASE_INSTRUCTIONS = (
+    f"You are a friendly dental assistant from {DENTAL_PROFESSIONAL['clinic_name']} checking in on patients after their procedure. "
+    "Your tone should be warm, professional, and reassuring. "
+    "Ask specifically about pain, bleeding, swelling, and any concerns that are of similar nature. "
+    "Return plain text and not markdown format."
+)
+
+_SIGNATURE_INSTRUCTIONS = (
+    "The message should ask how they're feeling and if they're experiencing any concerning symptoms.\n\n"
+    f"Sign the message with \"{CHECKIN_SIGNATURE}\" "
+    f"and include the clinic name \"{DENTAL_PROFESSIONAL['clinic_name']}\" in the signature."
+)
+
+SYSTEM_MESSAGE = system_prompt(_BASE_INSTRUCTIONS, _SIGNATURE_INSTRUCTIONS)
+
+TEMPLATE_SYSTEM_MESSAGE = system_prompt(
+    _BASE_INSTRUCTIONS,
+    "You write reusable message TEMPLATES. Use these placeholders exactly as written where the patient's "
+    f"details belong: {', '.join('{' + name + '}' for name in PLACEHOLDERS)}.\n"
+    "Address the patient with {first_name} or {patient_name} and refer to the procedure date as {procedure_date}.\n"
+    "Do not use any other curly-brace placeholders.",
+    _SIGNATURE_INSTRUCTIONS
+)
 
 class SymptomCheckInAgent(BaseAgent):
     """Agent responsible for generating personalized check-in messages for patients"""
 
-    def __init__(self, name="Symptom Check-in Agent", api_key=None):
-        super().__init__(name, api_key)
+    stage = "checkin"
+
+    # One lock per template key, so a campaign doesn't generate the same template in parallel but
+    # different procedures don't wait on each other's LLM calls (a handful of keys, never pruned)
+    _template_locks = {}
+    _template_locks_guard = threading.Lock()
+    # Template key -> time.monotonic() until which the model's last attempt at it stays rejected
+    _rejected_templates = {}
+
+    def __init__(self, name="Symptom Check-in Agent", api_key=None, cache=None, use_templates=None):
+        super().__init__(name, api_key, cache)
+        self.use_templates = CHECKIN_TEMPLATE_SETTINGS["enabled"] if use_templates is None else use_templates
+        self.templates = get_template_cache() if self.use_templates else None
     
     def process(self, patient):
         """Generate a personalized check-in message for the patient
         
+        With templates enabled the message is filled in locally from a template
+        shared by every patient with the same procedure and history category;
+        only the first patient of each kind costs an LLM call.
+        
         Args:
             patient: The Patient object to generate a check-in message for.
             
         Returns:
             str: A personalized check-in message
         """
-
-        system_message = (
-            f"You are a friendly dental assistant from {DENTAL_PROFESSIONAL['clinic_name']} checking in on patients after their procedure. "
-            "Your tone should be warm, professional, and reassuring. "
-            "Ask specifically about pain, bleeding, swelling, and any concerns that are of similar nature."
-            "Return plain text and not markdown format"
-        )
-
-        prompt = f"""
-        Generate a personalized check-in message for a patient who had {patient.procedure} 
-        on {patient.procedure_date.strftime('%Y-%m-%d')}. 
-        
-        Patient name: {patient.name}
-        Medical history: {patient.medical_history}
-        
-        The message should ask how they're feeling and if they're experiencing any concerning symptoms.
-        
-        Sign the message with "Best regards, {DENTAL_PROFESSIONAL['name']}, {DENTAL_PROFESSIONAL['title']}"
-        and include the clinic name "{DENTAL_PROFESSIONAL['clinic_name']}" in the signature.
-        """
-        
-        # Call the GPT API to generate the check-in message
-        check_in_message = self.call_gpt(prompt, system_message)
+        try:
+            template = self.template_for(patient) if self.use_templates else None
+            if template:
+                check_in_message = fill_template(template, patient)
+            else:
+                prompt, system_message = self.build_prompt(patient)
+                # Call the GPT API to generate the check-in message
+                check_in_message = self.call_gpt(prompt, system_message)
+        except LLMUnavailableError:
+            check_in_message = fallback_checkin(patient)
         
         # Store the message in the patient's latest interaction
         interaction = patient.get_latest_interaction()
@@ -46,3 +82,71 @@ class SymptomCheckInAgent(BaseAgent):
             interaction.check_in_message = check_in_message
         
         return check_in_message
+    
+    def system_message(self, template=False):
+        """The static system message for one-off messages, or for templates."""
+        return TEMPLATE_SYSTEM_MESSAGE if template else SYSTEM_MESSAGE
+    
+    def build_prompt(self, patient):
+        """Build the (prompt, system_message) pair for a one-off personalized message."""
+        prompt = (
+            "Generate a personalized check-in message for this patient.\n\n"
+            f"{patient_context(patient)}"
+        )
+        return prompt, self.system_message()
+    
+    def build_template_prompt(self, procedure, category):
+        """Build the (prompt, system_message) pair for a reusable template."""
+        prompt = (
+            f"Generate a check-in message TEMPLATE for patients who had {procedure}.\n"
+            f"The patient {category_guidance(category)}."
+        )
+        return prompt, self.system_message(template=True)
+    
+    def template_for(self, patient):
+        """Return the cached template for this patient's procedure and history, generating it on a miss.
+        
+        Returns:
+            str: The template, or None if the model didn't produce a usable one.
+        """
+        category = history_category(patient.medical_history)
+        prompt_text = "\n".join(self.build_template_prompt("{procedure}", category))
+        key = template_key(patient.procedure, category, self.settings["model"], prompt_text)
+        template = self.templates.get(key)
+        if template is not None or self._recently_rejected(key):
+            return template
+        
+        with self._template_locks_guard:
+            lock = self._template_locks.setdefault(key, threading.Lock())
+        with lock:
+            # Another thread may have generated (or given up on) it while we waited
+            template = self.templates.get(key)
+            if template is not None or self._recently_rejected(key):
+                return template
+            
+            prompt, system_message = self.build_template_prompt(patient.procedure, category)
+            template = self.call_gpt(prompt, system_message, use_cache=False)
+            if not is_valid_template(template):
+                # Send one-off messages for a while instead of paying for the same failed template per patient
+                self._rejected_templates[key] = time.monotonic() + CHECKIN_TEMPLATE_SETTINGS["rejected_ttl_seconds"]
+                return None
+            self.templates.set(key, template)
+            return template
+    
+    def _recently_rejected(self, key):
+        expires = self._rejected_templates.get(key)
+        return expires is not None and time.monotonic() < expires
+    
+    def warm_templates(self, patients):
+        """Generate the templates a campaign will need ahead of time.
+        
+        Args:
+            patients: Iterable of Patient objects.
+            
+        Returns:
+            int: Number of distinct templates now available.
+        """
+        seen = {}
+        for patient in patients:
+            seen.setdefault((patient.procedure.strip().lower(), history_category(patient.medical_history)), patient)
+        return sum(1 for patient in seen.values() if self.template_for(patient))
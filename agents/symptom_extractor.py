@@ -0,0 +1,300 @@
+import re
+
+WORD_NUMBERS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10
+}
+_NUMBER = r"(\d{1,2}|" + "|".join(WORD_NUMBERS) + r")"
+
+PAIN_NUMBER_PATTERNS = [
+    re.compile(_NUMBER + r"\s*(?:/|out of)\s*10\b"),
+    re.compile(r"\bpain(?: level)?(?: is| was| of| at)?(?: about| around| like| maybe| roughly)?(?: a| an)?\s+" + _NUMBER + r"\b"),
+    re.compile(r"\b(?:about|around|roughly|maybe) (?:a |an )?" + _NUMBER + r"\b(?! (?:days?|weeks?|hours?|times?)\b)"),
+]
+
+# Phrase -> pain level, checked in order (most severe first)
+PAIN_PHRASES = [
+    (re.compile(r"\b(excruciating|unbearable|can barely function|everything hurts|worst pain)\b"), 9),
+    (re.compile(r"\b(a lot of pain|a ton of pain|so much pain|severe pain|really hurts|hurts (?:so|really) bad|terrible pain|very painful|in (?:a lot of )?pain)\b"), 7),
+    (re.compile(r"\b(hurts|painful|aching|aches|throbbing)\b"), 5),
+    (re.compile(r"\b(a (?:little|bit) sore|slightly sore|little sore|bit sore|mild pain|tender|sore)\b"), 3),
+    (re.compile(r"\b(no pain|not in pain|pain free|pain-free|doesn'?t hurt|not hurting)\b"), 0),
+]
+
+# "has not stopped", "hasn't really stopped", "didn't stop": still going, so never read as "none"
+NEGATED_STOP = r"(?:not|never|hasn'?t|haven'?t|hadn'?t|didn'?t|doesn'?t|won'?t|isn'?t)(?: \w+)? stop(?:ped|ping)?"
+
+SEVERITY_WORDS = [
+    ("severe", r"severe|major|significant|a lot|lots of|a ton|heavy|heavily|everywhere|yet to stop|" + NEGATED_STOP + r"|more than ever|really bad|very bad|huge|massive|terrible|quite a bit"),
+    ("moderate", r"moderate|pretty|quite|still|fairly|noticeable"),
+    ("mild", r"mild|a (?:little )?bit|a little|little|slight(?:ly)?|some|minor|barely|spotting|a touch"),
+]
+
+SYMPTOM_TERMS = {
+    "bleeding": r"bleed\w*|bled|blood\w*",
+    "swelling": r"swell\w*|swollen|puffy|face is huge",
+}
+
+NEGATIONS = re.compile(
+    r"\b(no|not|without|hasn'?t|haven'?t|isn'?t|stopped|no more|zero)\b[\w\s']{0,15}$"
+)
+STOPPED = r"(?:has |had |have )?(?:mostly |finally |now )?stopped"
+
+FEVER_TERMS = re.compile(r"\b(fever\w*|temperature|chills|hot and cold)\b")
+
+MEDICATIONS = [
+    "ibuprofen", "advil", "motrin", "tylenol", "acetaminophen", "paracetamol", "aspirin",
+    "naproxen", "aleve", "amoxicillin", "penicillin", "clindamycin", "antibiotics?",
+    "codeine", "hydrocodone", "vicodin", "oxycodone", "percocet", "tramadol",
+    "chlorhexidine", "(?:prescribed |my )?pain (?:medication|meds|killers?)", "painkillers?"
+]
+MEDICATION_PATTERN = re.compile(r"\b(" + "|".join(MEDICATIONS) + r")\b")
+
+OTHER_SYMPTOMS = {
+    "numbness": r"numb\w*|tingl\w*",
+    "bad taste": r"bad taste|foul taste|weird taste",
+    "bad breath": r"bad breath",
+    "difficulty swallowing": r"(?:hard|difficult\w*|trouble|can'?t) (?:to )?swallow\w*",
+    "difficulty opening mouth": r"(?:can'?t|trouble|hard to) open",
+    "pus": r"\bpus\b|discharge",
+    "nausea": r"nause\w*|throw(?:ing)? up|vomit\w*",
+    "dizziness": r"dizz\w*|lightheaded",
+    "headache": r"headache",
+    "earache": r"ear ?ache|ear pain",
+    "lost restoration": r"(?:cap|crown|filling) (?:fell|came|has come) (?:off|out)",
+    "pain when chewing": r"hurts? when (?:i )?chew\w*|pain when (?:i )?chew\w*",
+}
+
+POSITIVE = re.compile(
+    r"\b(good|fine|great|okay|ok|well|better|no (?:real )?(?:issues|troubles?|problems|complaints|concerns)|"
+    r"all good|thanks?|thank you|healing)\b"
+)
+# A negator up to two words before a positive word flips it: "not good", "i am not okay", "don't feel great"
+NEGATED_POSITIVE = re.compile(r"(?:\b(?:not|never|no longer)|n't)(?: \w+){0,2} ?$")
+CONCERNED = re.compile(r"\b(concern\w*|worr\w*|terrified|scared|afraid|anxious|nervous|help)\b")
+NEGATIVE = re.compile(r"\b(terrible|awful|horrible|miserable|bad|wrong)\b")
+
+# Words the lexicon understands; anything else lowers confidence
+KNOWN_WORDS = set("""
+a about actually after all also am amount an and any anything are around as at back be been bit but
+can chew chewing check checking day days did do doing dont don't else even ever feel feeling feels
+few for from had has have having here hey hi i i'm im in is it it's its just last like little lot
+lots mostly my no not now of off on operation or out pretty quite really reaching same since so
+some still than that thats that's the there thing this through time to today too up very was
+week weeks were what when with yea yeah yes yesterday you your
+took take taking morning evening night tonight noticed think rinsed rinse brush brushing
+tooth teeth mouth cheek gum gums jaw side area site issues
+""".split())
+
+_TOKEN = re.compile(r"[a-z']+")
+
+
+def _to_int(token):
+    if token.isdigit():
+        return int(token)
+    return WORD_NUMBERS.get(token)
+
+
+class LocalSymptomExtractor:
+    """Regex/lexicon extractor producing the ResponseAnalyzerAgent JSON schema locally.
+
+    It is meant as a zero-latency pre-pass: short, unambiguous replies ("Fine",
+    "pain is about a 6, took ibuprofen") are answered here, and the returned
+    confidence tells the caller when to fall back to the LLM instead.
+    """
+
+    def extract(self, response_text):
+        """Extract symptoms from a patient reply.
+
+        Args:
+            response_text: The text response from the patient.
+
+        Returns:
+            tuple: (extracted_symptoms dict, confidence between 0 and 1).
+        """
+        text = " ".join((response_text or "").lower().replace("’", "'").split())
+        explained = set()
+        penalty = 0.0
+
+        pain_level, pain_explicit = self._pain(text, explained)
+        bleeding, bleeding_unsure = self._severity(text, "bleeding", explained)
+        swelling, swelling_unsure = self._severity(text, "swelling", explained)
+        fever = self._fever(text, explained)
+        medication = self._medication(text, explained)
+        other_symptoms = self._other_symptoms(text, explained)
+        sentiment, concerns = self._sentiment(response_text or "", text, explained)
+
+        mentions_symptom = (
+            pain_level is not None or bleeding != "not mentioned" or swelling != "not mentioned"
+            or fever or other_symptoms
+        )
+
+        if pain_level is None:
+            # Pure "doing fine" replies are read as pain 0 like the LLM few-shot example
+            pain_level = 0 if (sentiment == "positive" and not mentions_symptom) else "not mentioned"
+        if not mentions_symptom and sentiment == "positive":
+            bleeding = "none" if bleeding == "not mentioned" else bleeding
+            swelling = "none" if swelling == "not mentioned" else swelling
+
+        if bleeding_unsure or swelling_unsure:
+            penalty += 0.2
+        if mentions_symptom and not pain_explicit and pain_level not in (0, "not mentioned"):
+            penalty += 0.1
+        if "?" in text:
+            penalty += 0.1
+        if sentiment in ("negative", "concerned") and not mentions_symptom:
+            penalty += 0.3
+
+        tokens = _TOKEN.findall(text)
+        if not tokens:
+            return self._result(pain_level, bleeding, swelling, fever, medication,
+                                other_symptoms, concerns, sentiment), 0.0
+
+        unknown = [
+            token for token in tokens
+            if token not in KNOWN_WORDS and not any(token in phrase for phrase in explained)
+        ]
+        coverage = 1 - len(unknown) / len(tokens)
+        if len(tokens) > 40:
+            penalty += 0.2
+
+        confidence = max(0.0, min(1.0, coverage - penalty))
+        if not mentions_symptom and sentiment == "neutral":
+            # Nothing recognisable at all ("hello", "test message")
+            confidence = min(confidence, 0.3)
+
+        return self._result(pain_level, bleeding, swelling, fever, medication,
+                            other_symptoms, concerns, sentiment), round(confidence, 3)
+
+    def _result(self, pain_level, bleeding, swelling, fever, medication, other_symptoms, concerns, sentiment):
+        return {
+            "pain_level": pain_level,
+            "bleeding": bleeding,
+            "swelling": swelling,
+            "fever": fever,
+            "medication_taken": medication,
+            "other_symptoms": other_symptoms,
+            "patient_concerns": concerns,
+            "overall_sentiment": sentiment
+        }
+
+    def _pain(self, text, explained):
+        for pattern in PAIN_NUMBER_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                value = _to_int(match.group(1))
+                if value is not None and 0 <= value <= 10:
+                    explained.add(match.group(0))
+                    return value, True
+
+        for pattern, level in PAIN_PHRASES:
+            match = pattern.search(text)
+            if match:
+                explained.add(match.group(0))
+                return level, False
+
+        if re.search(r"\bpain\b", text):
+            explained.add("pain")
+            return None, False
+        return None, False
+
+    def _severity(self, text, symptom, explained):
+        """Return (severity, unsure) for bleeding/swelling."""
+        term = SYMPTOM_TERMS[symptom]
+        match = re.search(r"\b(" + term + r")", text)
+        if not match:
+            return "not mentioned", False
+
+        explained.add(match.group(1))
+        start, end = match.span()
+        before = text[max(0, start - 40):start]
+        after = text[end:end + 45]
+        # Stop the window at the next sentence so other symptoms' words don't leak in
+        before = re.split(r"[.!?;]", before)[-1]
+        after = re.split(r"[.!?;]", after)[0]
+
+        window = before + " " + match.group(1) + " " + after
+        negated_stop = re.search(r"\b" + NEGATED_STOP + r"\b", window)
+        if not negated_stop and (NEGATIONS.search(before) or re.match(r"\s*(?:\w+\s){0,2}" + STOPPED, after)):
+            explained.update(("no", "not", "stopped"))
+            return "none", False
+
+        for severity, words in SEVERITY_WORDS:
+            severity_match = re.search(r"\b(" + words + r")\b", window)
+            if severity_match:
+                explained.add(severity_match.group(1))
+                # Past tense ("bled a bit last week") is read as mild but not certain
+                return severity, symptom == "bleeding" and match.group(1) == "bled" and severity != "mild"
+
+        # Mentioned with no severity cue ("bleeding!")
+        return "moderate", True
+
+    def _fever(self, text, explained):
+        match = FEVER_TERMS.search(text)
+        if not match:
+            return False
+        explained.add(match.group(1))
+        before = text[max(0, match.start() - 25):match.start()]
+        if NEGATIONS.search(before):
+            return False
+        return True
+
+    def _medication(self, text, explained):
+        found = []
+        for match in MEDICATION_PATTERN.finditer(text):
+            explained.add(match.group(1))
+            before = text[max(0, match.start() - 20):match.start()]
+            if re.search(r"\b(no|not|haven'?t|didn'?t)\b", before):
+                continue
+            if match.group(1) not in found:
+                found.append(match.group(1))
+        return ", ".join(found) if found else "none"
+
+    def _other_symptoms(self, text, explained):
+        found = []
+        for name, pattern in OTHER_SYMPTOMS.items():
+            match = re.search(pattern, text)
+            if match:
+                explained.add(match.group(0))
+                found.append(name)
+        return found
+
+    def _sentiment(self, original, text, explained):
+        concerned = CONCERNED.search(text)
+        negative = NEGATIVE.search(text)
+        positive = None
+        for match in POSITIVE.finditer(text):
+            explained.add(match.group(1))
+            negator = NEGATED_POSITIVE.search(text[max(0, match.start() - 30):match.start()])
+            if negator:
+                # "not good" is a complaint, and must not be read as "doing fine"
+                explained.add(negator.group(0))
+                negative = negative or match
+            elif positive is None:
+                positive = match
+        for match in (concerned, negative):
+            if match:
+                explained.add(match.group(1))
+
+        concerns = "none"
+        if concerned or "?" in text:
+            # Quote the first sentence that carries the concern or question
+            sentences = re.split(r"(?<=[.!?])\s+", original.strip())
+            for sentence in sentences:
+                lowered = sentence.lower()
+                if CONCERNED.search(lowered) or "?" in sentence:
+                    concerns = sentence.strip()
+                    break
+
+        if concerned:
+            return "concerned", concerns
+        if negative:
+            return "negative", concerns
+        if positive:
+            return "positive", concerns
+        return "neutral", concerns
+
+
+def extract_symptoms(response_text):
+    """Convenience wrapper returning (extracted_symptoms, confidence)."""
+    return LocalSymptomExtractor().extract(response_text)
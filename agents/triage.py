@@ -0,0 +1,134 @@
+from .base_agent import BaseAgent
+from .schemas import TriagePayload, StructuredOutputError
+from .prompts import CARE_SIGNATURE, system_prompt, patient_context
+from .resilience import LLMUnavailableError
+from .symptom_extractor import LocalSymptomExtractor
+from .risk_rules import RiskRulesEngine
+from .fallbacks import FALLBACK_PATH, fallback_risk, fallback_care_instructions, fallback_summary
+from config import DENTAL_PROFESSIONAL
+
+SYSTEM_MESSAGE = system_prompt(
+    f"You are {DENTAL_PROFESSIONAL['name']}, {DENTAL_PROFESSIONAL['title']} at {DENTAL_PROFESSIONAL['clinic_name']}, "
+    "triaging a patient's reply to a post-operative check-in. In one response you must:\n"
+    "1. extracted_symptoms: extract pain (0-10, null if not mentioned), bleeding and swelling "
+    "(none/mild/moderate/severe/not mentioned), fever, medication taken, other symptoms, concerns and sentiment. "
+    "Infer severity from context clues like 'significant', 'a lot', 'very', 'terrible'.\n"
+    "2. risk_assessment: classify the condition as Low, Medium or High risk considering the procedure, "
+    "time since the procedure and symptom severity, with a clear justification.\n"
+    "3. care_instructions: plain text (no markdown) written directly to the patient in a clear, compassionate tone. "
+    "For high risk emphasize contacting the clinic immediately, for medium risk give monitoring instructions, "
+    "for low risk give reassurance and general care advice. "
+    f"Sign with \"{CARE_SIGNATURE}\".\n"
+    "4. summary: a professional, concise clinical summary for the patient's record with sections for "
+    "symptoms, assessment, care provided and follow-up recommendations.",
+    (
+        "If the risk level is High, the care instructions must include this link for booking an "
+        f"immediate appointment: {DENTAL_PROFESSIONAL['checkuplink']}"
+    ) if 'checkuplink' in DENTAL_PROFESSIONAL else ""
+)
+
+class TriageAgent(BaseAgent):
+    """Agent that does symptom extraction, risk assessment, care instructions and the clinical summary in one call.
+
+    This is the "combined" triage mode: one schema-constrained completion instead
+    of four sequential round-trips that each re-send the patient context. Results
+    are written back onto the PatientInteraction the same way the separate agents do.
+    """
+
+    stage = "triage"
+
+    def __init__(self, name="Triage Agent", api_key=None, cache=None):
+        super().__init__(name, api_key, cache)
+
+    def process(self, patient, response_text):
+        """Triage a patient's reply in a single LLM call.
+
+        Args:
+            patient: The Patient object.
+            response_text: The text response from the patient.
+
+        Returns:
+            dict: extracted_symptoms, risk_assessment, care_instructions and summary.
+        """
+        prompt, system_message = self.build_prompt(patient, response_text)
+        try:
+            payload = self.call_gpt_structured(prompt, TriagePayload, system_message)
+        except StructuredOutputError as e:
+            return self.handle_result(patient, response_text, None, e)
+        except LLMUnavailableError:
+            return self.fallback(patient, response_text)
+        return self.handle_result(patient, response_text, payload)
+
+    async def aprocess(self, patient, response_text):
+        """Async variant of process() used by the triage pipeline."""
+        prompt, system_message = self.build_prompt(patient, response_text)
+        try:
+            payload = await self.acall_gpt_structured(prompt, TriagePayload, system_message)
+        except StructuredOutputError as e:
+            return self.handle_result(patient, response_text, None, e)
+        except LLMUnavailableError:
+            return self.fallback(patient, response_text)
+        return self.handle_result(patient, response_text, payload)
+
+    def build_prompt(self, patient, response_text):
+        """Build the (prompt, system_message) pair for combined triage."""
+        prompt = f"{patient_context(patient)}\n\nPatient's Response: \"{response_text}\""
+        return prompt, SYSTEM_MESSAGE
+
+    def handle_result(self, patient, response_text, payload, error=None):
+        """Store each part of the validated TriagePayload on the patient's latest interaction."""
+        if payload is not None:
+            result = payload.as_dict()
+        else:
+            result = {
+                "extracted_symptoms": {
+                    "error": "Failed to parse response",
+                    "raw_response": error.raw_response if error else None
+                },
+                "risk_assessment": {
+                    "risk_level": "Unknown",
+                    "justification": "Error in risk assessment",
+                    "error": "Failed to parse response"
+                },
+                "care_instructions": "",
+                "summary": ""
+            }
+        result["risk_assessment"]["decision_path"] = "triage"
+        self._store(patient, response_text, result, "triage", "triage")
+        return result
+
+    def fallback(self, patient, response_text):
+        """Triage locally when the API is unavailable: local extraction, risk rules, standard texts."""
+        extracted_symptoms, confidence = LocalSymptomExtractor().extract(response_text)
+        rules_engine = RiskRulesEngine.from_config()
+        match = rules_engine.evaluate(extracted_symptoms) if rules_engine else None
+        if match:
+            risk_assessment = {
+                "risk_level": match["risk_level"],
+                "justification": match["justification"],
+                "decision_path": f"rule:{match['rule']}"
+            }
+        else:
+            risk_assessment = fallback_risk(extracted_symptoms)
+        care_instructions = fallback_care_instructions(risk_assessment)
+        result = {
+            "extracted_symptoms": extracted_symptoms,
+            "risk_assessment": risk_assessment,
+            "care_instructions": care_instructions,
+            "summary": fallback_summary(patient, extracted_symptoms, risk_assessment, care_instructions)
+        }
+        self._store(patient, response_text, result, f"{FALLBACK_PATH}:{confidence:.2f}", risk_assessment["decision_path"])
+        return result
+
+    def _store(self, patient, response_text, result, extraction_path, decision_path):
+        risk_assessment = result["risk_assessment"]
+        interaction = patient.get_latest_interaction()
+        if interaction:
+            interaction.patient_response = response_text
+            interaction.extracted_symptoms = result["extracted_symptoms"]
+            interaction.symptom_extraction_path = extraction_path
+            interaction.risk_level = risk_assessment.get("risk_level", "Unknown")
+            interaction.risk_justification = risk_assessment.get("justification", "")
+            interaction.risk_decision_path = decision_path
+            interaction.care_instructions = result.get("care_instructions", "")
+            interaction.summary = result.get("summary", "")
@@ -0,0 +1,175 @@
+"""Compare the segment-aware SMS splitter against the original character-count splitter.
+
+Builds long care-instruction messages (plain ASCII, LLM-style typography with
+curly quotes and bullets, one with an emoji, one unbroken paragraph containing
+'|') at several lengths, splits each with the original 1500-character
+`_split_message` and with services.sms_segments.split_message, and reports
+parts, billable segments (headers included) and split time.
+
+Usage:
+    python -m benchmarks.bench_sms_split [--repeat 200] [--max-segments N]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.sms_segments import PART_HEADER, segment_count, smart_encode, split_message
+
+CARE_INSTRUCTIONS = [
+    "Thank you for letting us know how you're feeling after your wisdom tooth extraction. "
+    "Some discomfort and mild swelling are normal for the first 48 to 72 hours.",
+    "Pain management: Take ibuprofen 400-600 mg every 6 hours with food, unless your doctor told you otherwise. "
+    "You can alternate with acetaminophen if needed. Don't exceed the daily maximum on the label.",
+    "Bleeding: Some oozing is expected. Bite firmly on a folded gauze pad for 30 minutes. "
+    "If bleeding continues, try a moistened black tea bag. Avoid spitting, rinsing hard or drinking through a straw.",
+    "Swelling: Apply an ice pack to your cheek, 20 minutes on and 20 minutes off, for the first day. "
+    "After 48 hours, switch to warm compresses. Keep your head elevated when lying down.",
+    "Diet: Stick to soft, cool foods such as yogurt, smoothies (eaten with a spoon), mashed potatoes and soup that isn't too hot. "
+    "Avoid crunchy, spicy or very hot foods until the area heals.",
+    "Oral hygiene: Starting tomorrow, rinse gently with warm salt water (half a teaspoon of salt in a glass of water) after meals. "
+    "Brush your other teeth normally but stay away from the extraction site.",
+    "Call us right away if you have a fever over 101F, pus, bleeding that won't stop, numbness that lasts more than a day, "
+    "or pain that gets worse after day three - these can be signs of infection or dry socket.",
+]
+
+LLM_STYLE = {
+    "'": "’",
+    " - ": " — ",
+    "Pain management:": "• Pain management:",
+    "Bleeding:": "• Bleeding:",
+    "Swelling:": "• Swelling:",
+    "Diet:": "• Diet:",
+    "Oral hygiene:": "• Oral hygiene:",
+}
+
+
+def build_message(copies, style):
+    text = "\n\n".join(CARE_INSTRUCTIONS * copies)
+    if style in ("llm", "emoji"):
+        for plain, fancy in LLM_STYLE.items():
+            text = text.replace(plain, fancy)
+    if style == "emoji":
+        text += "\n\nFeel better soon! \U0001F60A"
+    if style == "pipe":
+        # One long paragraph, so the old splitter falls through to its '|'-based sentence split
+        text = text.replace("Diet:", "Diet | food:").replace("\n\n", " ")
+    return text
+
+
+def legacy_split(message, max_length):
+    """SMSService._split_message as it was before the segment-aware splitter."""
+    if len(message) <= max_length:
+        return [message]
+
+    parts = []
+
+    paragraphs = message.split('\n\n')
+    current_part = ""
+
+    for paragraph in paragraphs:
+        if len(current_part) + len(paragraph) + 2 > max_length:
+            if current_part:
+                parts.append(current_part.strip())
+            current_part = paragraph
+        else:
+            if current_part:
+                current_part += "\n\n" + paragraph
+            else:
+                current_part = paragraph
+
+    if current_part:
+        parts.append(current_part.strip())
+
+    final_parts = []
+    for part in parts:
+        if len(part) <= max_length:
+            final_parts.append(part)
+        else:
+            sentences = part.replace('. ', '.|').replace('! ', '!|').replace('? ', '?|').split('|')
+            current_part = ""
+
+            for sentence in sentences:
+                if len(current_part) + len(sentence) + 1 > max_length:
+                    if current_part:
+                        final_parts.append(current_part.strip())
+                    current_part = sentence
+                else:
+                    if current_part:
+                        current_part += " " + sentence
+                    else:
+                        current_part = sentence
+
+            if current_part:
+                final_parts.append(current_part.strip())
+
+    result = []
+    for part in final_parts:
+        if len(part) <= max_length:
+            result.append(part)
+        else:
+            for i in range(0, len(part), max_length):
+                result.append(part[i:i+max_length])
+
+    return result
+
+
+def legacy_bodies(message):
+    """Bodies the old send_message() would have sent (split at 1500 characters, then headers)."""
+    if len(message) <= 1500:
+        return [message]
+    parts = legacy_split(message, 1500)
+    return [f"(Part {i+1}/{len(parts)}) " + part if len(parts) > 1 else part for i, part in enumerate(parts)]
+
+
+def new_bodies(message, max_segments, smart):
+    if smart:
+        message = smart_encode(message)
+    parts = split_message(message, max_segments)
+    if len(parts) == 1:
+        return parts
+    return [PART_HEADER.format(index=i + 1, total=len(parts)) + part for i, part in enumerate(parts)]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        bodies = fn()
+    return bodies, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="splits per message and implementation")
+    parser.add_argument("--max-segments", type=int, default=None,
+                        help="segment cap per part (default: as many as fit in 1600 characters)")
+    args = parser.parse_args()
+
+    implementations = [
+        ("legacy", lambda message: legacy_bodies(message)),
+        ("segments", lambda message: new_bodies(message, args.max_segments, smart=False)),
+        ("segments+smart", lambda message: new_bodies(message, args.max_segments, smart=True)),
+    ]
+
+    print(f"{'message':<14} {'chars':>6}  {'implementation':<15} {'parts':>5} {'segments':>8} {'split us':>9}")
+    totals = {name: 0 for name, _ in implementations}
+    for style in ("plain", "llm", "emoji", "pipe"):
+        for copies in (1, 3, 10):
+            message = build_message(copies, style)
+            for name, split in implementations:
+                bodies, elapsed = timed(lambda: split(message), args.repeat)
+                segments = sum(segment_count(body) for body in bodies)
+                totals[name] += segments
+                # Every body must fit Twilio's 1600-character limit
+                assert all(len(body) <= 1600 for body in bodies), name
+                print(f"{style + ' x' + str(copies):<14} {len(message):>6}  {name:<15} {len(bodies):>5} "
+                      f"{segments:>8} {elapsed * 1e6:>9.1f}")
+        print()
+
+    print("Total segments: " + "   ".join(f"{name} {count}" for name, count in totals.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Compare the local symptom extractor against ResponseAnalyzerAgent's LLM path.
+
+Runs every message in patient_responses.json through LocalSymptomExtractor and
+reports per-message latency and confidence, then checks the hand-labelled
+EVAL_CASES (negations and other replies the lexicon must not misread). With --llm (and OPENAI_API_KEY set)
+the same messages also go through the LLM, and the script reports latency plus
+field-by-field agreement, both overall and for the messages the local
+extractor would have answered on its own.
+
+Usage:
+    python -m benchmarks.bench_symptom_extractor [--llm] [--file patient_responses.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from config import SYMPTOM_EXTRACTOR_SETTINGS
+from models.patient import Patient
+from agents.symptom_extractor import LocalSymptomExtractor
+
+FIELDS = ("pain_level", "bleeding", "swelling", "fever")
+
+# (message, expected fields, answered locally?) where None means either is acceptable
+EVAL_CASES = [
+    ("Fine", {"pain_level": 0, "bleeding": "none", "overall_sentiment": "positive"}, True),
+    ("doing well thanks", {"pain_level": 0, "overall_sentiment": "positive"}, True),
+    ("not good", {"pain_level": "not mentioned", "overall_sentiment": "negative"}, False),
+    ("I am not okay", {"pain_level": "not mentioned", "bleeding": "not mentioned", "overall_sentiment": "negative"}, False),
+    ("don't feel great", {"overall_sentiment": "negative"}, False),
+    ("no longer feeling good", {"overall_sentiment": "negative"}, False),
+    ("never felt well since", {"overall_sentiment": "negative"}, False),
+    ("no bleeding, feeling good", {"bleeding": "none", "overall_sentiment": "positive"}, None),
+    ("the bleeding has not stopped", {"bleeding": "severe"}, None),
+    ("it hasn't stopped bleeding", {"bleeding": "severe"}, None),
+    ("bleeding hasn't really stopped", {"bleeding": "severe"}, None),
+    ("the bleeding has stopped", {"bleeding": "none"}, True),
+    ("pain is about a 6, took ibuprofen", {"pain_level": 6, "medication_taken": "ibuprofen"}, True),
+]
+
+
+def load_messages(path):
+    with open(path, 'r') as f:
+        db = json.load(f)
+    messages = [response["message"] for data in db.values() for response in data["responses"]]
+    # Duplicates would only re-measure the same thing
+    return list(dict.fromkeys(messages))
+
+
+def time_local(extractor, messages, repeat):
+    results = {}
+    for message in messages:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            symptoms, confidence = extractor.extract(message)
+        results[message] = (symptoms, confidence, (time.perf_counter() - start) / repeat)
+    return results
+
+
+def time_llm(messages):
+    # Imported lazily so the local-only benchmark runs without an API key
+    from agents.response_analyzer import ResponseAnalyzerAgent
+    from agents.schemas import SymptomPayload, StructuredOutputError
+
+    analyzer = ResponseAnalyzerAgent()
+    patient = Patient(
+        id="BENCH",
+        name="Benchmark Patient",
+        procedure="Wisdom Tooth Extraction",
+        procedure_date=datetime.now(),
+        contact_info="",
+        medical_history="No significant medical history."
+    )
+    patient.add_interaction()
+
+    results = {}
+    for message in messages:
+        prompt, system_message = analyzer.build_prompt(patient, message)
+        start = time.perf_counter()
+        try:
+            payload = analyzer.call_gpt_structured(prompt, SymptomPayload, system_message, use_cache=False)
+            symptoms = payload.as_dict()
+        except StructuredOutputError:
+            symptoms = {"error": "Failed to parse response"}
+        results[message] = (symptoms, time.perf_counter() - start)
+    return results
+
+
+def check_eval_cases(extractor, threshold):
+    """Return a description of every EVAL_CASES expectation the extractor misses."""
+    failures = []
+    for message, expected, local in EVAL_CASES:
+        symptoms, confidence = extractor.extract(message)
+        for field, value in expected.items():
+            if symptoms[field] != value:
+                failures.append(f"{message!r}: {field} is {symptoms[field]!r}, expected {value!r}")
+        if local is not None and (confidence >= threshold) != local:
+            failures.append(f"{message!r}: confidence {confidence:.2f} should be "
+                            f"{'at least' if local else 'below'} {threshold}")
+    return failures
+
+
+def field_agrees(field, local_value, llm_value):
+    if field == "pain_level":
+        try:
+            return abs(float(local_value) - float(llm_value)) <= 1
+        except (TypeError, ValueError):
+            return str(local_value).lower() == str(llm_value).lower()
+    if field == "fever":
+        return bool(local_value) == bool(llm_value)
+    # "none" and "not mentioned" mean the same thing for triage purposes
+    normalize = lambda value: "none" if str(value).lower() in ("none", "not mentioned") else str(value).lower()
+    return normalize(local_value) == normalize(llm_value)
+
+
+def agreement(pairs):
+    if not pairs:
+        return {}
+    return {
+        field: sum(field_agrees(field, local.get(field), llm.get(field)) for local, llm in pairs) / len(pairs)
+        for field in FIELDS
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default="patient_responses.json")
+    parser.add_argument("--llm", action="store_true", help="also call the LLM and report agreement")
+    parser.add_argument("--repeat", type=int, default=200, help="local extraction repetitions per message")
+    args = parser.parse_args()
+
+    load_dotenv()
+    threshold = SYMPTOM_EXTRACTOR_SETTINGS["confidence_threshold"]
+    messages = load_messages(args.file)
+    local = time_local(LocalSymptomExtractor(), messages, args.repeat)
+
+    print(f"{'conf':>5}  {'local us':>8}  message")
+    for message, (symptoms, confidence, elapsed) in local.items():
+        marker = "*" if confidence >= threshold else " "
+        print(f"{confidence:5.2f}{marker} {elapsed * 1e6:8.1f}  {message[:70]!r}")
+
+    local_times = [elapsed for _, _, elapsed in local.values()]
+    confident = [message for message, (_, confidence, _) in local.items() if confidence >= threshold]
+    print()
+    print(f"Messages: {len(messages)}   answered locally (conf >= {threshold}): {len(confident)}")
+    print(f"Local latency  p50 {percentile(local_times, 50) * 1e6:.1f} us   "
+          f"p95 {percentile(local_times, 95) * 1e6:.1f} us")
+
+    failures = check_eval_cases(LocalSymptomExtractor(), threshold)
+    print(f"Eval cases: {len(EVAL_CASES)}   failing: {len(failures)}")
+    for failure in failures:
+        print(f"  {failure}")
+
+    if not args.llm:
+        return
+
+    llm = time_llm(messages)
+    llm_times = [elapsed for _, elapsed in llm.values()]
+    print(f"LLM latency    p50 {percentile(llm_times, 50) * 1e3:.0f} ms   "
+          f"p95 {percentile(llm_times, 95) * 1e3:.0f} ms   mean {statistics.mean(llm_times) * 1e3:.0f} ms")
+
+    all_pairs = [(local[m][0], llm[m][0]) for m in messages if "error" not in llm[m][0]]
+    confident_pairs = [(local[m][0], llm[m][0]) for m in confident if "error" not in llm[m][0]]
+    for label, pairs in (("all messages", all_pairs), ("confident only", confident_pairs)):
+        scores = agreement(pairs)
+        if scores:
+            print(f"Agreement ({label}, n={len(pairs)}): " +
+                  "  ".join(f"{field} {score:.0%}" for field, score in scores.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Benchmark the webhook ingest path (POST /sms) under concurrent Twilio callbacks.
+
+For every combination of response store backend, existing store size and
+transport, a fresh store (pre-filled with that many responses) and triage
+queue are swapped into sms_webhook, and thousands of form-encoded
+Twilio-style callbacks are fired at the app from a thread pool, either
+through Flask's test client or over HTTP to a threaded Werkzeug server.
+Each run reports requests/sec, latency percentiles, non-200 responses, and
+messages lost or duplicated in the store and in the triage queue (every body
+is unique, so each one must be stored once and queued once; with
+--redeliver, that fraction of callbacks is sent twice with the same
+MessageSid, as Twilio does on a timeout, and must still be stored and queued
+once).
+
+Request logging goes to a file in the temporary directory at the app's own
+level, so its cost is measured without flooding the terminal.
+
+The checked-in baseline (benchmarks/results/webhook_ingest_baseline.json) was
+produced with the defaults; compare a storage change against it with:
+
+    python -m benchmarks.bench_webhook_ingest --compare benchmarks/results/webhook_ingest_baseline.json
+
+Usage:
+    python -m benchmarks.bench_webhook_ingest [--requests 1000] [--concurrency 16]
+        [--backends log,json] [--sizes 0,1000,10000] [--transports test_client,server]
+        [--redeliver 0.05] [--output results.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import http.client
+import urllib.parse
+from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import STORAGE_SETTINGS, QUEUE_SETTINGS
+
+TRANSPORTS = ("test_client", "server")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def prefill(backend, path, size, rng):
+    """Write `size` existing responses spread over size // 5 patients."""
+    from services.response_store import create_store
+
+    patients = max(1, size // 5)
+    if backend == "json":
+        db = {}
+        for index in range(size):
+            phone = f"+1444{rng.randrange(patients):07d}"
+            entry = db.setdefault(phone, {"responses": [], "processed": True})
+            entry["responses"].append({"timestamp": datetime.now().isoformat(), "message": f"earlier reply {index}"})
+        with open(path, 'w') as f:
+            json.dump(db, f, indent=2)
+        return
+
+    store = create_store(backend, path, fsync=False)
+    for index in range(size):
+        store.append_response(f"+1444{rng.randrange(patients):07d}", f"earlier reply {index}")
+    store.close()
+
+
+def callbacks(run_id, count, redeliver, rng):
+    """Form bodies for `count` unique messages, plus redeliveries of some of them."""
+    forms = []
+    for index in range(count):
+        forms.append({
+            "MessageSid": f"SMBENCH{run_id}{index:07d}",
+            "AccountSid": "ACbenchmark",
+            "From": f"+1555{rng.randrange(500):07d}",
+            "To": "+15550000000",
+            "Body": f"bench {run_id} #{index}: pain is {rng.randint(0, 10)}/10, some swelling",
+            "NumMedia": "0",
+            "NumSegments": "1",
+            "SmsStatus": "received",
+            "ApiVersion": "2010-04-01"
+        })
+    forms += [dict(form) for form in rng.sample(forms, int(count * redeliver))]
+    rng.shuffle(forms)
+    return forms
+
+
+def post_test_client(app, forms, concurrency):
+    local = threading.local()
+
+    def post(form):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        start = time.perf_counter()
+        response = local.client.post("/sms", data=form)
+        return response.status_code, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(post, forms))
+
+
+def post_server(app, forms, concurrency):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    port = server.socket.getsockname()[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def post(form):
+        body = urllib.parse.urlencode(form)
+        start = time.perf_counter()
+        # Twilio opens a new connection per callback
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        try:
+            connection.request("POST", "/sms", body, {
+                "Content-Type": "application/x-www-form-urlencoded",
+                "X-Twilio-Signature": "benchmark",
+                "User-Agent": "TwilioProxy/1.1"
+            })
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except OSError:
+            status = 0
+        finally:
+            connection.close()
+        return status, time.perf_counter() - start
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(post, forms))
+    finally:
+        server.shutdown()
+
+
+def run(sms_webhook, backend, size, transport, args, run_id):
+    from services.response_store import create_store
+    from services.job_queue import TriageQueue
+
+    rng = random.Random(f"{args.seed}:{backend}:{size}:{transport}")
+    with tempfile.TemporaryDirectory(prefix="followcare-ingest-") as directory:
+        path = os.path.join(directory, "responses.json" if backend == "json" else "responses.log")
+        prefill(backend, path, size, rng)
+        kwargs = {} if backend == "json" else {"fsync": args.fsync}
+        store = create_store(backend, path, **kwargs)
+        queue = TriageQueue(os.path.join(directory, "queue.sqlite3")) if args.queue else None
+        sms_webhook.patient_store = store
+        sms_webhook.triage_queue = queue
+
+        forms = callbacks(run_id, args.requests, args.redeliver, rng)
+        post = post_test_client if transport == "test_client" else post_server
+        start = time.perf_counter()
+        outcomes = post(sms_webhook.app, forms, args.concurrency)
+        wall = time.perf_counter() - start
+
+        delivered = Counter(form["Body"] for form, (status, _) in zip(forms, outcomes) if status == 200)
+        stored = Counter(
+            response["message"]
+            for data in store.all().values() for response in data["responses"]
+            if response["message"].startswith(f"bench {run_id} ")
+        )
+        sent = {form["Body"] for form in forms}
+        result = {
+            "backend": backend,
+            "existing_responses": size,
+            "transport": transport,
+            "requests": len(forms),
+            "concurrency": args.concurrency,
+            "errors": sum(1 for status, _ in outcomes if status != 200),
+            "lost": sum(1 for body in delivered if stored[body] == 0),
+            # Without the queue there is no MessageSid dedupe, and every delivery appends
+            "duplicated": sum(1 for body in sent if stored[body] > (1 if queue is not None else delivered[body])),
+            "requests_per_second": round(len(forms) / wall, 1),
+            "p50_ms": round(percentile([elapsed for _, elapsed in outcomes], 50) * 1000, 2),
+            "p95_ms": round(percentile([elapsed for _, elapsed in outcomes], 95) * 1000, 2),
+            "p99_ms": round(percentile([elapsed for _, elapsed in outcomes], 99) * 1000, 2),
+            "max_ms": round(max(elapsed for _, elapsed in outcomes) * 1000, 2)
+        }
+        if queue is not None:
+            queued = Counter(job["message"] for job in queue.jobs(limit=len(forms) + 1))
+            result["queue_lost"] = sum(1 for body in delivered if queued[body] == 0)
+            result["queue_duplicated"] = sum(1 for count in queued.values() if count > 1)
+            queue.close()
+        store.close()
+    return result
+
+
+def print_results(results, baseline=None):
+    previous = {}
+    for result in (baseline or {}).get("results", []):
+        previous[(result["backend"], result["existing_responses"], result["transport"])] = result
+
+    header = (f"{'backend':<7} {'existing':>8} {'transport':<11} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'errors':>6} {'lost':>4} {'dup':>4} {'q lost':>6} {'q dup':>5}")
+    print(header + ("   vs baseline (req/s, p95)" if previous else ""))
+    for result in results:
+        line = (f"{result['backend']:<7} {result['existing_responses']:>8} {result['transport']:<11} "
+                f"{result['requests_per_second']:>8.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['errors']:>6} {result['lost']:>4} {result['duplicated']:>4} "
+                f"{result.get('queue_lost', '-'):>6} {result.get('queue_duplicated', '-'):>5}")
+        before = previous.get((result["backend"], result["existing_responses"], result["transport"]))
+        if before:
+            line += (f"   {result['requests_per_second'] / before['requests_per_second'] - 1:+.0%}, "
+                     f"{result['p95_ms'] / before['p95_ms'] - 1:+.0%}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="unique callbacks per run")
+    parser.add_argument("--concurrency", type=int, default=16, help="callbacks in flight")
+    parser.add_argument("--backends", default="log,json")
+    parser.add_argument("--sizes", default="0,1000,10000", help="responses already in the store")
+    parser.add_argument("--transports", default=",".join(TRANSPORTS))
+    parser.add_argument("--redeliver", type=float, default=0.05, help="fraction of callbacks delivered twice")
+    parser.add_argument("--no-queue", dest="queue", action="store_false", help="don't enqueue triage jobs")
+    parser.add_argument("--no-fsync", dest="fsync", action="store_false", help="log backend without fsync")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+    args.fsync = args.fsync and STORAGE_SETTINGS["fsync"]
+    args.queue = args.queue and QUEUE_SETTINGS["enabled"]
+
+    # sms_webhook opens the configured stores at import; point them at a scratch directory first
+    scratch = tempfile.mkdtemp(prefix="followcare-ingest-")
+    STORAGE_SETTINGS.update(
+        backend="log", path=os.path.join(scratch, "responses.log"),
+        legacy_json_path=os.path.join(scratch, "responses.json")
+    )
+    QUEUE_SETTINGS["path"] = os.path.join(scratch, "queue.sqlite3")
+    logging.basicConfig(level=logging.INFO, filename=os.path.join(scratch, "webhook.log"))
+    import sms_webhook
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    # First requests pay for Flask/Werkzeug lazy setup; keep that out of the first run
+    warmup_args = argparse.Namespace(**dict(vars(args), requests=50, redeliver=0.0))
+    run(sms_webhook, "log", 0, "test_client", warmup_args, "warmup")
+
+    results = []
+    for backend in args.backends.split(","):
+        for size in (int(size) for size in args.sizes.split(",")):
+            for transport in args.transports.split(","):
+                if transport not in TRANSPORTS:
+                    parser.error(f"unknown transport '{transport}'")
+                run_id = f"{len(results):02d}"
+                results.append(run(sms_webhook, backend, size, transport, args, run_id))
+                print(f"  {backend}/{size}/{transport}: {results[-1]['requests_per_second']} req/s", file=sys.stderr)
+
+    print()
+    print_results(results, baseline)
+
+    if args.output:
+        report = {
+            "meta": {
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "fsync": args.fsync,
+                "queue": args.queue,
+                "redeliver": args.redeliver
+            },
+            "results": results
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
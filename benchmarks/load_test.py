@@ -0,0 +1,292 @@
+"""Load-test the whole triage path offline: webhook -> queue -> pipeline -> SMS.
+
+Registers N synthetic patients, posts one reply per patient to the webhook's
+/sms endpoint (Flask test client, several sender threads, optionally at a fixed
+arrival rate) while triage_worker processes drain the queue through the
+TriagePipeline, and sends each patient's care instructions through SMSService
+as soon as their job is done. The LLM is the StubBackend replaying
+benchmarks/stub_completions.jsonl with the latency distributions from
+LLM_BACKEND_SETTINGS, and Twilio is a stub with lognormal latency, so no
+network, API key or Twilio account is needed. Stores, queue and call log live
+in a temporary directory.
+
+Reports throughput and p50/p95/p99 latency per stage: the webhook request,
+time queued before triage, each triage stage, the whole triage, the SMS send
+and end to end (webhook to last SMS part sent).
+
+Usage:
+    python -m benchmarks.load_test [--patients 200] [--workers 2] [--batch-size 8]
+        [--rate 20] [--latency-scale 0.1] [--mode chain|combined] [--seed 0]
+"""
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import logging
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+NAMES = ("Alex Morgan", "Sam Lee", "Jordan Patel", "Taylor Kim", "Casey Nguyen", "Riley Garcia", "Jamie Chen",
+         "Morgan Silva", "Drew Okafor", "Avery Rossi")
+PROCEDURES = ("Wisdom Tooth Extraction", "Dental Implant", "Root Canal", "Tooth Extraction", "Gum Graft")
+HISTORIES = ("No significant medical history.", "Type 2 diabetes, controlled.", "Takes blood thinners (warfarin).",
+             "Allergic to penicillin.", "Smoker, 10 cigarettes a day.")
+REPLIES = (
+    "Pain is about {pain}/10, a little bleeding this morning but it stopped. Taking ibuprofen.",
+    "Feeling fine, pain {pain} out of 10, no swelling or fever",
+    "My cheek is really swollen and I think I have a fever. Pain is {pain}/10",
+    "Still bleeding a lot since yesterday and it won't stop, very worried",
+    "hi, its sore but ok. can i eat normal food yet?",
+)
+STAGE_ORDER = ("webhook", "queue_wait", "symptom_analysis", "risk_assessment", "care_instructions", "summary",
+               "triage", "triage_total", "sms", "end_to_end")
+
+
+def configure(directory, args):
+    """Point every store at `directory` and the agents at the stub backend (inherited by forked workers)."""
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ.pop("LLM_RECORD_PATH", None)
+    stub = config.LLM_BACKEND_SETTINGS["stub"]
+    stub["recordings"] = os.path.join(ROOT, stub["recordings"])
+    stub["latency_scale"] = args.latency_scale
+    stub["seed"] = args.seed
+
+    config.STORAGE_SETTINGS.update(
+        backend="log", path=os.path.join(directory, "responses.log"),
+        legacy_json_path=os.path.join(directory, "responses.json")
+    )
+    config.QUEUE_SETTINGS.update(
+        enabled=True, path=os.path.join(directory, "queue.sqlite3"), poll_interval=0.05
+    )
+    config.PATIENT_SETTINGS.update(
+        path=os.path.join(directory, "patients.sqlite3"), text_store_path=os.path.join(directory, "patients.sqlite3")
+    )
+    config.INSTRUMENTATION_SETTINGS["call_log_path"] = os.path.join(directory, "llm_calls.sqlite3")
+    config.CHECKIN_TEMPLATE_SETTINGS["disk_path"] = os.path.join(directory, "checkin_templates.sqlite3")
+    config.CACHE_SETTINGS["enabled"] = False
+    config.PIPELINE_SETTINGS["mode"] = args.mode
+    if args.sms_rate:
+        config.SMS_SETTINGS["messages_per_second"] = args.sms_rate
+
+
+def synthetic_patients(count, rng):
+    """(Patient, reply text) pairs with distinct phone numbers."""
+    from models.patient import Patient
+
+    pairs = []
+    for index in range(count):
+        patient = Patient(
+            id=f"LOAD{index:05d}",
+            name=rng.choice(NAMES),
+            procedure=rng.choice(PROCEDURES),
+            procedure_date=datetime.now() - timedelta(days=rng.randint(1, 10)),
+            contact_info="",
+            medical_history=rng.choice(HISTORIES),
+            phone_number=f"+1555{index:07d}"
+        )
+        pairs.append((patient, rng.choice(REPLIES).format(pain=rng.randint(0, 10))))
+    return pairs
+
+
+class StubTwilio:
+    """Stands in for twilio.rest.Client: messages.create() waits a lognormal latency and returns a SID."""
+
+    def __init__(self, median, sigma=0.3, seed=0):
+        self.median = median
+        self.sigma = sigma
+        self.messages = self
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def create(self, body, from_, to):
+        with self._lock:
+            self._count += 1
+            sid = f"SMSTUB{self._count:08d}"
+            delay = self.median * math.exp(self._rng.gauss(0.0, self.sigma))
+        time.sleep(delay)
+        return type("Message", (), {"sid": sid})()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+
+def post_replies(app, pairs, threads, rate):
+    """POST every reply to /sms; returns {phone: (enqueued at, request seconds)}."""
+    sent = {}
+    lock = threading.Lock()
+    start = time.monotonic()
+    counter = iter(range(len(pairs)))
+
+    def sender():
+        client = app.test_client()
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            if rate:
+                # Open-loop arrivals: reply i is due at i / rate seconds
+                delay = start + index / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            patient, reply = pairs[index]
+            sent_at = time.time()
+            began = time.perf_counter()
+            response = client.post("/sms", data={
+                "Body": reply, "From": patient.phone_number, "MessageSid": f"SMLOAD{index:08d}"
+            })
+            elapsed = time.perf_counter() - began
+            if response.status_code != 200:
+                raise RuntimeError(f"/sms returned {response.status_code}")
+            with lock:
+                sent[patient.phone_number] = (sent_at, elapsed)
+
+    senders = [threading.Thread(target=sender, name=f"sender-{i}") for i in range(threads)]
+    for thread in senders:
+        thread.start()
+    for thread in senders:
+        thread.join()
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2, help="triage worker processes")
+    parser.add_argument("--batch-size", type=int, default=8, help="jobs each worker claims at once")
+    parser.add_argument("--senders", type=int, default=4, help="threads posting to the webhook")
+    parser.add_argument("--rate", type=float, default=None, help="arrivals per second (default: as fast as possible)")
+    parser.add_argument("--mode", choices=("chain", "combined"), default=config.PIPELINE_SETTINGS["mode"])
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplies every stub LLM latency")
+    parser.add_argument("--sms-latency", type=float, default=0.15, help="median stub Twilio latency in seconds")
+    parser.add_argument("--sms-rate", type=float, default=None, help="override SMS_SETTINGS messages_per_second")
+    parser.add_argument("--timeout", type=float, default=600, help="give up after this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    directory = tempfile.mkdtemp(prefix="followcare-load-")
+    configure(directory, args)
+
+    # Imported after configure() so they open the temporary stores
+    import sms_webhook
+    import triage_worker
+    from services.job_queue import create_queue
+    from services.sms_service import SMSService
+    from services.patient_repository import create_repository
+
+    rng = random.Random(args.seed)
+    pairs = synthetic_patients(args.patients, rng)
+    repository = create_repository(config.PATIENT_SETTINGS)
+    for patient, _ in pairs:
+        repository.save(patient)
+    repository.close()
+
+    triage_queue = create_queue(config.QUEUE_SETTINGS)
+    sms = SMSService(client=StubTwilio(args.sms_latency, seed=args.seed), phone_number="+15550000000")
+    sms_pool = ThreadPoolExecutor(max_workers=config.SMS_SETTINGS["max_workers"], thread_name_prefix="sms")
+    sms_done = {}
+
+    def send_care(job):
+        began = time.perf_counter()
+        sms.send_message(job["phone_number"], job["result"]["care_instructions"])
+        sms_done[job["phone_number"]] = (time.time(), time.perf_counter() - began)
+
+    # Workers first, so triage overlaps with ingest like in production
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=triage_worker.run_worker, args=(index, args.batch_size), name=f"worker-{index}")
+        for index in range(args.workers)
+    ]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+
+    ingest = {}
+    ingest_thread = threading.Thread(
+        target=lambda: ingest.update(post_replies(sms_webhook.app, pairs, args.senders, args.rate))
+    )
+    ingest_thread.start()
+
+    jobs = {}
+    sms_futures = []
+    while time.time() - started < args.timeout:
+        for job in triage_queue.jobs(status="done", limit=args.patients):
+            if job["id"] not in jobs:
+                jobs[job["id"]] = job
+                sms_futures.append(sms_pool.submit(send_care, job))
+        counts = triage_queue.counts()
+        if not ingest_thread.is_alive() and counts["done"] + counts["failed"] >= args.patients:
+            break
+        time.sleep(0.05)
+    ingest_done = time.time()
+    ingest_thread.join()
+
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
+    for future in sms_futures:
+        future.result()
+    sms_pool.shutdown()
+    finished = time.time()
+
+    counts = triage_queue.counts()
+    failed_jobs = triage_queue.jobs(status="failed", limit=args.patients)
+    triage_queue.close()
+
+    timings = {stage: [] for stage in STAGE_ORDER}
+    for phone, (_, elapsed) in ingest.items():
+        timings["webhook"].append(elapsed)
+    fallbacks = 0
+    for job in jobs.values():
+        result = job["result"]
+        timings["queue_wait"].append(max(0.0, job["updated"] - job["created"] - result["duration"]))
+        timings["triage_total"].append(result["duration"])
+        for stage, seconds in result["stage_durations"].items():
+            timings[stage].append(seconds)
+        if str(result["risk_assessment"].get("decision_path", "")).startswith("fallback"):
+            fallbacks += 1
+        if job["phone_number"] in sms_done:
+            sent_at, elapsed = sms_done[job["phone_number"]]
+            timings["sms"].append(elapsed)
+            timings["end_to_end"].append(sent_at - ingest[job["phone_number"]][0])
+
+    webhook_wall = max(sent_at + elapsed for sent_at, elapsed in ingest.values()) - started
+    print(f"Patients: {args.patients}   mode: {args.mode}   workers: {args.workers} x batch {args.batch_size}   "
+          f"LLM latency scale: {args.latency_scale}")
+    print(f"Jobs: {counts['done']} done, {counts['failed']} failed, {counts['queued'] + counts['running']} unfinished   "
+          f"fallback risk assessments: {fallbacks}")
+    print(f"Throughput: webhook {len(ingest) / webhook_wall:.1f} req/s   "
+          f"triage {len(jobs) / (ingest_done - started):.2f} patients/s   "
+          f"end to end {len(sms_done) / (finished - started):.2f} patients/s   ({finished - started:.1f}s total)")
+    print()
+    print(f"{'stage':<18} {'n':>5} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for stage in STAGE_ORDER:
+        values = timings[stage]
+        if not values:
+            continue
+        print(f"{stage:<18} {len(values):>5} {sum(values) / len(values):>8.3f}s "
+              f"{percentile(values, 50):>8.3f}s {percentile(values, 95):>8.3f}s {percentile(values, 99):>8.3f}s "
+              f"{max(values):>8.3f}s")
+    for job in failed_jobs[:5]:
+        print(f"failed job {job['id']}: {job['last_error']}")
+    print(f"\nStores and call log kept in {directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,280 @@ DENTAL_PROFESSIONAL = {
     "checkuplink": "https://dentist.com/appointment"
 }
 
+# Per-stage model routing; each value can be overridden with AI_<STAGE>_MODEL,
+# AI_<STAGE>_TEMPERATURE and AI_<STAGE>_MAX_TOKENS environment variables
 AI_SETTINGS = {
-    "symptom_analysis_model": "gpt-4-turbo",
-    "risk_assessment_model": "gpt-4-turbo",
-    "care_instructions_model": "gpt-4-turbo",
-    "summary_model": "gpt-4-turbo",
-    "temperature": 0.7,
+    "symptom_analysis_model": "gpt-4o-mini",
+    "risk_assessment_model": "gpt-4o-mini",
+    "care_instructions_model": "gpt-4o-mini",
+    "summary_model": "gpt-4o",
+    "triage_model": "gpt-4o-mini",
+    "checkin_model": "gpt-4o-mini",
+    "default_model": "gpt-4o-mini",
+    # A number applies to every stage; a dict sets it per stage with "default" as fallback
+    "temperature": {
+        "symptom_analysis": 0.0,
+        "risk_assessment": 0.0,
+        "triage": 0.2,
+        "default": 0.7
+    },
     "max_tokens": {
         "symptom_analysis": 1000,
         "risk_assessment": 800,
         "care_instructions": 1000,
-        "summary": 1500
+        "summary": 1500,
+        "triage": 3000,
+        "checkin": 500
     }
-}
\ No newline at end of file
+}
+
+# Deadlines, retries, hedging and circuit breaking for LLM calls (agents/resilience.py).
+# Stage values can be overridden with AI_<STAGE>_DEADLINE and AI_<STAGE>_HEDGE_AFTER.
+RESILIENCE_SETTINGS = {
+    # Seconds one call may take, retries included, before the agent falls back to its local path
+    "deadline": {
+        "symptom_analysis": 20,
+        "risk_assessment": 20,
+        "care_instructions": 45,
+        "summary": 60,
+        "triage": 60,
+        "checkin": 30,
+        "default": 30
+    },
+    # Attempts per call on rate limits (429), 5xx, timeouts and connection errors
+    "max_attempts": 4,
+    # Exponential backoff with full jitter between attempts; a longer Retry-After wins
+    "backoff_initial": 0.5,
+    "backoff_max": 8.0,
+    # Send a duplicate request when the first hasn't answered after this many seconds (None: never)
+    "hedge_after": {
+        "symptom_analysis": 8.0,
+        "risk_assessment": 8.0,
+        "default": None
+    },
+    # Consecutive failed attempts against a model that open its circuit, and how long it stays open
+    "breaker_failure_threshold": 5,
+    "breaker_reset_seconds": 30
+}
+
+# USD per 1M tokens, used for the per-stage cost report; "cached_input" applies to
+# prompt tokens served from the provider's prompt cache
+MODEL_PRICING = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4-turbo": {"input": 10.00, "output": 30.00},
+    "gpt-3.5-turbo": {"input": 0.50, "output": 1.50}
+}
+
+# Per-call LLM instrumentation (agents/instrumentation.py); the call log is shared by
+# every process so the webhook's /metrics endpoint covers the triage workers too
+INSTRUMENTATION_SETTINGS = {
+    # None keeps records in memory only
+    "call_log_path": ".cache/llm_calls.sqlite3",
+    # Calls kept in each process's memory, and per-call rows kept in the call log (totals are never pruned)
+    "recent_calls": 5000,
+    "call_log_max_rows": 100000,
+    "latency_buckets": (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+}
+
+STORAGE_SETTINGS = {
+    "backend": "log",
+    "path": "patient_responses.log",
+    "legacy_json_path": "patient_responses.json",
+    "fsync": True
+}
+
+# Check-in message templates, generated once per (procedure, history category, clinic config)
+CHECKIN_TEMPLATE_SETTINGS = {
+    "enabled": True,
+    "memory_entries": 256,
+    "disk_path": ".cache/checkin_templates.sqlite3",
+    "ttl_seconds": 7 * 24 * 3600,
+    # After the model returns an unusable template, patients of that kind get one-off messages for this long
+    "rejected_ttl_seconds": 15 * 60
+}
+
+# Outbound SMS (services/sms_service.py); Twilio queues anything above the number's throughput
+SMS_SETTINGS = {
+    "messages_per_second": 10,
+    "max_workers": 8,
+    "max_retries": 4,
+    "retry_base_delay": 1.0,
+    "retry_max_delay": 30.0,
+    # Cap on segments per SMS body before it's split into "(Part i/n)" messages;
+    # None allows as many as fit in Twilio's 1600-character limit (fewest segments overall)
+    "max_segments_per_message": None,
+    # Swap curly quotes, long dashes etc. for GSM-7 characters so bodies aren't sent as UCS-2
+    "smart_encoding": True
+}
+
+# Patient records shared by the dashboard, the webhook and the triage workers
+PATIENT_SETTINGS = {
+    "path": "patients.sqlite3",
+    # Prepended to phone numbers entered without a country code
+    "default_country_code": "1",
+    # Interactions per patient whose free text stays in memory; older texts move to the text store
+    "history_window": 5,
+    # Interactions per patient kept in memory at all; older ones stay in SQLite (PatientRepository.history())
+    "loaded_interactions": 100,
+    "text_store_path": "patients.sqlite3",
+    # Shorter texts aren't worth a lookup and stay inline
+    "offload_min_chars": 200
+}
+
+# Durable triage queue: sms_webhook.py enqueues every inbound SMS, triage_worker.py drains it
+QUEUE_SETTINGS = {
+    "enabled": True,
+    "path": "triage_queue.sqlite3",
+    "visibility_timeout": 300,
+    "max_attempts": 5,
+    "retry_backoff": 10,
+    # Seconds in which the same body from the same sender, without a MessageSid, is a redelivery
+    "redelivery_window": 900,
+    "workers": 2,
+    "batch_size": 4,
+    "poll_interval": 1.0
+}
+
+# Webhook server. Production runs `gunicorn -c gunicorn.conf.py wsgi:app`; PORT, WEB_CONCURRENCY,
+# LOG_SAMPLE_RATE and USE_NGROK override the values below
+SERVER_SETTINGS = {
+    "host": "0.0.0.0",
+    "port": 5000,
+    # gunicorn worker processes and threads per worker. Each open /events/stream holds one of a
+    # worker's threads for as long as it is connected, so at most EVENT_STREAM_SETTINGS["max_streams"]
+    # streams are served per worker (2 x 4 by default), and the other threads stay free for SMS
+    # callbacks and API requests. The dashboard opens one stream per Streamlit process, not per session.
+    "workers": 2,
+    "threads": 8,
+    # Fraction of successful requests logged; errors and slow requests are always logged
+    "log_sample_rate": 0.1,
+    "slow_request_seconds": 1.0,
+    # Open an ngrok tunnel when started with `python sms_webhook.py` (local development only)
+    "ngrok": False
+}
+
+# Push delivery of new responses from sms_webhook.py (/events long-poll and /events/stream SSE)
+EVENT_STREAM_SETTINGS = {
+    "long_poll_timeout": 25,
+    "max_long_poll_timeout": 60,
+    "heartbeat_seconds": 15,
+    "max_batch": 500,
+    # Concurrent /events/stream connections per worker process (keep below SERVER_SETTINGS["threads"]);
+    # beyond that clients get a 503 telling them to retry after retry_after_seconds
+    "max_streams": 4,
+    "retry_after_seconds": 10
+}
+
+PIPELINE_SETTINGS = {
+    # "chain" runs the four agents in sequence, "combined" uses one TriageAgent call
+    "mode": "chain",
+    "concurrency": 8,
+    # Max calls per second for each stage (None for no limit)
+    "stage_rate_limits": {
+        "symptom_analysis": 10,
+        "risk_assessment": 10,
+        "care_instructions": 5,
+        "summary": 5,
+        "triage": 5
+    }
+}
+
+CLIENT_SETTINGS = {
+    "max_connections": 50,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 60.0,
+    "timeout": 60.0,
+    "connect_timeout": 5.0,
+    # Retries are handled by agents/resilience.py, not by the OpenAI SDK
+    "max_retries": 0,
+    # None = use HTTP/2 when the h2 package is installed
+    "http2": None
+}
+
+# Where agents send completions (agents/backends.py). "stub" replays recorded completions
+# offline with simulated latency, for load tests; LLM_BACKEND and LLM_RECORD_PATH override
+LLM_BACKEND_SETTINGS = {
+    "backend": "openai",
+    # Append every completion to this JSONL file so the stub can replay it (None disables)
+    "record_path": None,
+    "stub": {
+        "recordings": "benchmarks/stub_completions.jsonl",
+        "seed": 0,
+        # Per stage (or "default"): fixed {"seconds"}, uniform {"low", "high"},
+        # lognormal {"median", "sigma"} or "recorded" (the recordings' own latencies)
+        "latency": {
+            "symptom_analysis": {"distribution": "lognormal", "median": 1.2, "sigma": 0.4},
+            "risk_assessment": {"distribution": "lognormal", "median": 1.0, "sigma": 0.4},
+            "care_instructions": {"distribution": "lognormal", "median": 4.0, "sigma": 0.35},
+            "summary": {"distribution": "lognormal", "median": 6.0, "sigma": 0.35},
+            "triage": {"distribution": "lognormal", "median": 7.0, "sigma": 0.35},
+            "default": {"distribution": "lognormal", "median": 2.0, "sigma": 0.4}
+        },
+        # Multiplies every sampled latency (0 answers instantly)
+        "latency_scale": 1.0
+    }
+}
+
+CACHE_SETTINGS = {
+    # Opt-in: cache GPT completions keyed on model + system message + normalized prompt
+    "enabled": False,
+    "memory_entries": 1024,
+    "disk_path": ".cache/llm_cache.sqlite3",
+    "ttl_seconds": 7 * 24 * 3600,
+    "max_disk_bytes": 50 * 1024 * 1024
+}
+
+# Deterministic risk rules checked before RiskAssessmentAgent calls GPT.
+# First matching rule wins; anything unmatched goes to the LLM.
+# Conditions: list = one of (case-insensitive), {"min"/"max"} = numeric range,
+# bool = truthiness, {"empty": True} = empty list/None.
+RISK_RULES = {
+    "enabled": True,
+    "rules": [
+        {
+            "name": "fever_with_significant_swelling",
+            "risk_level": "High",
+            "when": {"fever": True, "swelling": ["moderate", "severe"]},
+            "justification": "Fever together with significant swelling may indicate infection and needs prompt review."
+        },
+        {
+            "name": "severe_bleeding",
+            "risk_level": "High",
+            "when": {"bleeding": ["severe"]},
+            "justification": "Severe or persistent bleeding after a procedure needs prompt review."
+        },
+        {
+            "name": "severe_pain",
+            "risk_level": "High",
+            "when": {"pain_level": {"min": 9}},
+            "justification": "Pain of 9/10 or higher is beyond normal post-operative discomfort."
+        },
+        {
+            "name": "trivial_recovery",
+            "risk_level": "Low",
+            "when": {
+                "pain_level": {"min": 0, "max": 2},
+                "bleeding": ["none", "not mentioned"],
+                "swelling": ["none", "not mentioned"],
+                "fever": False,
+                "other_symptoms": {"empty": True},
+                "overall_sentiment": ["positive", "neutral"]
+            },
+            "justification": "Minimal pain with no bleeding, swelling, fever or other symptoms is consistent with normal recovery."
+        }
+    ]
+}
+
+SYMPTOM_EXTRACTOR_SETTINGS = {
+    # Use the local regex/lexicon extractor and skip GPT when it is at least this confident
+    "enabled": True,
+    "confidence_threshold": 0.85
+}
+
+STRUCTURED_OUTPUT_SETTINGS = {
+    # How many times an invalid JSON reply is sent back to the model with the validation error
+    "max_repair_attempts": 1
+}
@@ -0,0 +1,32 @@
+"""gunicorn settings for the webhook server (gunicorn -c gunicorn.conf.py wsgi:app).
+
+Defaults come from SERVER_SETTINGS in config.py; PORT and WEB_CONCURRENCY
+override the port and the number of worker processes.
+"""
+import os
+
+from config import SERVER_SETTINGS, STORAGE_SETTINGS
+
+bind = f"{SERVER_SETTINGS['host']}:{os.getenv('PORT', SERVER_SETTINGS['port'])}"
+workers = int(os.getenv("WEB_CONCURRENCY", SERVER_SETTINGS["workers"]))
+# Threads, so long-polls and SSE streams don't block a whole worker
+worker_class = "gthread"
+threads = SERVER_SETTINGS["threads"]
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Not preloaded: the response log's flock and the SQLite connections must be
+# opened in each worker, not inherited across fork
+preload_app = False
+
+# Requests are logged by the app (sampled and redacted); gunicorn only logs errors
+accesslog = None
+errorlog = "-"
+loglevel = "info"
+
+
+def on_starting(server):
+    # Migrate the legacy JSON store once in the master, before the workers race to open it
+    from services.response_store import open_store
+    open_store(STORAGE_SETTINGS).close()
@@ -7,6 +7,8 @@ from agents.response_analyzer import ResponseAnalyzerAgent
 from agents.risk_assessment import RiskAssessmentAgent
 from agents.care_instruction import CareInstructionAgent
 from agents.summary import SummaryAgent
+from agents.metrics import stage_report
+from agents.instrumentation import get_call_recorder, new_run_id, run_table, set_call_context
 
 load_dotenv()
 
@@ -54,6 +56,10 @@ def main():
     # Add a new interaction
     patient.add_interaction()
     
+    # Tag every LLM call below with this run and patient
+    run_id = new_run_id()
+    set_call_context(run_id=run_id, patient_id=patient.id)
+    
     # Step 1: Generate check-in message
     print("\n=== Step 1: Check-In Message ===")
     check_in_message = symptom_checkin_agent.process(patient)
@@ -97,6 +103,19 @@ def main():
     interaction = patient.get_latest_interaction()
     print(f"Timestamp: {interaction.timestamp}")
     print(f"Risk Level: {interaction.risk_level}")
+    
+    # Cost and latency of each stage's LLM calls
+    print("\n=== LLM Usage by Stage ===")
+    for row in stage_report():
+        latency = f"{row['latency_p50']:.2f}s" if row['latency_p50'] is not None else "-"
+        print(f"{row['stage']:<18} {row['model']:<14} calls={row['calls']:.0f} cache_hits={row['cache_hits']:.0f} "
+              f"tokens={row['prompt_tokens']:.0f}/{row['completion_tokens']:.0f} cached={row['cached_tokens']:.0f} "
+              f"cost=${row['cost_usd']:.4f} p50={latency}")
+    
+    print(f"\n=== LLM Calls in Run {run_id} ===")
+    for row in run_table(get_call_recorder().recent(run_id=run_id)):
+        print(f"{row['Agent']:<28} {row['Model']:<14} wall={row['Wall (s)']:.2f}s queued={row['Queued (s)']:.2f}s "
+              f"tokens={row['Tokens in']}({row['Cached in']} cached)/{row['Tokens out']} cost=${row['Cost ($)']:.5f}")
 
 if __name__ == "__main__":
     main()
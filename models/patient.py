@@ -1,20 +1,217 @@
+import json
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Dict, Optional
+from enum import StrEnum
+from typing import List, Dict, Optional, Any
 
-@dataclass
+try:
+    import msgpack
+except ImportError:  # optional; to_bytes() falls back to compact JSON
+    msgpack = None
+
+from config import PATIENT_SETTINGS
+from .text_store import StoredText, get_text_store
+
+class RiskLevel(StrEnum):
+    """Risk level of an interaction. Members compare equal to their plain strings."""
+    NOT_ASSESSED = ""
+    LOW = "Low"
+    MEDIUM = "Medium"
+    HIGH = "High"
+    UNKNOWN = "Unknown"
+
+class Severity(StrEnum):
+    """Severity of a reported symptom, as used in extracted_symptoms."""
+    NONE = "none"
+    MILD = "mild"
+    MODERATE = "moderate"
+    SEVERE = "severe"
+    NOT_MENTIONED = "not mentioned"
+
+# extracted_symptoms keys whose values are Severity levels
+SEVERITY_FIELDS = ("bleeding", "swelling")
+
+_MEMBERS_BY_LOWER = {
+    enum: {member.value.lower(): member for member in enum}
+    for enum in (RiskLevel, Severity)
+}
+
+def _intern(enum, value):
+    """The shared enum member for a value (case-insensitive), or the value unchanged if it isn't one."""
+    if isinstance(value, str):
+        return _MEMBERS_BY_LOWER[enum].get(value.strip().lower(), value)
+    return value
+
+def pack(data):
+    """Serialize plain data to bytes: msgpack when installed, otherwise compact JSON.
+
+    The first byte tags the format so unpack() can read either.
+    """
+    if msgpack is not None:
+        return b"M" + msgpack.packb(data, use_bin_type=True, default=str)
+    return b"J" + json.dumps(data, separators=(",", ":"), default=str).encode('utf-8')
+
+def unpack(data):
+    """Inverse of pack(); also accepts plain JSON text written before pack() existed."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    view = memoryview(data)
+    tag = bytes(view[:1])
+    if tag == b"M":
+        if msgpack is None:
+            raise ValueError("Data was serialized with msgpack, which is not installed")
+        return msgpack.unpackb(view[1:], raw=False)
+    if tag == b"J":
+        return json.loads(bytes(view[1:]))
+    if tag == b"{":
+        return json.loads(data)
+    raise ValueError(f"Unrecognized serialization format {tag!r}")
+
+def _text_property(name):
+    slot = "_" + name
+
+    def getter(self):
+        value = getattr(self, slot)
+        return value.load() if isinstance(value, StoredText) else value
+
+    def setter(self, value):
+        setattr(self, slot, value)
+
+    return property(getter, setter, doc=f"{name}; read from the text store if it was offloaded.")
+
+@dataclass(slots=True, init=False)
 class PatientInteraction:
-    """Represents a single interaction with a patient during follow-up."""
-    timestamp: datetime = field(default_factory=datetime.now)
-    check_in_message: str = ""
-    patient_response: str = ""
-    extracted_symptoms: Dict[str, any] = field(default_factory=dict)
-    risk_level: str = ""
-    risk_justification: str = ""
-    care_instructions: str = ""
-    summary: str = ""
-
-@dataclass
+    """Represents a single interaction with a patient during follow-up.
+
+    The free-text fields (check_in_message, patient_response, risk_justification,
+    care_instructions, summary) can be offloaded to a TextStore, after which only
+    a reference stays in memory and the text is read back on access.
+
+    The slots behind the properties are private, so equality and repr are
+    written out below in terms of the public values (an offloaded text equals
+    the same text inline); use to_dict() rather than dataclasses.asdict().
+    """
+    timestamp: datetime
+    symptom_extraction_path: str  # "llm" or "local:<confidence>"
+    risk_decision_path: str  # "llm" or "rule:<rule name>"
+    _extracted_symptoms: Dict[str, Any] = field(repr=False, compare=False)
+    _risk_level: Any = field(repr=False, compare=False)
+    _check_in_message: Any = field(repr=False, compare=False)
+    _patient_response: Any = field(repr=False, compare=False)
+    _risk_justification: Any = field(repr=False, compare=False)
+    _care_instructions: Any = field(repr=False, compare=False)
+    _summary: Any = field(repr=False, compare=False)
+
+    TEXT_FIELDS = ("check_in_message", "patient_response", "risk_justification", "care_instructions", "summary")
+
+    def __init__(self, timestamp=None, check_in_message="", patient_response="", extracted_symptoms=None,
+                 symptom_extraction_path="", risk_level="", risk_justification="", risk_decision_path="",
+                 care_instructions="", summary=""):
+        self.timestamp = timestamp or datetime.now()
+        self.check_in_message = check_in_message
+        self.patient_response = patient_response
+        self.extracted_symptoms = extracted_symptoms or {}
+        self.symptom_extraction_path = symptom_extraction_path
+        self.risk_level = risk_level
+        self.risk_justification = risk_justification
+        self.risk_decision_path = risk_decision_path
+        self.care_instructions = care_instructions
+        self.summary = summary
+
+    check_in_message = _text_property("check_in_message")
+    patient_response = _text_property("patient_response")
+    risk_justification = _text_property("risk_justification")
+    care_instructions = _text_property("care_instructions")
+    summary = _text_property("summary")
+
+    @property
+    def risk_level(self):
+        return self._risk_level
+
+    @risk_level.setter
+    def risk_level(self, value):
+        self._risk_level = _intern(RiskLevel, value)
+
+    @property
+    def extracted_symptoms(self):
+        return self._extracted_symptoms
+
+    @extracted_symptoms.setter
+    def extracted_symptoms(self, value):
+        if isinstance(value, dict) and any(key in value for key in SEVERITY_FIELDS):
+            value = {key: _intern(Severity, item) if key in SEVERITY_FIELDS else item for key, item in value.items()}
+        self._extracted_symptoms = value
+
+    def __eq__(self, other):
+        if not isinstance(other, PatientInteraction):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.to_dict(inline_texts=False).items())
+        return f"{type(self).__name__}({fields})"
+
+    @property
+    def offloaded(self):
+        """True if any text field lives in the text store."""
+        return any(isinstance(getattr(self, "_" + name), StoredText) for name in self.TEXT_FIELDS)
+
+    def offload(self, store=None, min_chars=None):
+        """Move text fields of at least min_chars characters to the text store."""
+        min_chars = PATIENT_SETTINGS["offload_min_chars"] if min_chars is None else min_chars
+        for name in self.TEXT_FIELDS:
+            value = getattr(self, "_" + name)
+            if isinstance(value, str) and value and len(value) >= min_chars:
+                store = store or get_text_store()
+                setattr(self, "_" + name, store.put(value))
+
+    def to_dict(self, inline_texts=True):
+        """Plain dict of this interaction (JSON-serializable).
+
+        Args:
+            inline_texts: Read offloaded texts back in; with False they are
+                written as {"text_ref": key} so the text store isn't touched.
+        """
+        data = {
+            "timestamp": self.timestamp.isoformat(),
+            "extracted_symptoms": self.extracted_symptoms,
+            "symptom_extraction_path": self.symptom_extraction_path,
+            "risk_level": str(self.risk_level),
+            "risk_decision_path": self.risk_decision_path
+        }
+        for name in self.TEXT_FIELDS:
+            value = getattr(self, "_" + name)
+            if isinstance(value, StoredText):
+                value = value.load() if inline_texts else {"text_ref": value.key.hex()}
+            data[name] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data, store=None):
+        """Rebuild an interaction from to_dict() output; text references stay lazy."""
+        interaction = cls(
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            extracted_symptoms=data.get("extracted_symptoms"),
+            symptom_extraction_path=data.get("symptom_extraction_path", ""),
+            risk_level=data.get("risk_level", ""),
+            risk_decision_path=data.get("risk_decision_path", "")
+        )
+        for name in cls.TEXT_FIELDS:
+            value = data.get(name, "")
+            if isinstance(value, dict) and "text_ref" in value:
+                value = (store or get_text_store()).ref(value["text_ref"])
+            setattr(interaction, "_" + name, value)
+        return interaction
+
+    def to_bytes(self, inline_texts=True):
+        """Compact binary form of to_dict() (see pack())."""
+        return pack(self.to_dict(inline_texts))
+
+    @classmethod
+    def from_bytes(cls, data, store=None):
+        return cls.from_dict(unpack(data), store)
+
+@dataclass(slots=True)
 class Patient:
     """Represents a patient in the dental follow-up system."""
     id: str
@@ -25,8 +222,13 @@ class Patient:
     medical_history: str = ""
     phone_number: str = None
     interactions: List[PatientInteraction] = field(default_factory=list)
-    
-    def __init__(self, id, name, procedure, procedure_date, contact_info, medical_history, phone_number=None):
+    # Most recent interactions whose texts stay in memory; older ones are offloaded
+    history_window: Optional[int] = None
+    # Position of interactions[0] in the full history; the repository pages earlier ones in on request
+    interactions_offset: int = 0
+
+    def __init__(self, id, name, procedure, procedure_date, contact_info, medical_history, phone_number=None,
+                 history_window=None):
         self.id = id
         self.name = name
         self.procedure = procedure
@@ -35,15 +237,88 @@ class Patient:
         self.medical_history = medical_history
         self.phone_number = phone_number
         self.interactions = []
-    
+        self.history_window = PATIENT_SETTINGS["history_window"] if history_window is None else history_window
+        self.interactions_offset = 0
+
     def add_interaction(self) -> PatientInteraction:
         """Add a new interaction for this patient."""
         interaction = PatientInteraction()
         self.interactions.append(interaction)
         return interaction
-    
+
     def get_latest_interaction(self) -> Optional[PatientInteraction]:
         """Get the most recent interaction for this patient."""
         if not self.interactions:
             return None
         return self.interactions[-1]
+
+    def to_dict(self, inline_texts=True):
+        """Plain dict of this patient and its interactions (JSON-serializable).
+
+        Args:
+            inline_texts: See PatientInteraction.to_dict().
+        """
+        return {
+            "id": self.id,
+            "name": self.name,
+            "procedure": self.procedure,
+            "procedure_date": self.procedure_date.isoformat(),
+            "contact_info": self.contact_info,
+            "medical_history": self.medical_history,
+            "phone_number": self.phone_number,
+            "history_window": self.history_window,
+            "interactions_offset": self.interactions_offset,
+            "interactions": [interaction.to_dict(inline_texts) for interaction in self.interactions]
+        }
+
+    @classmethod
+    def from_dict(cls, data, store=None):
+        patient = cls(
+            id=data["id"],
+            name=data["name"],
+            procedure=data["procedure"],
+            procedure_date=datetime.fromisoformat(data["procedure_date"]),
+            contact_info=data.get("contact_info", ""),
+            medical_history=data.get("medical_history", ""),
+            phone_number=data.get("phone_number"),
+            history_window=data.get("history_window")
+        )
+        patient.interactions = [PatientInteraction.from_dict(item, store) for item in data.get("interactions", [])]
+        patient.interactions_offset = data.get("interactions_offset", 0)
+        return patient
+
+    def to_bytes(self, inline_texts=True):
+        """Compact binary snapshot of the patient and its history (see pack()).
+
+        With inline_texts=False this is a write: texts older than the history
+        window are offloaded to the text store first.
+        """
+        if not inline_texts:
+            self.compact()
+        return pack(self.to_dict(inline_texts))
+
+    @classmethod
+    def from_bytes(cls, data, store=None):
+        return cls.from_dict(unpack(data), store)
+
+    def compact(self, store=None):
+        """Offload the texts of interactions older than the history window.
+
+        Writes to the text store, so it belongs on write paths (saving the
+        patient), never on loads.
+        """
+        older = len(self.interactions) - self.history_window
+        for interaction in self.interactions[:max(0, older)]:
+            interaction.offload(store)
+
+    def trim(self, limit):
+        """Drop all but the last `limit` interactions from memory (None keeps them all).
+
+        The dropped interactions are only forgotten here, not deleted: they stay
+        in the repository, and interactions_offset moves past them.
+        """
+        if limit is None or len(self.interactions) <= limit:
+            return
+        dropped = len(self.interactions) - limit
+        del self.interactions[:dropped]
+        self.interactions_offset += dropped
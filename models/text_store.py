@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import hashlib
+import threading
+
+from config import PATIENT_SETTINGS
+
+
+class StoredText:
+    """Reference to a text held in a TextStore; the text is read on load(), never kept."""
+
+    __slots__ = ("store", "key")
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+
+    def load(self):
+        return self.store.get(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, StoredText) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    # Immutable, and the store holds a database connection that can't be copied
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"StoredText({self.key.hex()[:12]})"
+
+
+class TextStore:
+    """Content-addressed SQLite store for large interaction texts.
+
+    Keys are SHA-256 digests, so the same check-in template or care
+    instructions sent to many patients is stored once, and writers in
+    different processes never conflict.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS interaction_texts (key BLOB PRIMARY KEY, text TEXT NOT NULL)")
+
+    def put(self, text):
+        """Store a text and return a StoredText reference to it."""
+        # 128 bits of SHA-256 is plenty to address texts and halves the key held in memory
+        key = hashlib.sha256(text.encode('utf-8')).digest()[:16]
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO interaction_texts (key, text) VALUES (?, ?)", (key, text))
+        return StoredText(self, key)
+
+    def ref(self, key):
+        """Reference to a text stored earlier (e.g. by another process); key may be hex."""
+        return StoredText(self, bytes.fromhex(key) if isinstance(key, str) else key)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM interaction_texts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(f"Text {key.hex()} is missing from {self.path}")
+        return row[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_text_store = None
+_text_store_lock = threading.Lock()
+
+
+def get_text_store():
+    """Process-wide TextStore at PATIENT_SETTINGS["text_store_path"]."""
+    global _text_store
+    with _text_store_lock:
+        if _text_store is None:
+            _text_store = TextStore(PATIENT_SETTINGS["text_store_path"])
+        return _text_store
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle: queued -> running -> done, or back to queued on failure until
+# max_attempts is reached, then failed. A running job whose lease expires (the
+# worker died or hung) is claimable again.
+STATUSES = ("queued", "running", "done", "failed")
+
+
+def idempotency_key(phone_number, message, sent_at=None, message_sid=None):
+    """Key that identifies one inbound SMS, so a redelivered webhook doesn't enqueue it twice.
+
+    Twilio's MessageSid is used when available; otherwise the sender, the
+    body and Twilio's own send time (when the caller has one) are hashed. The
+    time the request arrived is deliberately left out: a redelivery arrives
+    later, and must still get the same key.
+    """
+    if message_sid:
+        return f"sid:{message_sid}"
+    payload = f"{phone_number}|{sent_at or ''}|{message}"
+    return "sha256:" + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TriageQueue:
+    """Durable SQLite-backed queue of patient replies waiting for triage.
+
+    The webhook enqueues one job per inbound SMS and worker processes claim jobs
+    with a lease (visibility timeout). Results are written back to the same
+    table, where the dashboard reads them. All methods are safe to call from
+    several threads and processes.
+    """
+
+    def __init__(self, path, visibility_timeout=300, max_attempts=5, retry_backoff=10, redelivery_window=900):
+        """Open (or create) the queue database.
+
+        Args:
+            path: Path to the SQLite file.
+            visibility_timeout: Seconds a claimed job stays invisible to other workers.
+            max_attempts: Attempts before a job is moved to "failed".
+            retry_backoff: Base delay in seconds before a retry; doubles per attempt.
+            redelivery_window: Seconds within which a message with no MessageSid or send
+                time counts as a redelivery of an earlier one with the same sender and body.
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.redelivery_window = redelivery_window
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Autocommit mode so claim() can open its own IMMEDIATE transaction
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS triage_jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "idempotency_key TEXT NOT NULL UNIQUE, "
+            "phone_number TEXT NOT NULL, "
+            "message TEXT NOT NULL, "
+            "received_at TEXT NOT NULL, "
+            "patient TEXT, "
+            "status TEXT NOT NULL DEFAULT 'queued', "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "available_at REAL NOT NULL, "
+            "lease_owner TEXT, "
+            "lease_expires REAL, "
+            "last_error TEXT, "
+            "result TEXT, "
+            "created REAL NOT NULL, "
+            "updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS triage_jobs_claim ON triage_jobs (status, available_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS triage_jobs_phone ON triage_jobs (phone_number, status)")
+
+    def enqueue(self, phone_number, message, received_at=None, message_sid=None, patient=None, sent_at=None):
+        """Add a reply to the queue unless the same message was already enqueued.
+
+        Args:
+            phone_number: The sender's phone number.
+            message: The SMS body.
+            received_at: ISO timestamp the message was received (defaults to now).
+            message_sid: Optional Twilio MessageSid used as the idempotency key.
+            patient: Optional dict of Patient fields to triage against.
+            sent_at: Optional send time reported by Twilio, part of the key when there is no MessageSid.
+
+        Returns:
+            tuple: (job id, True if a new job was created).
+        """
+        received_at = received_at or datetime.now().isoformat()
+        key = idempotency_key(phone_number, message, sent_at, message_sid)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, created FROM triage_jobs WHERE idempotency_key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if message_sid or sent_at or now - row["created"] < self.redelivery_window:
+                        self._conn.execute("COMMIT")
+                        return row["id"], False
+                    # The same text from the same sender long after is a new message; retire the old key
+                    self._conn.execute(
+                        "UPDATE triage_jobs SET idempotency_key = idempotency_key || ':' || id WHERE id = ?",
+                        (row["id"],)
+                    )
+                cursor = self._conn.execute(
+                    "INSERT INTO triage_jobs "
+                    "(idempotency_key, phone_number, message, received_at, patient, available_at, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, phone_number, message, received_at,
+                     json.dumps(patient, default=str) if patient else None, now, now, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cursor.lastrowid, True
+
+    def claim(self, worker_id, limit=1):
+        """Lease up to `limit` jobs that are due, or whose previous lease expired.
+
+        Returns:
+            list: Job dicts; each job's attempts counter already includes this attempt.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A job whose worker keeps dying would otherwise be re-claimed forever
+                self._conn.execute(
+                    "UPDATE triage_jobs SET status = 'failed', last_error = 'Lease expired on the final attempt', "
+                    "lease_owner = NULL, lease_expires = NULL, updated = ? "
+                    "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                rows = self._conn.execute(
+                    "SELECT id FROM triage_jobs "
+                    "WHERE (status = 'queued' AND available_at <= ?) "
+                    "OR (status = 'running' AND lease_expires < ?) "
+                    "ORDER BY id LIMIT ?",
+                    (now, now, limit)
+                ).fetchall()
+                ids = [row["id"] for row in rows]
+                self._conn.executemany(
+                    "UPDATE triage_jobs SET status = 'running', attempts = attempts + 1, "
+                    "lease_owner = ?, lease_expires = ?, updated = ? WHERE id = ?",
+                    [(worker_id, now + self.visibility_timeout, now, job_id) for job_id in ids]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return [self._job(self._conn.execute("SELECT * FROM triage_jobs WHERE id = ?", (job_id,)).fetchone())
+                    for job_id in ids]
+
+    def complete(self, job_id, worker_id, result):
+        """Store a job's result if `worker_id` still holds its lease.
+
+        Returns:
+            bool: False if the lease was lost (another worker took the job over).
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE triage_jobs SET status = 'done', result = ?, last_error = NULL, "
+                "lease_owner = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (json.dumps(result, default=str), time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Record a failed attempt; retry later with backoff, or give up after max_attempts.
+
+        Returns:
+            str: The job's new status ("queued" or "failed"), or None if the lease was lost.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM triage_jobs WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (job_id, worker_id)
+            ).fetchone()
+            if row is None:
+                return None
+            status = "failed" if row["attempts"] >= self.max_attempts else "queued"
+            delay = self.retry_backoff * 2 ** (row["attempts"] - 1)
+            self._conn.execute(
+                "UPDATE triage_jobs SET status = ?, last_error = ?, available_at = ?, "
+                "lease_owner = NULL, lease_expires = NULL, updated = ? WHERE id = ?",
+                (status, str(error), now + delay, now, job_id)
+            )
+            return status
+
+    def pending(self, phone_number):
+        """Number of queued or running jobs for one phone number."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM triage_jobs WHERE phone_number = ? AND status IN ('queued', 'running')",
+                (phone_number,)
+            ).fetchone()[0]
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM triage_jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._job(row) if row else None
+
+    def jobs(self, status=None, after_id=0, limit=100, newest_first=False):
+        """Jobs in id order, optionally filtered by status, for the dashboard.
+
+        Args:
+            status: One of STATUSES, or None for all.
+            after_id: Only jobs with a larger id (for incremental reads).
+            limit: Maximum number of jobs.
+            newest_first: Return the most recent jobs first.
+        """
+        query = "SELECT * FROM triage_jobs WHERE id > ?"
+        params = [after_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY id DESC LIMIT ?" if newest_first else " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [self._job(row) for row in self._conn.execute(query, params).fetchall()]
+
+    def counts(self):
+        """Number of jobs per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM triage_jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def _job(self, row):
+        job = dict(row)
+        job["patient"] = json.loads(job["patient"]) if job["patient"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_queue(settings):
+    """Open the TriageQueue described by a QUEUE_SETTINGS-style dict."""
+    return TriageQueue(
+        settings["path"],
+        visibility_timeout=settings["visibility_timeout"],
+        max_attempts=settings["max_attempts"],
+        retry_backoff=settings["retry_backoff"],
+        redelivery_window=settings["redelivery_window"]
+    )
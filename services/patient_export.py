@@ -0,0 +1,154 @@
+"""Snapshots and columnar exports of the patient repository.
+
+A snapshot is every patient with its full history in one msgpack file (see
+models.patient.pack), for warm-starting a dashboard or copying a caseload
+without going through SQLite. The Parquet export writes one row per patient
+and one row per interaction, with the extracted symptoms as typed columns, for
+analytics over months of interactions.
+
+Usage:
+    python -m services.patient_export --parquet exports/ [--no-texts]
+    python -m services.patient_export --snapshot patients.snapshot
+"""
+import os
+import copy
+import json
+import argparse
+
+from models.patient import Patient, pack, unpack
+
+INTERACTION_TEXT_FIELDS = ("check_in_message", "patient_response", "risk_justification", "care_instructions", "summary")
+
+
+def write_snapshot(patients, path):
+    """Write patients (with their interactions, texts inlined) to one binary file."""
+    data = pack([patient.to_dict() for patient in patients])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def read_snapshot(path, store=None):
+    """Patients from a write_snapshot() file."""
+    with open(path, 'rb') as f:
+        return [Patient.from_dict(item, store) for item in unpack(f.read())]
+
+
+def _pain_level(value):
+    try:
+        return None if value is None else int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def export_parquet(patients, directory, include_texts=True, compression="zstd"):
+    """Write patients.parquet and interactions.parquet to `directory`.
+
+    Args:
+        patients: Iterable of Patient.
+        directory: Output directory (created if missing).
+        include_texts: Also export the free-text fields (reads offloaded texts back in).
+        compression: Parquet codec.
+
+    Returns:
+        tuple: (patients path, interactions path).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    patient_columns = {name: [] for name in (
+        "id", "name", "procedure", "procedure_date", "contact_info", "medical_history", "phone_number", "interactions"
+    )}
+    interaction_columns = {name: [] for name in (
+        "patient_id", "position", "timestamp", "risk_level", "risk_decision_path", "symptom_extraction_path",
+        "pain_level", "bleeding", "swelling", "fever", "extracted_symptoms"
+    ) + (INTERACTION_TEXT_FIELDS if include_texts else ())}
+
+    for patient in patients:
+        patient_columns["id"].append(patient.id)
+        patient_columns["name"].append(patient.name)
+        patient_columns["procedure"].append(patient.procedure)
+        patient_columns["procedure_date"].append(patient.procedure_date)
+        patient_columns["contact_info"].append(patient.contact_info)
+        patient_columns["medical_history"].append(patient.medical_history)
+        patient_columns["phone_number"].append(patient.phone_number)
+        patient_columns["interactions"].append(patient.interactions_offset + len(patient.interactions))
+
+        for position, interaction in enumerate(patient.interactions, patient.interactions_offset):
+            symptoms = interaction.extracted_symptoms or {}
+            interaction_columns["patient_id"].append(patient.id)
+            interaction_columns["position"].append(position)
+            interaction_columns["timestamp"].append(interaction.timestamp)
+            interaction_columns["risk_level"].append(str(interaction.risk_level))
+            interaction_columns["risk_decision_path"].append(interaction.risk_decision_path)
+            interaction_columns["symptom_extraction_path"].append(interaction.symptom_extraction_path)
+            interaction_columns["pain_level"].append(_pain_level(symptoms.get("pain_level")))
+            interaction_columns["bleeding"].append(str(symptoms["bleeding"]) if "bleeding" in symptoms else None)
+            interaction_columns["swelling"].append(str(symptoms["swelling"]) if "swelling" in symptoms else None)
+            interaction_columns["fever"].append(bool(symptoms["fever"]) if "fever" in symptoms else None)
+            interaction_columns["extracted_symptoms"].append(json.dumps(symptoms, default=str) if symptoms else None)
+            if include_texts:
+                for name in INTERACTION_TEXT_FIELDS:
+                    interaction_columns[name].append(getattr(interaction, name))
+
+    # Low-cardinality columns are dictionary-encoded
+    categorical = pa.dictionary(pa.int32(), pa.string())
+    patient_schema = pa.schema([
+        ("id", pa.string()), ("name", pa.string()), ("procedure", categorical),
+        ("procedure_date", pa.timestamp("us")), ("contact_info", pa.string()),
+        ("medical_history", pa.string()), ("phone_number", pa.string()), ("interactions", pa.int32())
+    ])
+    interaction_schema = pa.schema([
+        ("patient_id", pa.string()), ("position", pa.int32()), ("timestamp", pa.timestamp("us")),
+        ("risk_level", categorical), ("risk_decision_path", pa.string()), ("symptom_extraction_path", pa.string()),
+        ("pain_level", pa.int8()), ("bleeding", categorical), ("swelling", categorical), ("fever", pa.bool_()),
+        ("extracted_symptoms", pa.string())
+    ] + [(name, pa.string()) for name in (INTERACTION_TEXT_FIELDS if include_texts else ())])
+
+    os.makedirs(directory, exist_ok=True)
+    patients_path = os.path.join(directory, "patients.parquet")
+    interactions_path = os.path.join(directory, "interactions.parquet")
+    pq.write_table(pa.table(patient_columns, schema=patient_schema), patients_path, compression=compression)
+    pq.write_table(pa.table(interaction_columns, schema=interaction_schema), interactions_path, compression=compression)
+    return patients_path, interactions_path
+
+
+def full_histories(repository):
+    """Every patient in the repository, with the interactions it keeps out of memory read back in."""
+    patients = []
+    for patient in repository.all():
+        if patient.interactions_offset:
+            patient = copy.copy(patient)
+            patient.interactions = repository.history(patient.id)
+            patient.interactions_offset = 0
+        patients.append(patient)
+    return patients
+
+
+def main():
+    from config import PATIENT_SETTINGS
+    from services.patient_repository import create_repository
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parquet", metavar="DIR", help="write patients.parquet and interactions.parquet here")
+    parser.add_argument("--snapshot", metavar="PATH", help="write a binary snapshot of every patient")
+    parser.add_argument("--no-texts", action="store_true", help="leave free-text fields out of the Parquet export")
+    args = parser.parse_args()
+    if not args.parquet and not args.snapshot:
+        parser.error("nothing to do; pass --parquet and/or --snapshot")
+
+    repository = create_repository(PATIENT_SETTINGS)
+    patients = full_histories(repository)
+    if args.parquet:
+        paths = export_parquet(patients, args.parquet, include_texts=not args.no_texts)
+        print(f"Exported {len(patients)} patients to {', '.join(paths)}")
+    if args.snapshot:
+        size = write_snapshot(patients, args.snapshot)
+        print(f"Wrote {len(patients)} patients to {args.snapshot} ({size} bytes)")
+    repository.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+import os
+import re
+import sqlite3
+import bisect
+import logging
+import threading
+from datetime import datetime
+
+from config import PATIENT_SETTINGS
+from models.patient import Patient, PatientInteraction
+
+logger = logging.getLogger(__name__)
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(phone_number, default_country_code="1"):
+    """E.164 form of a phone number ("+15551234567"), or None if it can't be one.
+
+    Accepts the usual ways numbers get typed: spaces, dashes, dots, brackets,
+    a leading "00" international prefix, or a national number without a
+    country code (default_country_code is prepended).
+    """
+    if not phone_number:
+        return None
+    text = str(phone_number).strip()
+    digits = _NON_DIGITS.sub("", text)
+    if text.startswith("00"):
+        digits = digits[2:]
+    elif not text.startswith("+") and len(digits) <= 10:
+        # A national number; anything longer is taken to include its country code
+        digits = default_country_code + digits
+    # E.164 allows at most 15 digits; anything under 8 isn't a dialable number
+    if not 8 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return "+" + digits
+
+
+class PatientRepository:
+    """Persistent Patient records with their interaction history.
+
+    Patients live in SQLite (WAL, so the webhook, the triage workers and the
+    dashboard can share one file) and are mirrored in memory with an index by
+    id, by E.164 phone number and by procedure date, so resolving an inbound
+    SMS sender to a patient is a dict lookup. Every write also bumps the
+    patient's row in patient_changes; when SQLite's data_version shows another
+    process has committed, only the patients changed since the last seen seq
+    are reloaded before the next read.
+
+    Only each patient's most recent `loaded_interactions` interactions are kept
+    in memory (see Patient.interactions_offset); history() pages in the rest.
+    """
+
+    def __init__(self, path, default_country_code="1", loaded_interactions=None):
+        """Open (or create) the repository.
+
+        Args:
+            path: Path to the SQLite file.
+            default_country_code: Country code for numbers stored without one.
+            loaded_interactions: Interactions per patient kept in memory; None keeps them all.
+        """
+        self.path = path
+        self.default_country_code = default_country_code
+        self.loaded_interactions = loaded_interactions
+        self._lock = threading.RLock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS patients ("
+            "id TEXT PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "procedure TEXT NOT NULL, "
+            "procedure_date TEXT NOT NULL, "
+            "contact_info TEXT NOT NULL DEFAULT '', "
+            "medical_history TEXT NOT NULL DEFAULT '', "
+            "phone_number TEXT, "
+            "phone_e164 TEXT, "
+            "updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS patient_interactions ("
+            "patient_id TEXT NOT NULL REFERENCES patients (id) ON DELETE CASCADE, "
+            "position INTEGER NOT NULL, "
+            "data BLOB NOT NULL, "
+            "PRIMARY KEY (patient_id, position))"
+        )
+        # One row per patient, re-inserted (so given a new seq) by every write to it
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS patient_changes ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "patient_id TEXT NOT NULL UNIQUE)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS patients_phone ON patients (phone_e164)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS patients_procedure_date ON patients (procedure_date)")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+
+        self._data_version = None
+        self._seen_seq = None
+        self._refresh()
+
+    def _refresh(self):
+        """Bring the in-memory indexes up to date with commits made by other connections."""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+
+        if self._seen_seq is None:
+            self._load_all()
+            return
+        changes = self._conn.execute(
+            "SELECT seq, patient_id FROM patient_changes WHERE seq > ? ORDER BY seq", (self._seen_seq,)
+        ).fetchall()
+        for row in changes:
+            self._reload(row["patient_id"])
+        if changes:
+            self._seen_seq = changes[-1]["seq"]
+
+    def _load_all(self):
+        self._seen_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM patient_changes").fetchone()[0]
+        interactions = {}
+        offsets = {}
+        for row in self._conn.execute(
+            "SELECT patient_id, position, data FROM ("
+            "SELECT patient_id, position, data, "
+            "ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY position DESC) AS from_end "
+            "FROM patient_interactions) "
+            "WHERE ? IS NULL OR from_end <= ? ORDER BY patient_id, position",
+            (self.loaded_interactions, self.loaded_interactions)
+        ):
+            offsets.setdefault(row["patient_id"], row["position"])
+            interactions.setdefault(row["patient_id"], []).append(PatientInteraction.from_bytes(row["data"]))
+
+        self._by_id = {}
+        self._keys = {}
+        self._by_phone = {}
+        self._by_date = []
+        for row in self._conn.execute("SELECT * FROM patients"):
+            patient = self._from_row(row, interactions.get(row["id"], []), offsets.get(row["id"], 0))
+            self._index(patient, row["phone_e164"])
+
+    def _reload(self, patient_id):
+        """Re-read one patient written by another process (or drop it if it was deleted)."""
+        if patient_id in self._by_id:
+            self._unindex(patient_id)
+        row = self._conn.execute("SELECT * FROM patients WHERE id = ?", (patient_id,)).fetchone()
+        if row is None:
+            return
+        rows = self._conn.execute(
+            "SELECT position, data FROM patient_interactions WHERE patient_id = ? "
+            "ORDER BY position DESC LIMIT COALESCE(?, -1)", (patient_id, self.loaded_interactions)
+        ).fetchall()[::-1]
+        interactions = [PatientInteraction.from_bytes(item["data"]) for item in rows]
+        offset = rows[0]["position"] if rows else 0
+        self._index(self._from_row(row, interactions, offset), row["phone_e164"])
+
+    def _from_row(self, row, interactions, offset=0):
+        patient = Patient(
+            id=row["id"],
+            name=row["name"],
+            procedure=row["procedure"],
+            procedure_date=datetime.fromisoformat(row["procedure_date"]),
+            contact_info=row["contact_info"],
+            medical_history=row["medical_history"],
+            phone_number=row["phone_number"]
+        )
+        patient.interactions = interactions
+        patient.interactions_offset = offset
+        return patient
+
+    def _changed(self, patient_id):
+        """Log a write to a patient; call inside the writing transaction."""
+        self._conn.execute("INSERT OR REPLACE INTO patient_changes (patient_id) VALUES (?)", (patient_id,))
+
+    def _index(self, patient, phone_e164):
+        self._by_id[patient.id] = patient
+        # Keys as indexed, so a patient edited in place can still be unindexed
+        self._keys[patient.id] = (phone_e164, patient.procedure_date)
+        if phone_e164:
+            self._by_phone.setdefault(phone_e164, set()).add(patient.id)
+        bisect.insort(self._by_date, (patient.procedure_date, patient.id))
+
+    def _unindex(self, patient_id):
+        phone_e164, procedure_date = self._keys.pop(patient_id)
+        ids = self._by_phone.get(phone_e164)
+        if ids:
+            ids.discard(patient_id)
+            if not ids:
+                del self._by_phone[phone_e164]
+        position = bisect.bisect_left(self._by_date, (procedure_date, patient_id))
+        if position < len(self._by_date) and self._by_date[position] == (procedure_date, patient_id):
+            del self._by_date[position]
+        del self._by_id[patient_id]
+
+    def save(self, patient):
+        """Insert or update a patient together with its interaction history.
+
+        Interactions before patient.interactions_offset aren't in memory and
+        are left as they are; the rest of the stored history is replaced.
+
+        Returns:
+            Patient: The stored patient (the same object).
+        """
+        phone_e164 = normalize_phone(patient.phone_number, self.default_country_code)
+        with self._lock:
+            self._refresh()
+            patient.compact()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # An upsert, not INSERT OR REPLACE: replacing the row would cascade to every stored interaction
+                self._conn.execute(
+                    "INSERT INTO patients "
+                    "(id, name, procedure, procedure_date, contact_info, medical_history, phone_number, phone_e164, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET name = excluded.name, procedure = excluded.procedure, "
+                    "procedure_date = excluded.procedure_date, contact_info = excluded.contact_info, "
+                    "medical_history = excluded.medical_history, phone_number = excluded.phone_number, "
+                    "phone_e164 = excluded.phone_e164, updated = excluded.updated",
+                    (patient.id, patient.name, patient.procedure, patient.procedure_date.isoformat(),
+                     patient.contact_info or "", patient.medical_history or "", patient.phone_number,
+                     phone_e164, datetime.now().timestamp())
+                )
+                self._conn.execute(
+                    "DELETE FROM patient_interactions WHERE patient_id = ? AND position >= ?",
+                    (patient.id, patient.interactions_offset)
+                )
+                self._conn.executemany(
+                    "INSERT INTO patient_interactions (patient_id, position, data) VALUES (?, ?, ?)",
+                    [(patient.id, position, interaction.to_bytes(inline_texts=False))
+                     for position, interaction in enumerate(patient.interactions, patient.interactions_offset)]
+                )
+                self._changed(patient.id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            patient.trim(self.loaded_interactions)
+            if patient.id in self._by_id:
+                self._unindex(patient.id)
+            self._index(patient, phone_e164)
+        return patient
+
+    def get(self, patient_id):
+        with self._lock:
+            self._refresh()
+            return self._by_id.get(patient_id)
+
+    def find_by_phone(self, phone_number):
+        """The patient an inbound SMS from this number belongs to, or None.
+
+        When several patients share a number (e.g. a parent's phone), the one
+        with the most recent procedure is the one being followed up.
+        """
+        patients = self.patients_by_phone(phone_number)
+        return patients[0] if patients else None
+
+    def patients_by_phone(self, phone_number):
+        """All patients registered with this number, most recent procedure first."""
+        phone_e164 = normalize_phone(phone_number, self.default_country_code)
+        with self._lock:
+            self._refresh()
+            patients = [self._by_id[patient_id] for patient_id in self._by_phone.get(phone_e164, ())]
+        return sorted(patients, key=lambda patient: patient.procedure_date, reverse=True)
+
+    def working_copy(self, phone_number):
+        """Copy of the sender's patient record with a fresh interaction to triage into, or None.
+
+        The copy can be run through the agents without touching the stored
+        history; record_interaction() adds the result once it succeeded.
+        """
+        registered = self.find_by_phone(phone_number)
+        if registered is None:
+            return None
+        patient = Patient(
+            id=registered.id,
+            name=registered.name,
+            procedure=registered.procedure,
+            procedure_date=registered.procedure_date,
+            contact_info=registered.contact_info,
+            medical_history=registered.medical_history,
+            phone_number=registered.phone_number
+        )
+        patient.interactions = list(registered.interactions)
+        patient.interactions_offset = registered.interactions_offset
+        patient.add_interaction()
+        return patient
+
+    def record_interaction(self, patient_id, interaction):
+        """Append an interaction to a stored patient's history.
+
+        Only the new row is written, at the next position, inside one
+        transaction, so replies triaged at the same time by different
+        processes are all kept (save() would write back a stale history).
+        The interaction this pushes out of the history window then has its
+        texts offloaded.
+
+        Returns:
+            bool: False if no patient with that id is registered.
+        """
+        data = interaction.to_bytes(inline_texts=False)
+        window = PATIENT_SETTINGS["history_window"]
+        with self._lock:
+            self._refresh()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM patients WHERE id = ?", (patient_id,)).fetchone() is None:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                position = self._conn.execute(
+                    "SELECT COALESCE(MAX(position) + 1, 0) FROM patient_interactions WHERE patient_id = ?", (patient_id,)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO patient_interactions (patient_id, position, data) VALUES (?, ?, ?)",
+                    (patient_id, position, data)
+                )
+                self._conn.execute("UPDATE patients SET updated = ? WHERE id = ?", (datetime.now().timestamp(), patient_id))
+                self._changed(patient_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            # After the commit: the text store may share this database file
+            leaving = self._offload_row(patient_id, position - window)
+            patient = self._by_id.get(patient_id)
+            if patient is not None and patient.interactions_offset + len(patient.interactions) == position:
+                patient.interactions.append(interaction)
+                if leaving is not None and position - window >= patient.interactions_offset:
+                    patient.interactions[position - window - patient.interactions_offset] = leaving
+                patient.trim(self.loaded_interactions)
+            elif patient is not None:
+                # Another process added rows since our last refresh
+                self._reload(patient_id)
+            return True
+
+    def history(self, patient_id, start=0, limit=None):
+        """A page of a patient's stored interactions, read from SQLite.
+
+        Args:
+            patient_id: The patient's id.
+            start: Position of the first interaction (0 is the oldest).
+            limit: Maximum number of interactions; None reads to the end.
+
+        Returns:
+            list: PatientInteraction objects in history order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM patient_interactions WHERE patient_id = ? AND position >= ? "
+                "ORDER BY position LIMIT COALESCE(?, -1)", (patient_id, start, limit)
+            ).fetchall()
+        return [PatientInteraction.from_bytes(row["data"]) for row in rows]
+
+    def _offload_row(self, patient_id, position):
+        """Offload the texts of one stored interaction; returns it, or None if there is nothing to change."""
+        if position < 0:
+            return None
+        row = self._conn.execute(
+            "SELECT data FROM patient_interactions WHERE patient_id = ? AND position = ?", (patient_id, position)
+        ).fetchone()
+        if row is None:
+            return None
+        interaction = PatientInteraction.from_bytes(row["data"])
+        interaction.offload()
+        data = interaction.to_bytes(inline_texts=False)
+        if data == bytes(row["data"]):
+            return None
+        # Same texts either way, so only skip it if another process rewrote the row meanwhile
+        updated = self._conn.execute(
+            "UPDATE patient_interactions SET data = ? WHERE patient_id = ? AND position = ? AND data = ?",
+            (data, patient_id, position, row["data"])
+        )
+        return interaction if updated.rowcount else None
+
+    def by_procedure_date(self, start, end=None):
+        """Patients whose procedure falls in [start, end), in date order (end=None: no upper bound)."""
+        with self._lock:
+            self._refresh()
+            low = bisect.bisect_left(self._by_date, (start,))
+            high = bisect.bisect_left(self._by_date, (end,)) if end is not None else len(self._by_date)
+            return [self._by_id[patient_id] for _, patient_id in self._by_date[low:high]]
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return list(self._by_id.values())
+
+    def delete(self, patient_id):
+        with self._lock:
+            self._refresh()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+                self._changed(patient_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if patient_id in self._by_id:
+                self._unindex(patient_id)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._by_id)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_repository(settings):
+    """Open the PatientRepository described by a PATIENT_SETTINGS-style dict."""
+    return PatientRepository(
+        settings["path"],
+        default_country_code=settings["default_country_code"],
+        loaded_interactions=settings["loaded_interactions"]
+    )
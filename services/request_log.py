@@ -0,0 +1,91 @@
+"""Structured, sampled and redacted request logging for the webhook server.
+
+Each request gets one JSON log line (logger "followcare.requests") with its
+method, route, status, duration and request id. Successful requests are
+sampled at `sample_rate`; errors and slow requests are always logged. Message
+bodies, headers and query strings are never logged: phone numbers are masked
+to their last four digits, and of a Twilio callback only the non-identifying
+fields (MessageSid, NumSegments, ...) and the body length are kept.
+"""
+import json
+import time
+import uuid
+import random
+import logging
+
+from flask import g, request
+
+logger = logging.getLogger("followcare.requests")
+
+# Twilio callback fields that identify nobody and are safe to log as-is
+SAFE_FORM_FIELDS = ("MessageSid", "SmsSid", "AccountSid", "MessagingServiceSid", "NumMedia", "NumSegments",
+                    "SmsStatus", "ApiVersion")
+
+
+def redact_phone(phone_number):
+    """"+1******7940" for "+16046797940"; anything shorter than 5 digits is masked entirely."""
+    if not phone_number:
+        return phone_number
+    text = str(phone_number)
+    digits = sum(ch.isdigit() for ch in text)
+    if digits < 5:
+        return "*" * len(text)
+    keep_prefix = 2 if text.startswith("+") else 0
+    return text[:keep_prefix] + "*" * (len(text) - keep_prefix - 4) + text[-4:]
+
+
+def redacted_form(form):
+    """The loggable part of a Twilio form: safe fields, masked numbers and the body's length."""
+    fields = {name: form[name] for name in SAFE_FORM_FIELDS if name in form}
+    for name in ("From", "To"):
+        if name in form:
+            fields[name] = redact_phone(form[name])
+    if "Body" in form:
+        fields["body_chars"] = len(form["Body"])
+    return fields
+
+
+class RequestLogger:
+    """Flask extension that writes one structured line per (sampled) request."""
+
+    def __init__(self, app=None, sample_rate=1.0, slow_seconds=1.0):
+        """Set up the logger and, if given, register it on `app`.
+
+        Args:
+            sample_rate: Fraction of successful, fast requests to log (0 logs only errors and slow ones).
+            slow_seconds: Requests taking at least this long are always logged.
+        """
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+
+    def _before(self):
+        g.request_started = time.perf_counter()
+        # Behind a proxy the id it assigned is kept, so log lines can be correlated
+        g.request_id = request.headers.get("X-Request-Id") or uuid.uuid4().hex
+
+    def _after(self, response):
+        duration = time.perf_counter() - g.get("request_started", time.perf_counter())
+        response.headers["X-Request-Id"] = g.get("request_id", "")
+        if response.status_code < 400 and duration < self.slow_seconds and random.random() >= self.sample_rate:
+            return response
+
+        record = {
+            "event": "request",
+            "request_id": g.get("request_id"),
+            "method": request.method,
+            # The route pattern, not the path, so phone numbers in URLs aren't logged
+            "route": request.url_rule.rule if request.url_rule else "<unmatched>",
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 1)
+        }
+        if request.form:
+            record["form"] = redacted_form(request.form)
+        level = logging.WARNING if response.status_code >= 500 or duration >= self.slow_seconds else logging.INFO
+        logger.log(level, json.dumps(record))
+        return response
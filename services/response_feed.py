@@ -0,0 +1,138 @@
+import json
+import copy
+import logging
+import threading
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseFeed:
+    """Client-side mirror of the webhook's patient responses, kept current over Server-Sent Events.
+
+    A background thread loads one snapshot from ``GET /responses`` and then
+    follows ``GET /events/stream`` from the snapshot's cursor, applying each
+    event to a local copy. Readers (the Streamlit dashboard) only ever touch the
+    local copy, so checking for new responses costs no network round-trip.
+    """
+
+    def __init__(self, base_url, reconnect_delay=2.0, read_timeout=60):
+        """
+        Args:
+            base_url: Webhook server URL, e.g. "http://127.0.0.1:5000".
+            reconnect_delay: Seconds to wait before reconnecting after an error.
+            read_timeout: Socket read timeout; must exceed the server heartbeat interval.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.reconnect_delay = reconnect_delay
+        self.read_timeout = read_timeout
+
+        self._lock = threading.Lock()
+        self._patients = {}
+        self._cursor = None
+        self._version = 0
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        """Incremented on every change to the local copy."""
+        with self._lock:
+            return self._version
+
+    @property
+    def cursor(self):
+        with self._lock:
+            return self._cursor
+
+    @property
+    def error(self):
+        """Last connection error, or None while connected."""
+        with self._lock:
+            return self._error
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="response-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def patients(self):
+        """Copy of every patient entry keyed by phone number (same shape as GET /responses)."""
+        with self._lock:
+            return copy.deepcopy(self._patients)
+
+    def mark_processed(self, phone_number):
+        """Apply a processed flag locally right away, ahead of the server's event."""
+        self._apply({"op": "processed", "phone": phone_number})
+
+    def _apply(self, event):
+        with self._lock:
+            entry = self._patients.setdefault(event["phone"], {"responses": [], "processed": False})
+            if event["op"] == "response":
+                entry["responses"].append({"timestamp": event["timestamp"], "message": event["message"]})
+                entry["processed"] = False
+            elif event["op"] == "processed":
+                entry["processed"] = True
+            if "seq" in event:
+                self._cursor = max(self._cursor or 0, event["seq"])
+            self._version += 1
+
+    def _load_snapshot(self):
+        response = requests.get(f"{self.base_url}/responses", timeout=10)
+        response.raise_for_status()
+        cursor = response.headers.get("X-Response-Cursor")
+        with self._lock:
+            self._patients = response.json()
+            self._cursor = int(cursor) if cursor is not None else 0
+            self._version += 1
+
+    def _follow(self):
+        response = requests.get(
+            f"{self.base_url}/events/stream",
+            params={"cursor": self.cursor},
+            stream=True,
+            timeout=(5, self.read_timeout)
+        )
+        with response:
+            response.raise_for_status()
+            with self._lock:
+                self._error = None
+
+            data = []
+            for line in response.iter_lines(decode_unicode=True):
+                if self._stop.is_set():
+                    return
+                if line:
+                    # Only data lines matter; the event's seq travels inside the JSON
+                    if line.startswith("data:"):
+                        data.append(line[5:].lstrip())
+                    continue
+                if data:
+                    self._apply(json.loads("\n".join(data)))
+                    data = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.cursor is None:
+                    self._load_snapshot()
+                self._follow()
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Response feed disconnected: {e}")
+                with self._lock:
+                    self._error = str(e)
+                self._stop.wait(self._retry_after(e))
+
+    def _retry_after(self, error):
+        """Seconds to wait before reconnecting; a server with no stream to spare (503) says how long."""
+        response = getattr(error, "response", None)
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return max(self.reconnect_delay, int(response.headers["Retry-After"]))
+        return self.reconnect_delay
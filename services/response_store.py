@@ -0,0 +1,584 @@
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _is_duplicate(stored_at, dedupe_window):
+    """Whether a response stored at ISO time `stored_at` under the same key still counts as this one."""
+    if stored_at is None:
+        return False
+    if dedupe_window is None:
+        return True
+    return (datetime.now() - datetime.fromisoformat(stored_at)).total_seconds() < dedupe_window
+
+
+class ResponseStore(ABC):
+    """Base class for patient response storage backends.
+
+    Every backend exposes the same per-patient shape the webhook API has always
+    returned: ``{"responses": [{"timestamp", "message"}, ...], "processed": bool}``.
+    """
+
+    @abstractmethod
+    def append_response(self, phone_number, message, timestamp=None, idempotency_key=None, dedupe_window=None):
+        """Append a new response for a patient and mark them unprocessed.
+
+        Args:
+            phone_number: The sender's phone number.
+            message: The SMS body.
+            timestamp: Optional ISO timestamp (defaults to now).
+            idempotency_key: Optional key of the inbound SMS (see services.job_queue.idempotency_key);
+                a response already stored under the same key is not appended again.
+            dedupe_window: Seconds a key stays a duplicate after it was stored; None means forever.
+
+        Returns:
+            dict: The stored response record, or None if the key was already stored.
+        """
+        pass
+
+    @abstractmethod
+    def get_patient(self, phone_number):
+        """Get the responses and processed flag for one patient.
+
+        Args:
+            phone_number: The patient's phone number.
+
+        Returns:
+            dict: The patient entry, or None if the number is unknown.
+        """
+        pass
+
+    @abstractmethod
+    def mark_processed(self, phone_number):
+        """Mark a patient's responses as processed.
+
+        Args:
+            phone_number: The patient's phone number.
+
+        Returns:
+            bool: True if the patient exists, False otherwise.
+        """
+        pass
+
+    @abstractmethod
+    def phone_numbers(self):
+        """Return all known phone numbers."""
+        pass
+
+    def all(self):
+        """Return every patient entry keyed by phone number."""
+        return {phone: self.get_patient(phone) for phone in self.phone_numbers()}
+
+    def last_seq(self):
+        """Sequence number of the latest event, or None for backends without one."""
+        return None
+
+    def query(self, processed=None, since=None, limit=None, cursor=None):
+        """Return one page of patient entries, optionally filtered.
+
+        Args:
+            processed: Only patients whose processed flag equals this (None for all).
+            since: Only patients changed after this point: an event sequence
+                number (int) or an ISO timestamp compared with the latest response.
+            limit: Maximum number of patients in the page (None for no limit).
+            cursor: Opaque cursor from a previous page's next_cursor.
+
+        Returns:
+            tuple: (dict of phone -> patient entry, next_cursor or None when there are no more pages).
+        """
+        if isinstance(since, int):
+            raise NotImplementedError(f"{type(self).__name__} does not record an event sequence")
+
+        # Generic fallback: walk all() in order; the cursor is a position in that order
+        items = list(self.all().items())
+        page = {}
+        next_cursor = None
+        for position in range(int(cursor) if cursor else 0, len(items)):
+            phone_number, entry = items[position]
+            if processed is not None and entry["processed"] != processed:
+                continue
+            latest = entry["responses"][-1]["timestamp"] if entry["responses"] else ""
+            if since and latest <= since:
+                continue
+            if limit is not None and len(page) >= limit:
+                next_cursor = str(position)
+                break
+            page[phone_number] = entry
+        return page, next_cursor
+
+    def snapshot(self):
+        """Return (cursor, all()) taken atomically, so a subscriber can resume from the cursor.
+
+        Backends without event sequence numbers return a None cursor.
+        """
+        return None, self.all()
+
+    def events_since(self, cursor, limit=None):
+        """Return store events with a sequence number greater than `cursor`.
+
+        Args:
+            cursor: Last sequence number the caller has seen (0 for everything).
+            limit: Optional maximum number of events to return.
+
+        Returns:
+            list: Event dicts (``op``, ``phone``, ``seq`` plus ``timestamp``/``message`` for responses).
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not record an event sequence")
+
+    def wait_for_events(self, cursor, timeout, limit=None, poll_interval=0.5):
+        """Block until there are events after `cursor` or `timeout` seconds pass.
+
+        Returns:
+            list: The new events, or an empty list on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.events_since(cursor, limit)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            time.sleep(min(poll_interval, remaining))
+
+    def close(self):
+        """Release any resources held by the store."""
+        pass
+
+
+class JSONFileResponseStore(ResponseStore):
+    """Legacy store that rewrites a single pretty-printed JSON file on every change.
+
+    Kept for compatibility and as the source format for migration. Every write is
+    O(total history), so prefer AppendLogResponseStore for anything but demos.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    return json.load(f)
+            return {}
+        except Exception as e:
+            logger.error(f"Error loading patient database: {e}")
+            return {}
+
+    def _save(self, db):
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(db, f, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving patient database: {e}")
+
+    def append_response(self, phone_number, message, timestamp=None, idempotency_key=None, dedupe_window=None):
+        record = {
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "message": message
+        }
+        with self._lock:
+            db = self._load()
+            entry = db.setdefault(phone_number, {"responses": [], "processed": False})
+            if idempotency_key:
+                stored_at = next(
+                    (r["timestamp"] for r in reversed(entry["responses"]) if r.get("key") == idempotency_key), None
+                )
+                if _is_duplicate(stored_at, dedupe_window):
+                    return None
+                record["key"] = idempotency_key
+            entry["responses"].append(record)
+            entry["processed"] = False
+            self._save(db)
+        return record
+
+    def get_patient(self, phone_number):
+        return self._load().get(phone_number)
+
+    def mark_processed(self, phone_number):
+        with self._lock:
+            db = self._load()
+            if phone_number not in db:
+                return False
+            db[phone_number]["processed"] = True
+            self._save(db)
+        return True
+
+    def phone_numbers(self):
+        return list(self._load().keys())
+
+    def all(self):
+        return self._load()
+
+
+class AppendLogResponseStore(ResponseStore):
+    """Append-only JSON-lines store with an in-memory phone -> offsets index.
+
+    Each line is one event: either a ``response`` (an inbound SMS) or a
+    ``processed`` marker. Writes append a single line, reads seek directly to the
+    offsets recorded for one phone number, so no request touches the rest of the
+    history. Writers take an exclusive ``flock`` so several webhook processes can
+    share one log; each process tails new bytes into its index before reading.
+    """
+
+    def __init__(self, path, fsync=True):
+        """Open (or create) the log and build the index.
+
+        Args:
+            path: Path to the log file.
+            fsync: fsync after every append so acknowledged SMS survive a crash.
+        """
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        # Signalled on every local append so waiting subscribers wake immediately
+        self._changed = threading.Condition(self._lock)
+        self._index = {}
+        self._seq = 0
+        self._end = 0
+        # Parallel lists of every event's seq, offset and phone, in log order, for cursor reads
+        self._event_seqs = []
+        self._event_offsets = []
+        self._event_phones = []
+        # Idempotency key -> timestamp of the response stored under it
+        self._keys = {}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a+b')
+
+        with self._lock:
+            self._catch_up()
+
+    def _entry(self, phone_number):
+        entry = self._index.get(phone_number)
+        if entry is None:
+            entry = {"offsets": [], "processed": False, "last_seq": 0, "last_timestamp": ""}
+            self._index[phone_number] = entry
+        return entry
+
+    def _apply(self, event, offset):
+        """Update the in-memory index with one decoded event."""
+        seq = event.get("seq", self._seq + 1)
+        self._seq = max(self._seq, seq)
+        self._event_seqs.append(seq)
+        self._event_offsets.append(offset)
+        self._event_phones.append(event["phone"])
+        entry = self._entry(event["phone"])
+        entry["last_seq"] = seq
+        if event["op"] == "response":
+            entry["offsets"].append(offset)
+            entry["processed"] = False
+            entry["last_timestamp"] = event["timestamp"]
+            if event.get("key"):
+                self._keys[event["key"]] = event["timestamp"]
+        elif event["op"] == "processed":
+            entry["processed"] = True
+
+    def _catch_up(self):
+        """Index any complete lines appended since the last read (by any process)."""
+        size = os.fstat(self._file.fileno()).st_size
+        if size <= self._end:
+            return
+
+        self._file.seek(self._end)
+        offset = self._end
+        while offset < size:
+            line = self._file.readline()
+            if not line.endswith(b'\n'):
+                # A writer in another process is mid-append; pick it up next time
+                break
+            try:
+                self._apply(json.loads(line), offset)
+            except (ValueError, KeyError) as e:
+                logger.error(f"Skipping corrupt record at offset {offset} in {self.path}: {e}")
+            offset += len(line)
+        self._end = offset
+
+    def _lock_file(self):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(self):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _append(self, event, skip_if=None):
+        """Append one event under the file lock and index it.
+
+        Args:
+            event: The event dict; its ``seq`` is assigned here.
+            skip_if: Optional callable checked after catching up, still under the
+                file lock; the event is not written when it returns True.
+
+        Returns:
+            int: The byte offset the event was written at, or None if it was skipped.
+        """
+        with self._lock:
+            self._lock_file()
+            try:
+                self._catch_up()
+                if skip_if is not None and skip_if():
+                    return None
+                event["seq"] = self._seq + 1
+                line = (json.dumps(event, separators=(',', ':')) + '\n').encode('utf-8')
+
+                self._file.seek(0, os.SEEK_END)
+                offset = self._file.tell()
+                self._file.write(line)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+
+                self._end = offset + len(line)
+                self._apply(event, offset)
+                self._changed.notify_all()
+                return offset
+            finally:
+                self._unlock_file()
+
+    def _read_at(self, offset):
+        self._file.seek(offset)
+        return json.loads(self._file.readline())
+
+    def append_response(self, phone_number, message, timestamp=None, idempotency_key=None, dedupe_window=None):
+        event = {
+            "op": "response",
+            "phone": phone_number,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "message": message
+        }
+        skip_if = None
+        if idempotency_key:
+            event["key"] = idempotency_key
+            # Checked under the file lock, so two processes handling the same redelivery can't both append
+            skip_if = lambda: _is_duplicate(self._keys.get(idempotency_key), dedupe_window)
+        if self._append(event, skip_if) is None:
+            return None
+        return {"timestamp": event["timestamp"], "message": message}
+
+    def _patient(self, entry):
+        responses = []
+        for offset in entry["offsets"]:
+            event = self._read_at(offset)
+            responses.append({"timestamp": event["timestamp"], "message": event["message"]})
+        return {"responses": responses, "processed": entry["processed"]}
+
+    def get_patient(self, phone_number):
+        with self._lock:
+            self._catch_up()
+            entry = self._index.get(phone_number)
+            if entry is None:
+                return None
+            return self._patient(entry)
+
+    def mark_processed(self, phone_number):
+        with self._lock:
+            self._catch_up()
+            if phone_number not in self._index:
+                return False
+            self._append({"op": "processed", "phone": phone_number})
+        return True
+
+    def phone_numbers(self):
+        with self._lock:
+            self._catch_up()
+            return list(self._index.keys())
+
+    def last_seq(self):
+        with self._lock:
+            self._catch_up()
+            return self._seq
+
+    def query(self, processed=None, since=None, limit=None, cursor=None):
+        """Page through patients in order of their latest event, using only the in-memory index.
+
+        Both an integer `since` and the cursor are event sequence numbers, so a
+        patient that changes while a client is paging shows up again on a later
+        page. Only the patients on the returned page are read from disk.
+        """
+        with self._lock:
+            self._catch_up()
+            start_seq = int(cursor) if cursor else 0
+            since_timestamp = None
+            if isinstance(since, int):
+                start_seq = max(start_seq, since)
+            elif since:
+                since_timestamp = since
+
+            page = {}
+            next_cursor = None
+            last_included = start_seq
+            for position in range(bisect.bisect_right(self._event_seqs, start_seq), len(self._event_seqs)):
+                seq = self._event_seqs[position]
+                entry = self._index[self._event_phones[position]]
+                if entry["last_seq"] != seq:
+                    # The patient changed again later and is listed at that position
+                    continue
+                if processed is not None and entry["processed"] != processed:
+                    continue
+                if since_timestamp and entry["last_timestamp"] <= since_timestamp:
+                    continue
+                if limit is not None and len(page) >= limit:
+                    next_cursor = str(last_included)
+                    break
+                page[self._event_phones[position]] = self._patient(entry)
+                last_included = seq
+            return page, next_cursor
+
+    def snapshot(self):
+        with self._lock:
+            self._catch_up()
+            return self._seq, self.all()
+
+    def events_since(self, cursor, limit=None):
+        with self._lock:
+            self._catch_up()
+            start = bisect.bisect_right(self._event_seqs, cursor)
+            stop = len(self._event_offsets) if limit is None else min(len(self._event_offsets), start + limit)
+            return [self._read_at(offset) for offset in self._event_offsets[start:stop]]
+
+    def wait_for_events(self, cursor, timeout, limit=None, poll_interval=0.5):
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                events = self.events_since(cursor, limit)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                # Local appends notify; the timeout also picks up other processes' writes
+                self._changed.wait(min(poll_interval, remaining))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+STORE_BACKENDS = {
+    "log": AppendLogResponseStore,
+    "json": JSONFileResponseStore,
+}
+
+
+def create_store(backend, path, **kwargs):
+    """Create a response store by backend name.
+
+    Args:
+        backend: One of the keys in STORE_BACKENDS ("log" or "json").
+        path: File path for the backend.
+        **kwargs: Extra backend-specific options.
+
+    Returns:
+        ResponseStore: The configured store.
+    """
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown response store backend '{backend}'. Options: {', '.join(STORE_BACKENDS)}")
+    return STORE_BACKENDS[backend](path, **kwargs)
+
+
+def open_store(settings):
+    """Open the store described by a STORAGE_SETTINGS-style dict.
+
+    When the store's file doesn't exist yet, an existing legacy JSON file
+    (settings["legacy_json_path"]) is migrated into it first.
+    """
+    legacy_path = settings["legacy_json_path"]
+    if settings["backend"] == "json":
+        return create_store("json", legacy_path)
+
+    path = settings["path"]
+    if not os.path.exists(path) and os.path.exists(legacy_path):
+        create_migrated_log(legacy_path, path)
+    return create_store(settings["backend"], path, fsync=settings["fsync"])
+
+
+def create_migrated_log(json_path, path):
+    """Create the log at `path` from a legacy JSON file, all at once or not at all.
+
+    The events are written to a temporary file that is only linked into place
+    once it is complete and synced, so a crash mid-migration leaves no log
+    behind and the next start migrates again from scratch. When several
+    processes start together, the first link wins and the others discard
+    their copy.
+
+    Returns:
+        bool: True if this call created the log, False if it already existed.
+    """
+    tmp_path = f"{path}.{os.getpid()}.migrating"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        tmp_store = AppendLogResponseStore(tmp_path, fsync=False)
+        try:
+            migrate_json_store(json_path, tmp_store)
+            os.fsync(tmp_store._file.fileno())
+        finally:
+            tmp_store.close()
+
+        # Unlike a rename, link() never replaces a log another process already created
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        logger.info(f"{path} was created by another process; discarding this migration")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def migrate_json_store(json_path, store):
+    """One-shot copy of a legacy patient_responses.json file into another store.
+
+    Response timestamps and the processed flag of each patient are preserved.
+
+    Args:
+        json_path: Path to the legacy JSON file.
+        store: The destination ResponseStore.
+
+    Returns:
+        int: Number of responses migrated.
+    """
+    with open(json_path, 'r') as f:
+        db = json.load(f)
+
+    migrated = 0
+    for phone_number, data in db.items():
+        for response in data.get("responses", []):
+            store.append_response(phone_number, response.get("message", ""), response.get("timestamp"))
+            migrated += 1
+        if data.get("processed"):
+            store.mark_processed(phone_number)
+
+    logger.info(f"Migrated {migrated} responses for {len(db)} patients from {json_path}")
+    return migrated
+
+
+if __name__ == '__main__':
+    # Usage: python -m services.response_store <patient_responses.json> <patient_responses.log>
+    if len(sys.argv) != 3:
+        print("Usage: python -m services.response_store <source.json> <destination.log>")
+        sys.exit(1)
+
+    source, destination = sys.argv[1], sys.argv[2]
+    if os.path.exists(destination):
+        print(f"Refusing to migrate into existing log {destination}")
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO)
+    if not create_migrated_log(source, destination):
+        print(f"{destination} was created while migrating; left it as it is")
+        sys.exit(1)
+    print(f"Migrated {source} into {destination}")
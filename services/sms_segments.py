@@ -0,0 +1,197 @@
+"""SMS encoding, segment counting and segment-aware message splitting.
+
+Carriers bill per segment, not per message. A body that only uses the GSM-7
+alphabet fits 160 septets in one segment (153 per segment once concatenated);
+a single character outside it switches the whole body to UCS-2, where a
+segment holds 70 UTF-16 code units (67 concatenated). Characters from the GSM-7
+extension table ({ } [ ] ~ | ^ \\ and the euro sign) take two septets.
+"""
+import re
+import math
+
+GSM7_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED = frozenset("\f^{}\\[]~|€")
+
+GSM7 = "GSM-7"
+UCS2 = "UCS-2"
+
+# (single-segment capacity, per-segment capacity when concatenated)
+SEGMENT_LIMITS = {
+    GSM7: (160, 153),
+    UCS2: (70, 67),
+}
+
+PART_HEADER = "(Part {index}/{total}) "
+# Room kept in every part of a split message for its header
+HEADER_RESERVE = len(PART_HEADER.format(index=99, total=99))
+
+# Look-alike characters LLM output is full of that would force the whole body
+# into UCS-2 (less than half the capacity per segment)
+SMART_REPLACEMENTS = {
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u2032": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u2033": '"',
+    "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2013": "-", "\u2014": "-", "\u2212": "-",
+    "\u2022": "-", "\u00b7": "-", "\u25cf": "-",
+    "\u2026": "...",
+    "\u00a0": " ", "\u2009": " ", "\u202f": " ", "\t": " ",
+    "\u200b": "", "\u00ad": "", "\ufeff": "",
+}
+
+# Twilio rejects bodies longer than this many characters
+MAX_BODY_CHARS = 1600
+
+_NON_GSM7 = re.compile("[^" + re.escape("".join(sorted(GSM7_BASIC | GSM7_EXTENDED))) + "]")
+_SMART_CHAR = re.compile("[" + "".join(SMART_REPLACEMENTS) + "]")
+_GSM7_EXTENDED_CHAR = re.compile("[" + re.escape("".join(sorted(GSM7_EXTENDED))) + "]")
+
+
+def smart_encode(text):
+    """Replace typographic look-alikes (curly quotes, dashes, bullets...) with GSM-7 characters."""
+    # A regex substitution only does work per match; str.translate walks every character in Python
+    return _SMART_CHAR.sub(lambda match: SMART_REPLACEMENTS[match.group()], text)
+
+
+def _utf16_units(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def encoding_for(text):
+    """GSM7 if every character is in the GSM-7 alphabet, otherwise UCS2."""
+    return UCS2 if _NON_GSM7.search(text) else GSM7
+
+
+def message_length(text):
+    """(encoding, length in that encoding's units: septets or UTF-16 code units)."""
+    if _NON_GSM7.search(text):
+        return UCS2, _utf16_units(text)
+    return GSM7, len(text) + len(_GSM7_EXTENDED_CHAR.findall(text))
+
+
+def _segments(encoding, length):
+    single, multi = SEGMENT_LIMITS[encoding]
+    if length == 0:
+        return 0
+    return 1 if length <= single else math.ceil(length / multi)
+
+
+def segment_count(text):
+    """Number of billable segments for one SMS body.
+
+    Doesn't model a carrier moving an escaped character or a surrogate pair to
+    the next segment, which can add one segment in rare cases.
+    """
+    return _segments(*message_length(text))
+
+
+def _part_capacity(encoding, max_segments):
+    # Whole segments only (a part that ends mid-segment pays for the rest of it),
+    # within Twilio's body limit and minus room for the part header
+    per_segment = SEGMENT_LIMITS[encoding][1]
+    segments = MAX_BODY_CHARS // per_segment
+    if max_segments:
+        segments = min(segments, max_segments)
+    return segments * per_segment - HEADER_RESERVE
+
+
+def _fit_gsm7(text, start, end, capacity):
+    # Extended characters take two septets; trim the window until it fits
+    septets = end - start + len(_GSM7_EXTENDED_CHAR.findall(text, start, end))
+    while septets > capacity:
+        end -= max(1, (septets - capacity) // 2)
+        septets = end - start + len(_GSM7_EXTENDED_CHAR.findall(text, start, end))
+    return end
+
+
+def _fit(text, start, max_segments):
+    """End of the longest text[start:end] that fits one part, measured in its own encoding."""
+    n = len(text)
+    gsm_capacity = _part_capacity(GSM7, max_segments)
+    end = min(n, start + gsm_capacity)
+    non_gsm = _NON_GSM7.search(text, start, end)
+    if non_gsm is None:
+        return _fit_gsm7(text, start, end, gsm_capacity)
+
+    # Either a GSM-7 part that stops before the first non-GSM character, or a
+    # UCS-2 part; whichever carries more text per segment
+    ucs_capacity = _part_capacity(UCS2, max_segments)
+    ucs_end = min(n, start + ucs_capacity)
+    # Characters outside the BMP take two code units; every character takes at least one
+    units = _utf16_units(text[start:ucs_end])
+    while units > ucs_capacity:
+        ucs_end -= units - ucs_capacity
+        units = _utf16_units(text[start:ucs_end])
+    gsm_end = _fit_gsm7(text, start, non_gsm.start(), gsm_capacity)
+    if gsm_end == start:
+        return ucs_end
+    gsm_septets = gsm_end - start + len(_GSM7_EXTENDED_CHAR.findall(text, start, gsm_end))
+    gsm_rate = (gsm_end - start) / _segments(GSM7, gsm_septets + HEADER_RESERVE)
+    ucs_rate = (ucs_end - start) / _segments(UCS2, units + HEADER_RESERVE)
+    return gsm_end if gsm_rate >= ucs_rate else ucs_end
+
+
+def _total_segments(parts):
+    if len(parts) == 1:
+        return segment_count(parts[0])
+    return sum(segment_count(PART_HEADER.format(index=i + 1, total=len(parts)) + part)
+               for i, part in enumerate(parts))
+
+
+def split_message(text, max_segments=None):
+    """Split a message into SMS bodies that cost as few segments as possible.
+
+    Longer messages are cut greedily into parts that fill whole segments,
+    leaving room for a PART_HEADER, at the last whitespace that fits (a hard
+    cut only for a single unbroken word). Each part is measured in its own
+    encoding, so a part that happens to be pure GSM-7 isn't billed as UCS-2
+    because an emoji shows up elsewhere in the message.
+
+    A message within Twilio's 1600-character limit (and `max_segments`, if
+    given) is sent whole when it is GSM-7, since one concatenated message never
+    costs more segments than the same text split up. A UCS-2 message is split
+    anyway if that is cheaper, e.g. when one emoji would otherwise more than
+    double the cost of a long GSM-7 text.
+
+    Every step is a slice, regex search or rfind over the remaining text, so
+    the work is linear in the message length.
+
+    Args:
+        text: The message body.
+        max_segments: Optional cap on segments per part (Twilio recommends
+            at most 10 for deliverability). None allows as many as fit in 1600
+            characters.
+
+    Returns:
+        list: Message parts, without headers.
+    """
+    if len(text) <= MAX_BODY_CHARS and (not max_segments or segment_count(text) <= max_segments):
+        if encoding_for(text) == GSM7:
+            return [text]
+        parts = _split(text, max_segments)
+        return parts if _total_segments(parts) < segment_count(text) else [text]
+    return _split(text, max_segments)
+
+
+def _split(text, max_segments):
+    parts = []
+    n = len(text)
+    start = 0
+    while start < n:
+        # Parts never start with the whitespace they were cut at
+        while start < n and text[start].isspace():
+            start += 1
+        if start == n:
+            break
+        end = _fit(text, start, max_segments)
+        if end >= n:
+            parts.append(text[start:].rstrip())
+            break
+        # Cut at the last space or newline in the window (text[end] itself counts)
+        cut = max(text.rfind(" ", start + 1, end + 1), text.rfind("\n", start + 1, end + 1))
+        if cut <= start:
+            cut = end
+        parts.append(text[start:cut].rstrip())
+        start = cut
+    return parts
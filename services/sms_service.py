@@ -1,23 +1,118 @@
 import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
 from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
 from dotenv import load_dotenv
 
+from config import SMS_SETTINGS
+from .sms_segments import PART_HEADER, smart_encode, split_message
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
+
+class Throttle:
+    """Thread-safe token bucket allowing `rate` acquisitions per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                # Holding the lock while waiting keeps the other senders queued in order
+                time.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class BulkSendResult:
+    """Outcome of sending one recipient's message in send_bulk()."""
+    to_number: str
+    message_sids: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    attempts: int = 0
+    duration: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _is_retryable(error):
+    """Rate limiting (429) and server errors are worth retrying; bad numbers etc. are not."""
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    # Connection resets and timeouts from the HTTP client (requests errors are OSErrors)
+    return isinstance(error, OSError)
+
+
 class SMSService:
     """Service for sending SMS messages to patients."""
     
-    def __init__(self):
-        """Initialize the SMS service with Twilio credentials."""
+    def __init__(self, messages_per_second=None, client=None, phone_number=None):
+        """Initialize the SMS service with Twilio credentials.
+        
+        Args:
+            messages_per_second: Cap on Twilio API calls per second across all threads
+                (defaults to SMS_SETTINGS["messages_per_second"]).
+            client: Object with Twilio's client.messages.create() to send through instead of
+                a real Twilio Client (e.g. a stub for load tests); credentials aren't needed then.
+            phone_number: Sender number (defaults to TWILIO_PHONE_NUMBER).
+        """
         account_sid = os.getenv("TWILIO_ACCOUNT_SID")
         auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-        self.phone_number = os.getenv("TWILIO_PHONE_NUMBER")
+        self.phone_number = phone_number or os.getenv("TWILIO_PHONE_NUMBER")
         
-        if not account_sid or not auth_token or not self.phone_number:
+        if client is None and (not account_sid or not auth_token or not self.phone_number):
             raise ValueError("Twilio credentials not found in environment variables.")
         
-        self.client = Client(account_sid, auth_token)
+        self.client = client if client is not None else Client(account_sid, auth_token)
+        self.throttle = Throttle(messages_per_second or SMS_SETTINGS["messages_per_second"])
+        self._attempts = threading.local()
+    
+    def _create(self, to_number, body):
+        """Send one SMS through the throttle, retrying 429/5xx with jittered exponential backoff.
+        
+        Returns:
+            str: The message SID.
+        """
+        max_retries = SMS_SETTINGS["max_retries"]
+        for attempt in range(max_retries + 1):
+            self.throttle.acquire()
+            self._attempts.count = getattr(self._attempts, "count", 0) + 1
+            try:
+                message = self.client.messages.create(
+                    body=body,
+                    from_=self.phone_number,
+                    to=to_number
+                )
+                return message.sid
+            except Exception as e:
+                if attempt == max_retries or not _is_retryable(e):
+                    raise
+                # Full jitter so throttled senders don't retry in lockstep
+                delay = random.uniform(0, min(SMS_SETTINGS["retry_max_delay"], SMS_SETTINGS["retry_base_delay"] * 2 ** attempt))
+                logger.warning(f"SMS to {to_number} failed ({e}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                time.sleep(delay)
     
     def send_message(self, to_number, message_body):
         """Send an SMS message to a patient.
@@ -30,101 +125,62 @@ class SMSService:
             list: A list of message SIDs if successful, empty list otherwise
         """
         try:
-            max_length = 1500  
+            if SMS_SETTINGS["smart_encoding"]:
+                message_body = smart_encode(message_body)
             
             # If message is too long, split it into multiple parts
-            if len(message_body) > max_length:
-                message_sids = []
-                
-                parts = self._split_message(message_body, max_length)
-                
-                for i, part in enumerate(parts):
-                    if len(parts) > 1:
-                        part_header = f"(Part {i+1}/{len(parts)}) "
-                        part = part_header + part
-                    
-                    message = self.client.messages.create(
-                        body=part,
-                        from_=self.phone_number,
-                        to=to_number
-                    )
-                    message_sids.append(message.sid)
-                
-                return message_sids
-            else:
-                message = self.client.messages.create(
-                    body=message_body,
-                    from_=self.phone_number,
-                    to=to_number
-                )
-                return [message.sid]
+            parts = split_message(message_body, SMS_SETTINGS["max_segments_per_message"])
+            if len(parts) == 1:
+                return [self._create(to_number, parts[0])]
+            
+            return [
+                self._create(to_number, PART_HEADER.format(index=i + 1, total=len(parts)) + part)
+                for i, part in enumerate(parts)
+            ]
         except Exception as e:
             print(f"Error sending SMS: {e}")
             raise  
     
-    def _split_message(self, message, max_length):
-        """Split a long message into multiple parts.
+    def send_bulk(self, messages, max_workers=None):
+        """Send many messages concurrently, e.g. a day's check-in campaign.
+        
+        Sends run on a bounded thread pool; the shared throttle keeps the total
+        rate at messages_per_second, and each API call retries 429/5xx errors with
+        jittered backoff. One recipient failing doesn't stop the others.
         
         Args:
-            message: The message to split
-            max_length: Maximum length of each part
+            messages: Iterable of (to_number, message_body) pairs.
+            max_workers: Thread pool size (defaults to SMS_SETTINGS["max_workers"]).
             
         Returns:
-            list: A list of message parts
+            list: A BulkSendResult per pair, in input order.
         """
-        if len(message) <= max_length:
-            return [message]
-        
-        parts = []
-        
-        paragraphs = message.split('\n\n')
-        current_part = ""
-        
-        for paragraph in paragraphs:
-            if len(current_part) + len(paragraph) + 2 > max_length:
-                if current_part:
-                    parts.append(current_part.strip())
-                current_part = paragraph
-            else:
-                if current_part:
-                    current_part += "\n\n" + paragraph
-                else:
-                    current_part = paragraph
-        
-        if current_part:
-            parts.append(current_part.strip())
+        messages = list(messages)
+        if not messages:
+            return []
         
-        final_parts = []
-        for part in parts:
-            if len(part) <= max_length:
-                final_parts.append(part)
-            else:
-                sentences = part.replace('. ', '.|').replace('! ', '!|').replace('? ', '?|').split('|')
-                current_part = ""
-                
-                for sentence in sentences:
-                    if len(current_part) + len(sentence) + 1 > max_length:
-                        if current_part:
-                            final_parts.append(current_part.strip())
-                        current_part = sentence
-                    else:
-                        if current_part:
-                            current_part += " " + sentence
-                        else:
-                            current_part = sentence
-                
-                if current_part:
-                    final_parts.append(current_part.strip())
+        def send_one(pair):
+            to_number, message_body = pair
+            result = BulkSendResult(to_number=to_number)
+            self._attempts.count = 0
+            start = time.perf_counter()
+            try:
+                if not self.validate_phone_number(to_number):
+                    raise ValueError(f"Invalid phone number format: {to_number}")
+                result.message_sids = self.send_message(to_number, message_body)
+            except Exception as e:
+                result.error = f"{type(e).__name__}: {e}"
+            result.attempts = self._attempts.count
+            result.duration = time.perf_counter() - start
+            return result
         
-        result = []
-        for part in final_parts:
-            if len(part) <= max_length:
-                result.append(part)
-            else:
-                for i in range(0, len(part), max_length):
-                    result.append(part[i:i+max_length])
+        workers = min(max_workers or SMS_SETTINGS["max_workers"], len(messages))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sms") as executor:
+            results = list(executor.map(send_one, messages))
         
-        return result
+        failed = sum(1 for result in results if not result.ok)
+        logger.info(f"Bulk send finished: {len(results) - failed} sent, {failed} failed")
+        return results
     
     def validate_phone_number(self, phone_number):
         """Validate that a phone number is in the correct format.
@@ -1,12 +1,28 @@
-from flask import Flask, request, Response
+"""Flask webhook server: receives Twilio SMS callbacks and serves responses, events, jobs and metrics.
+
+Development:
+    python sms_webhook.py [--port 5000] [--ngrok]
+
+Production (several worker processes, see gunicorn.conf.py):
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from flask import Flask, request, Response, stream_with_context
 from twilio.twiml.messaging_response import MessagingResponse
 from twilio.request_validator import RequestValidator
 import os
-from dotenv import load_dotenv
 import json
+import hashlib
+import argparse
+import threading
+from dotenv import load_dotenv
 from datetime import datetime
 import logging
-from pyngrok import ngrok
+from config import STORAGE_SETTINGS, EVENT_STREAM_SETTINGS, QUEUE_SETTINGS, PATIENT_SETTINGS, SERVER_SETTINGS
+from services.response_store import open_store
+from services.job_queue import create_queue, idempotency_key, STATUSES
+from services.patient_repository import normalize_phone
+from services.request_log import RequestLogger, redact_phone
+from agents.instrumentation import get_call_recorder, prometheus_text
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -18,77 +34,77 @@ load_dotenv()
 # Initialize Flask app
 app = Flask(__name__)
 
+# One structured, redacted line per sampled request; never headers or message bodies
+request_logger = RequestLogger(
+    app,
+    sample_rate=float(os.getenv("LOG_SAMPLE_RATE", SERVER_SETTINGS["log_sample_rate"])),
+    slow_seconds=SERVER_SETTINGS["slow_request_seconds"]
+)
+
 # Get Twilio credentials
 # TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 # validator = RequestValidator(TWILIO_AUTH_TOKEN)
 
-# Patient database (in a real app, this would be a database)
-# For this example, we'll use a simple JSON file
-PATIENT_DB_FILE = "patient_responses.json"
+# Patient response store (append-only log by default, see config.STORAGE_SETTINGS);
+# the legacy JSON file is migrated the first time
+patient_store = open_store(STORAGE_SETTINGS)
 
-def load_patient_db():
-    """Load patient database from JSON file."""
-    try:
-        if os.path.exists(PATIENT_DB_FILE):
-            with open(PATIENT_DB_FILE, 'r') as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        logger.error(f"Error loading patient database: {e}")
-        return {}
+# Open /events/stream connections in this worker process (see EVENT_STREAM_SETTINGS["max_streams"])
+stream_slots = threading.BoundedSemaphore(EVENT_STREAM_SETTINGS["max_streams"])
 
-def save_patient_db(db):
-    """Save patient database to JSON file."""
-    try:
-        with open(PATIENT_DB_FILE, 'w') as f:
-            json.dump(db, f, indent=2)
-    except Exception as e:
-        logger.error(f"Error saving patient database: {e}")
+# Triage queue drained by triage_worker.py; None when background triage is disabled
+triage_queue = create_queue(QUEUE_SETTINGS) if QUEUE_SETTINGS["enabled"] else None
 
-def save_patient_response(phone_number, message):
-    """Save a patient's response."""
-    db = load_patient_db()
-    
-    # If this is a new phone number, create a new entry
-    if phone_number not in db:
-        db[phone_number] = {
-            "responses": [],
-            "processed": False
-        }
-    
-    # Add the new response
-    db[phone_number]["responses"].append({
-        "timestamp": datetime.now().isoformat(),
-        "message": message
-    })
+def save_patient_response(phone_number, message, message_sid=None):
+    """Save a patient's response and queue it for background triage, once per inbound SMS."""
+    received_at = datetime.now().isoformat()
+    key = idempotency_key(phone_number, message, message_sid=message_sid)
+    # Without a MessageSid the same text is only a redelivery within the queue's window
+    dedupe_window = None if message_sid else QUEUE_SETTINGS["redelivery_window"]
     
-    # Set processed to False since this is a new response
-    db[phone_number]["processed"] = False
+    # Store first: once the reply is durable it can't be lost, and a worker can't
+    # mark the patient processed before the reply it triaged is there.
+    # Appending a response also resets the patient's processed flag.
+    record = patient_store.append_response(
+        phone_number, message, timestamp=received_at, idempotency_key=key, dedupe_window=dedupe_window
+    )
+    if record is None:
+        # Twilio redelivered a callback we already stored. Still enqueue below: the first
+        # delivery may have died between the two writes, and the queue drops its own duplicates.
+        logger.info(f"Duplicate delivery from {redact_phone(phone_number)}; response already stored")
+    else:
+        logger.debug(f"Saved response from {redact_phone(phone_number)}")
     
-    # Save the updated database
-    save_patient_db(db)
-    
-    logger.info(f"Saved response from {phone_number}")
+    if triage_queue is not None:
+        try:
+            job_id, created = triage_queue.enqueue(
+                phone_number, message, received_at=received_at, message_sid=message_sid
+            )
+            if created:
+                logger.debug(f"Queued triage job {job_id} for {redact_phone(phone_number)}")
+        except Exception as e:
+            # The reply is stored either way; it can still be triaged from the dashboard
+            logger.error(f"Failed to queue triage for {redact_phone(phone_number)}: {e}")
 
 @app.route('/sms', methods=['POST'])
 def sms_webhook():
-    """Handle incoming SMS messages."""
-    # Log all request details
-    logger.info(f"Received webhook request from: {request.remote_addr}")
-    logger.info(f"Headers: {dict(request.headers)}")
-    logger.info(f"Form data: {dict(request.form)}")
+    """Handle incoming SMS messages.
     
+    Request details are logged by request_logger (sampled, numbers masked, no bodies).
+    """
     # VALIDATION REMOVED FOR TESTING
     # No validation check here
     
     # Get the message content and sender's phone number
     incoming_message = request.form.get('Body', '')
     from_number = request.form.get('From', '')
+    message_sid = request.form.get('MessageSid')
     
-    logger.info(f"Received message from {from_number}: {incoming_message}")
+    # Key replies by E.164 so they match the PatientRepository's phone index
+    from_number = normalize_phone(from_number, PATIENT_SETTINGS["default_country_code"]) or from_number
     
     # Save the patient's response
-    save_patient_response(from_number, incoming_message)
+    save_patient_response(from_number, incoming_message, message_sid)
     
     # Create a response
     resp = MessagingResponse()
@@ -96,42 +112,236 @@ def sms_webhook():
     
     return str(resp)
 
+# /responses query parameters and the largest page a client can ask for
+QUERY_PARAMS = ("processed", "since", "limit", "cursor")
+MAX_PAGE_SIZE = 1000
+
+def parse_response_query(args):
+    """Parse /responses query parameters into ResponseStore.query() arguments.
+    
+    Raises:
+        ValueError: If a parameter is malformed.
+    """
+    query = {}
+    
+    processed = args.get('processed')
+    if processed is not None:
+        if processed.lower() not in ("true", "false", "1", "0"):
+            raise ValueError("processed must be true or false")
+        query["processed"] = processed.lower() in ("true", "1")
+    
+    since = args.get('since')
+    if since:
+        # A bare integer is an event sequence number, anything else an ISO timestamp
+        if since.isdigit():
+            query["since"] = int(since)
+        else:
+            datetime.fromisoformat(since)
+            query["since"] = since
+    
+    limit = args.get('limit')
+    if limit is not None:
+        query["limit"] = int(limit)
+        if not 1 <= query["limit"] <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    
+    if args.get('cursor'):
+        query["cursor"] = args.get('cursor')
+    
+    return query
+
+def make_etag(seq, query_key):
+    """ETag for the result of a query at a given store sequence number."""
+    return hashlib.sha1(f"{seq}|{query_key}".encode('utf-8')).hexdigest()[:20]
+
 @app.route('/responses', methods=['GET'])
 def get_responses():
-    """API endpoint to get all patient responses."""
+    """API endpoint to get patient responses.
+    
+    Without query parameters this returns every patient, as it always has.
+    Optional filters: ?processed=true|false, ?since=<seq or ISO timestamp>,
+    ?limit=<n> and ?cursor=<X-Next-Cursor of the previous page>. The body keeps
+    the {phone: {"responses", "processed"}} shape; paging state travels in the
+    X-Next-Cursor and X-Response-Cursor headers. Responses carry an ETag, and a
+    matching If-None-Match returns 304 without reading the store.
+    """
     # In a production app, you'd want to add authentication here
-    db = load_patient_db()
-    return db
+    try:
+        query = parse_response_query(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    # The store's sequence number changes on every write, so it versions any query result
+    query_key = "&".join(f"{name}={request.args.get(name, '')}" for name in QUERY_PARAMS)
+    seq = patient_store.last_seq()
+    if seq is not None:
+        etag = make_etag(seq, query_key)
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers={"ETag": f'W/"{etag}"'})
+    
+    next_cursor = None
+    if query:
+        try:
+            responses, next_cursor = patient_store.query(**query)
+        except NotImplementedError as e:
+            return {"error": str(e)}, 501
+        cursor = seq
+    else:
+        cursor, responses = patient_store.snapshot()
+    
+    response = app.json.response(responses)
+    if cursor is not None:
+        # Subscribers pass this cursor to /events to receive only what changed afterwards
+        response.headers["X-Response-Cursor"] = str(cursor)
+        response.set_etag(make_etag(cursor, query_key), weak=True)
+    else:
+        response.add_etag(weak=True)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return response.make_conditional(request)
+
+@app.route('/events', methods=['GET'])
+def get_events():
+    """Long-poll for store events after ?cursor=<seq>.
+    
+    Returns as soon as there is at least one event, or after ?timeout seconds
+    with an empty list. Clients pass the returned cursor to the next call.
+    """
+    cursor = request.args.get('cursor', default=0, type=int)
+    timeout = request.args.get('timeout', default=EVENT_STREAM_SETTINGS["long_poll_timeout"], type=float)
+    timeout = max(0.0, min(timeout, EVENT_STREAM_SETTINGS["max_long_poll_timeout"]))
+    
+    try:
+        events = patient_store.wait_for_events(cursor, timeout, limit=EVENT_STREAM_SETTINGS["max_batch"])
+    except NotImplementedError as e:
+        return {"error": str(e)}, 501
+    
+    return {"cursor": events[-1]["seq"] if events else cursor, "events": events}
+
+@app.route('/events/stream', methods=['GET'])
+def stream_events():
+    """Server-Sent Events feed of store events after ?cursor=<seq> (or the Last-Event-ID header).
+    
+    Each event's id is its sequence number, so a reconnecting EventSource resumes
+    where it left off. A comment line is sent every heartbeat_seconds while idle.
+    """
+    cursor = request.headers.get('Last-Event-ID', type=int)
+    if cursor is None:
+        cursor = request.args.get('cursor', default=0, type=int)
+    
+    try:
+        patient_store.events_since(cursor, limit=1)
+    except NotImplementedError as e:
+        return {"error": str(e)}, 501
+    
+    if not stream_slots.acquire(blocking=False):
+        # Every stream holds a worker thread; turn extra ones away before they starve the SMS callbacks
+        retry_after = EVENT_STREAM_SETTINGS["retry_after_seconds"]
+        return Response(
+            f"retry: {retry_after * 1000}\n\n",
+            status=503,
+            mimetype='text/event-stream',
+            headers={"Retry-After": str(retry_after), "Cache-Control": "no-cache"}
+        )
+    
+    def generate(cursor):
+        yield "retry: 2000\n\n"
+        while True:
+            events = patient_store.wait_for_events(
+                cursor, EVENT_STREAM_SETTINGS["heartbeat_seconds"], limit=EVENT_STREAM_SETTINGS["max_batch"]
+            )
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                cursor = event["seq"]
+                yield f"id: {cursor}\nevent: {event['op']}\ndata: {json.dumps(event)}\n\n"
+    
+    response = Response(
+        stream_with_context(generate(cursor)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # Called when the server closes the response, including when the client went away
+    response.call_on_close(stream_slots.release)
+    return response
 
 @app.route('/responses/<phone_number>', methods=['GET'])
 def get_patient_responses(phone_number):
     """API endpoint to get responses for a specific patient."""
     # In a production app, you'd want to add authentication here
-    db = load_patient_db()
-    if phone_number in db:
-        return db[phone_number]
+    patient = patient_store.get_patient(phone_number)
+    if patient is not None:
+        return patient
     return {"error": "Patient not found"}, 404
 
 @app.route('/responses/<phone_number>/mark-processed', methods=['POST'])
 def mark_processed(phone_number):
     """API endpoint to mark a patient's responses as processed."""
     # In a production app, you'd want to add authentication here
-    db = load_patient_db()
-    if phone_number in db:
-        db[phone_number]["processed"] = True
-        save_patient_db(db)
+    if patient_store.mark_processed(phone_number):
         return {"status": "success"}
     return {"error": "Patient not found"}, 404
 
+@app.route('/jobs', methods=['GET'])
+def get_jobs():
+    """API endpoint to read background triage jobs and their results.
+    
+    Optional filters: ?status=queued|running|done|failed, ?after=<job id> for
+    incremental reads, ?limit=<n> and ?order=desc for newest first. Job counts
+    per status are included.
+    """
+    # In a production app, you'd want to add authentication here
+    if triage_queue is None:
+        return {"error": "Background triage is disabled (QUEUE_SETTINGS['enabled'])"}, 404
+    
+    status = request.args.get('status')
+    if status and status not in STATUSES:
+        return {"error": f"status must be one of {', '.join(STATUSES)}"}, 400
+    after = request.args.get('after', default=0, type=int)
+    limit = max(1, min(request.args.get('limit', default=100, type=int), MAX_PAGE_SIZE))
+    
+    newest_first = request.args.get('order') == 'desc'
+    
+    jobs = triage_queue.jobs(status=status, after_id=after, limit=limit, newest_first=newest_first)
+    return {"jobs": jobs, "counts": triage_queue.counts()}
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint.
+    
+    LLM calls, tokens, cost and latency come from the shared call log, so they
+    cover the triage workers and the dashboard as well as this process.
+    """
+    body = prometheus_text(call_log=get_call_recorder().call_log)
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+@app.route('/healthz', methods=['GET'])
+def health():
+    """Liveness/readiness check for load balancers and process managers.
+    
+    Returns 200 when the response store and the triage queue can be read, 503 otherwise.
+    """
+    checks = {}
+    healthy = True
+    try:
+        patient_store.last_seq()
+        checks["store"] = "ok"
+    except Exception as e:
+        checks["store"] = f"error: {type(e).__name__}"
+        healthy = False
+    if triage_queue is not None:
+        try:
+            checks["queue"] = triage_queue.counts()
+        except Exception as e:
+            checks["queue"] = f"error: {type(e).__name__}"
+            healthy = False
+    return {"status": "ok" if healthy else "unavailable", "checks": checks, "pid": os.getpid()}, 200 if healthy else 503
+
 @app.route('/test-webhook', methods=['GET', 'POST'])
 def test_webhook():
     """Simple test endpoint to verify the webhook is accessible."""
-    # Log the request
-    logger.info(f"Test webhook called with method: {request.method}")
-    logger.info(f"Headers: {dict(request.headers)}")
-    logger.info(f"Args: {dict(request.args)}")
-    logger.info(f"Form: {dict(request.form)}")
-    
     # Return a simple response
     return {
         "status": "success",
@@ -145,19 +355,30 @@ def simple_test():
     """Simplest possible test endpoint."""
     method = request.method
     
-    # Log the request
-    print(f"Simple test endpoint called with method: {method}")
-    print(f"Headers: {dict(request.headers)}")
-    print(f"Args: {dict(request.args)}")
-    print(f"Form: {dict(request.form)}")
-    
     # Return a plain text response
     return f"Hello! This is a simple test. Method: {method}, Time: {datetime.now().isoformat()}"
 
+def start_ngrok(port):
+    """Open an ngrok tunnel to the local server (pyngrok is only needed for this)."""
+    try:
+        from pyngrok import ngrok
+    except ImportError:
+        raise SystemExit("--ngrok needs the pyngrok package: pip install pyngrok")
+    public_url = ngrok.connect(port).public_url
+    print(f" * ngrok tunnel \"{public_url}\" -> \"http://127.0.0.1:{port}\"")
+    return public_url
+
 if __name__ == '__main__':
-    # Start ngrok tunnel
-    public_url = ngrok.connect(5000).public_url
-    print(f" * ngrok tunnel \"{public_url}\" -> \"http://127.0.0.1:5000\"")
+    parser = argparse.ArgumentParser(description="Development server; use gunicorn (wsgi:app) in production.")
+    parser.add_argument("--host", default=SERVER_SETTINGS["host"])
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", SERVER_SETTINGS["port"])))
+    parser.add_argument("--ngrok", action="store_true",
+                        default=os.getenv("USE_NGROK", str(SERVER_SETTINGS["ngrok"])).lower() in ("1", "true", "yes"),
+                        help="expose the server through an ngrok tunnel")
+    args = parser.parse_args()
+    
+    if args.ngrok:
+        start_ngrok(args.port)
     
-    # Run the Flask app on port 5000
-    app.run(debug=False, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Werkzeug's development server, one process with a thread per request
+    app.run(debug=False, host=args.host, port=args.port, threaded=True)
\ No newline at end of file
@@ -11,6 +11,12 @@ from agents.response_analyzer import ResponseAnalyzerAgent
 from agents.risk_assessment import RiskAssessmentAgent
 from agents.care_instruction import CareInstructionAgent
 from agents.summary import SummaryAgent
+from agents.pipeline import TriagePipeline, TriageJob
+from agents.metrics import stage_report
+from agents.instrumentation import get_call_recorder, new_run_id, run_table, set_call_context
+from services.response_feed import ResponseFeed
+from services.patient_repository import create_repository
+from config import PIPELINE_SETTINGS, QUEUE_SETTINGS, PATIENT_SETTINGS
 
 # Page configuration
 st.set_page_config(
@@ -36,6 +42,40 @@ if 'summary' not in st.session_state:
     st.session_state.summary = None
 if 'current_step' not in st.session_state:
     st.session_state.current_step = 1
+if 'run_id' not in st.session_state:
+    st.session_state.run_id = new_run_id()
+
+# Tag this rerun's LLM calls for the per-run table (the triage pipeline tags its own patients)
+set_call_context(
+    run_id=st.session_state.run_id,
+    patient_id=st.session_state.patient.id if st.session_state.patient else None
+)
+
+@st.fragment(run_every=2)
+def watch_response_feed(feed):
+    """Rerun the app when the live response feed has changed.
+    
+    Only compares a local counter; the feed's background thread does the network I/O.
+    """
+    if feed.version != st.session_state.get("response_feed_version"):
+        st.session_state.response_feed_version = feed.version
+        st.rerun()
+
+@st.cache_resource
+def get_response_feed():
+    """One live response feed per Streamlit process, shared by every session.
+    
+    Each feed holds an /events/stream connection, and with it a webhook server
+    thread, for as long as it runs (see EVENT_STREAM_SETTINGS["max_streams"]).
+    """
+    return ResponseFeed("http://127.0.0.1:5000").start()
+
+@st.cache_resource
+def get_patient_repository():
+    """Patient records shared with the webhook and the triage workers."""
+    return create_repository(PATIENT_SETTINGS)
+
+patient_repository = get_patient_repository()
 
 # Get API key from environment variable
 api_key = os.getenv("OPENAI_API_KEY")
@@ -74,24 +114,37 @@ main_col, right_sidebar_col = st.columns([3, 1])
 with right_sidebar_col:
     st.markdown("### Response Monitoring")
     
+    # "chain" runs the four agents separately, "combined" does all of triage in one LLM call
+    triage_mode = st.selectbox(
+        "Triage mode",
+        ["chain", "combined"],
+        index=["chain", "combined"].index(PIPELINE_SETTINGS["mode"]),
+        help="chain: separate analyzer, risk, care and summary agents. combined: one structured call per patient."
+    )
+    
     if st.button("🔄 Check for New Responses", key="global_check_responses"):
         try:
             # Call your Flask API to get patient responses
             import requests
             
-            # Use the correct port
+            # Use the correct port; the server filters to unprocessed patients and pages the result
             with st.spinner("Checking for new responses..."):
-                response = requests.get("http://127.0.0.1:5000/responses", timeout=5)
+                patient_responses = {}
+                params = {"processed": "false", "limit": 200}
+                while True:
+                    response = requests.get("http://127.0.0.1:5000/responses", params=params, timeout=5)
+                    if response.status_code != 200:
+                        break
+                    patient_responses.update(response.json())
+                    if "X-Next-Cursor" not in response.headers:
+                        break
+                    params["cursor"] = response.headers["X-Next-Cursor"]
             
             if response.status_code == 200:
-                patient_responses = response.json()
-                
                 if not patient_responses:
                     st.info("No new patient responses found.")
                 else:
-                    # Count unprocessed responses
-                    unprocessed_responses = [(phone, data) for phone, data in patient_responses.items() 
-                                           if not data["processed"]]
+                    unprocessed_responses = list(patient_responses.items())
                     
                     if not unprocessed_responses:
                         st.info("No new unprocessed responses found.")
@@ -99,117 +152,115 @@ with right_sidebar_col:
                         st.success(f"Found {len(unprocessed_responses)} new patient response(s)!")
                         
                         # Ask if user wants to auto-process
-                        auto_process = st.checkbox("Automatically process new responses", value=True)
+                        # With the background queue enabled triage_worker.py already handles new replies
+                        auto_process = st.checkbox("Automatically process new responses", value=not QUEUE_SETTINGS["enabled"])
                         
                         if auto_process:
-                            # Process each unprocessed response
-                            for phone_number, data in unprocessed_responses:
-                                st.markdown(f"### Processing: {phone_number}")
+                            # Replies are matched to the registered patient for their number; the
+                            # patient loaded in the sidebar is only a fallback for unknown numbers
+                            base_patient = st.session_state.patient
+                            unknown = [phone for phone, _ in unprocessed_responses
+                                       if patient_repository.find_by_phone(phone) is None]
+                            if unknown and not base_patient:
+                                st.warning(
+                                    f"No registered patient for {', '.join(unknown)}. "
+                                    "Please create a patient first so responses can be analyzed against their record."
+                                )
+                            else:
+                                # Give each phone number its own copy of the patient so concurrent
+                                # runs don't write into the same interaction
+                                jobs = []
+                                for phone_number, data in unprocessed_responses:
+                                    patient_copy = patient_repository.working_copy(phone_number)
+                                    if patient_copy is None:
+                                        patient_copy = Patient(
+                                            id=base_patient.id,
+                                            name=base_patient.name,
+                                            procedure=base_patient.procedure,
+                                            procedure_date=base_patient.procedure_date,
+                                            contact_info=base_patient.contact_info,
+                                            medical_history=base_patient.medical_history,
+                                            phone_number=phone_number
+                                        )
+                                        patient_copy.add_interaction()
+                                    jobs.append(TriageJob(
+                                        patient=patient_copy,
+                                        response_text=data["responses"][-1]["message"],
+                                        phone_number=phone_number
+                                    ))
+                            
+                                st.session_state.run_id = new_run_id()
+                                set_call_context(run_id=st.session_state.run_id)
+                                pipeline = TriagePipeline(api_key=api_key, mode=triage_mode)
+                                progress = st.progress(0.0, text=f"Processing {len(jobs)} response(s)...")
+                            
+                                # Results stream in as each patient finishes
+                                for done_count, result in enumerate(pipeline.iter_results(jobs), start=1):
+                                    phone_number = result.job.phone_number
+                                    progress.progress(done_count / len(jobs), text=f"Processed {done_count}/{len(jobs)}")
                                 
-                                try:
-                                    # Get the latest response
-                                    latest_response = data["responses"][-1]["message"]
-                                    
-                                    # Store the current patient phone
+                                    if not result.ok:
+                                        st.error(f"Error processing response from {phone_number}: {result.error}")
+                                        continue
+                                
+                                    # The most recently finished patient is loaded into the workflow tabs
                                     st.session_state.current_patient_phone = phone_number
-                                    
-                                    # Step 1: Update the patient response
-                                    st.session_state.patient_response = latest_response
-                                    
-                                    # Step 2: Extract symptoms
-                                    response_analyzer = ResponseAnalyzerAgent(api_key=api_key)
-                                    
-                                    with st.spinner("Analyzing symptoms..."):
-                                        st.session_state.extracted_symptoms = response_analyzer.process(
-                                            st.session_state.patient, 
-                                            latest_response
-                                        )
-                                    st.success("✅ Symptoms analyzed")
-                                    
-                                    # Step 3: Assess risk
-                                    risk_assessment_agent = RiskAssessmentAgent(api_key=api_key)
-                                    
-                                    with st.spinner("Assessing risk..."):
-                                        try:
-                                            st.session_state.risk_assessment = risk_assessment_agent.process(
-                                                st.session_state.patient, 
-                                                st.session_state.extracted_symptoms
-                                            )
-                                            st.success("✅ Risk assessed")
-                                        except Exception as e:
-                                            import traceback
-                                            st.error(f"Error in risk assessment: {str(e)}")
-                                            # Provide a fallback risk assessment
-                                            st.session_state.risk_assessment = {
-                                                "risk_level": "Unknown",
-                                                "justification": f"Error during analysis: {str(e)}"
-                                            }
-                                            st.warning("⚠️ Risk assessment error (using fallback)")
-                                    
-                                    # Step 4: Generate care instructions
-                                    care_instruction_agent = CareInstructionAgent(api_key=api_key)
-                                    
-                                    with st.spinner("Generating care instructions..."):
-                                        st.session_state.care_instructions = care_instruction_agent.process(
-                                            st.session_state.patient,
-                                            st.session_state.extracted_symptoms,
-                                            st.session_state.risk_assessment
-                                        )
-                                    st.success("✅ Care instructions generated")
-                                    
-                                    # Step 5: Generate clinic summary
-                                    summary_agent = SummaryAgent(api_key=api_key)
-                                    
-                                    with st.spinner("Generating clinic summary..."):
-                                        st.session_state.summary = summary_agent.process(
-                                            st.session_state.patient,
-                                            st.session_state.extracted_symptoms,
-                                            st.session_state.risk_assessment,
-                                            st.session_state.care_instructions
+                                    st.session_state.patient_response = result.job.response_text
+                                    st.session_state.extracted_symptoms = result.extracted_symptoms
+                                    st.session_state.risk_assessment = result.risk_assessment
+                                    st.session_state.care_instructions = result.care_instructions
+                                    st.session_state.summary = result.summary
+                                
+                                    # Keep the interaction in the registered patient's history
+                                    if patient_repository.find_by_phone(phone_number) is not None:
+                                        patient_repository.record_interaction(
+                                            result.job.patient.id, result.job.patient.get_latest_interaction()
                                         )
-                                    st.success("✅ Clinic summary generated")
-                                    
+                                
                                     # Mark as processed in the database
                                     requests.post(f"http://127.0.0.1:5000/responses/{phone_number}/mark-processed")
-                                    
-                                    st.success(f"✅ Response from {phone_number} fully processed!")
-                                    
-                                except Exception as e:
-                                    import traceback
-                                    st.error(f"Error processing response: {str(e)}")
-                                    
-                                    # Add detailed error information
-                                    with st.expander("Error Details"):
-                                        st.write("Error Type:", type(e).__name__)
-                                        st.write("Error Message:", str(e))
-                                        
-                                        # Check if SMSService is properly imported
-                                        st.write("Checking SMS Service:")
-                                        try:
-                                            from services.sms_service import SMSService
-                                            st.write("✅ SMSService imported successfully")
-                                        except ImportError as ie:
-                                            st.write("❌ Failed to import SMSService:", str(ie))
-                                        
-                                        # Check if the phone number is valid
-                                        st.write(f"Phone Number: {st.session_state.current_patient_phone}")
-                                        
-                                        # Check if Twilio credentials are set
-                                        import os
-                                        twilio_sid = os.getenv("TWILIO_ACCOUNT_SID")
-                                        twilio_token = os.getenv("TWILIO_AUTH_TOKEN")
-                                        twilio_phone = os.getenv("TWILIO_PHONE_NUMBER")
-                                        
-                                        st.write("Twilio Credentials:")
-                                        st.write(f"- TWILIO_ACCOUNT_SID: {'✅ Set' if twilio_sid else '❌ Not Set'}")
-                                        st.write(f"- TWILIO_AUTH_TOKEN: {'✅ Set' if twilio_token else '❌ Not Set'}")
-                                        st.write(f"- TWILIO_PHONE_NUMBER: {'✅ Set' if twilio_phone else '❌ Not Set'}")
+                                
+                                    st.success(
+                                        f"✅ Response from {phone_number} fully processed "
+                                        f"(risk: {result.risk_assessment.get('risk_level', 'Unknown')}, {result.duration:.1f}s)"
+                                    )
                         else:
                             st.info("Go to the 'Patient Responses' tab to view and process the responses.")
             else:
                 st.error(f"Failed to fetch patient responses. Status code: {response.status_code}")
         except Exception as e:
             st.error(f"Error checking for responses: {str(e)}")
+    
+    # Tokens, estimated cost and latency of this session's LLM calls, per stage and model
+    with st.expander("LLM cost & latency"):
+        usage_rows = stage_report()
+        if usage_rows:
+            st.dataframe(
+                [
+                    {
+                        "Stage": row["stage"],
+                        "Model": row["model"],
+                        "Calls": int(row["calls"]),
+                        "Cache hits": int(row["cache_hits"]),
+                        "Tokens in/out": f"{int(row['prompt_tokens'])}/{int(row['completion_tokens'])}",
+                        "Cached in": int(row["cached_tokens"]),
+                        "Cost ($)": round(row["cost_usd"], 4),
+                        "p50 (s)": round(row["latency_p50"], 2) if row["latency_p50"] is not None else None,
+                        "p95 (s)": round(row["latency_p95"], 2) if row["latency_p95"] is not None else None,
+                        "TTFT p50 (s)": round(row["ttft_p50"], 2) if row["ttft_p50"] is not None else None
+                    }
+                    for row in usage_rows
+                ],
+                hide_index=True
+            )
+        else:
+            st.caption("No LLM calls yet.")
+        
+        # Every call of the current run (this patient's workflow, or the last batch)
+        run_calls = get_call_recorder().recent(run_id=st.session_state.run_id)
+        if run_calls:
+            st.markdown(f"**Calls in run {st.session_state.run_id}**")
+            st.dataframe(run_table(run_calls), hide_index=True)
 
 # Continue with the rest of your app in the main column
 with main_col:
@@ -239,9 +290,13 @@ with main_col:
             submit_button = st.form_submit_button("Create/Update Patient")
             
             if submit_button:
-                # Create a new patient
+                # Update the registered patient with this name and number, or create a new one
+                existing = next(
+                    (patient for patient in patient_repository.patients_by_phone(phone_number) if patient.name == patient_name),
+                    None
+                )
                 st.session_state.patient = Patient(
-                    id=f"P{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                    id=existing.id if existing else f"P{datetime.now().strftime('%Y%m%d%H%M%S')}",
                     name=patient_name,
                     procedure=procedure,
                     procedure_date=datetime.combine(procedure_date, datetime.min.time()),
@@ -250,8 +305,15 @@ with main_col:
                     phone_number=phone_number
                 )
                 
-                # Add a new interaction
+                # Add a new interaction after the patient's earlier history
+                if existing:
+                    st.session_state.patient.interactions = list(existing.interactions)
                 st.session_state.patient.add_interaction()
+                patient_repository.save(st.session_state.patient)
+                
+                # Each patient's workflow is its own run in the LLM cost table
+                st.session_state.run_id = new_run_id()
+                set_call_context(run_id=st.session_state.run_id, patient_id=st.session_state.patient.id)
                 
                 # Reset the workflow
                 st.session_state.check_in_message = None
@@ -262,7 +324,7 @@ with main_col:
                 st.session_state.summary = None
                 st.session_state.current_step = 1
                 
-                st.success("Patient created successfully!")
+                st.success("Patient updated successfully!" if existing else "Patient created successfully!")
 
         st.markdown("---")
         if st.button("Reset Analysis"):
@@ -674,6 +736,11 @@ with main_col:
                     # Display the justification
                     st.subheader("Justification:")
                     st.write(st.session_state.risk_assessment.get("justification", "No justification provided."))
+                    
+                    # Show whether a deterministic rule or the LLM made the call
+                    decision_path = st.session_state.risk_assessment.get("decision_path")
+                    if decision_path:
+                        st.caption(f"Decided by: {decision_path}")
         
         # Tab 5: Care Instructions
         with tabs[4]:
@@ -685,17 +752,23 @@ with main_col:
                 # Only show the generate button if care instructions haven't been generated yet
                 if not st.session_state.care_instructions:
                     if st.button("Generate Care Instructions", key="gen_care"):
-                        with st.spinner("Generating care instructions..."):
-                            # Create the agent with the API key from session state
-                            care_instruction_agent = CareInstructionAgent(api_key=api_key)
-                            
-                            # Generate care instructions
-                            st.session_state.care_instructions = care_instruction_agent.process(
+                        # Create the agent with the API key from session state
+                        care_instruction_agent = CareInstructionAgent(api_key=api_key)
+                        
+                        # Render the instructions as they're generated
+                        stream_area = st.empty()
+                        streamed = stream_area.write_stream(
+                            care_instruction_agent.process_stream(
                                 st.session_state.patient,
                                 st.session_state.extracted_symptoms,
                                 st.session_state.risk_assessment
                             )
-                            st.session_state.current_step = 5
+                        )
+                        # A stream cut off partway was replaced by the fallback; show only what was stored
+                        if streamed != care_instruction_agent.stream_result:
+                            stream_area.write(care_instruction_agent.stream_result)
+                        st.session_state.care_instructions = care_instruction_agent.stream_result
+                        st.session_state.current_step = 5
             
             if st.session_state.care_instructions:
                 st.subheader("Care Instructions:")
@@ -791,17 +864,23 @@ with main_col:
                 # Only show the generate button if summary hasn't been generated yet
                 if not st.session_state.summary:
                     if st.button("Generate Clinic Summary", key="gen_summary"):
-                        with st.spinner("Generating clinic summary..."):
-                            # Create the agent with the API key from session state
-                            summary_agent = SummaryAgent(api_key=api_key)
-                            
-                            # Generate summary
-                            st.session_state.summary = summary_agent.process(
+                        # Create the agent with the API key from session state
+                        summary_agent = SummaryAgent(api_key=api_key)
+                        
+                        # Render the summary as it's generated
+                        stream_area = st.empty()
+                        streamed = stream_area.write_stream(
+                            summary_agent.process_stream(
                                 st.session_state.patient,
                                 st.session_state.extracted_symptoms,
                                 st.session_state.risk_assessment,
                                 st.session_state.care_instructions
                             )
+                        )
+                        # A stream cut off partway was replaced by the fallback; show only what was stored
+                        if streamed != summary_agent.stream_result:
+                            stream_area.write(summary_agent.stream_result)
+                        st.session_state.summary = summary_agent.stream_result
                 
                 if st.session_state.summary:
                     st.subheader("Clinic Summary:")
@@ -831,9 +910,16 @@ with main_col:
         with tabs[6]:
             st.header("Patient SMS Responses")
             
-            # Add auto-refresh option
-            auto_refresh = st.checkbox("Auto-refresh (check every 30 seconds)", value=False)
-            auto_analyze = st.checkbox("Automatically analyze new responses", value=True)
+            # Live updates subscribe to the webhook's event stream instead of re-downloading every response
+            live_updates = st.checkbox("Live updates (pushed from the webhook server)", value=False)
+            auto_analyze = st.checkbox("Automatically analyze new responses", value=not QUEUE_SETTINGS["enabled"])
+            
+            if live_updates:
+                st.session_state.response_feed = get_response_feed()
+                watch_response_feed(st.session_state.response_feed)
+            elif "response_feed" in st.session_state:
+                # Only stop watching; other sessions may still be reading the shared feed
+                del st.session_state.response_feed
             
             # Add a debug section to see what's in session state
             with st.expander("Debug Session State"):
@@ -842,16 +928,26 @@ with main_col:
                     if key not in ['patient']:  # Skip large objects
                         st.write(f"**{key}**: {value}")
             
-            if st.button("Check for New Responses") or auto_refresh:
+            if st.button("Check for New Responses") or live_updates:
                 try:
                     # Call your Flask API to get patient responses
                     import requests
                     
-                    # Use the correct port
-                    response = requests.get("http://127.0.0.1:5000/responses", timeout=5)
+                    patient_responses = None
+                    if live_updates:
+                        # Already local; the feed thread applies new events as they arrive
+                        patient_responses = st.session_state.response_feed.patients()
+                        if st.session_state.response_feed.error:
+                            st.warning(f"Live updates disconnected, reconnecting: {st.session_state.response_feed.error}")
+                    else:
+                        # Use the correct port
+                        response = requests.get("http://127.0.0.1:5000/responses", timeout=5)
+                        if response.status_code == 200:
+                            patient_responses = response.json()
+                        else:
+                            st.error(f"Failed to fetch patient responses. Status code: {response.status_code}")
                     
-                    if response.status_code == 200:
-                        patient_responses = response.json()
+                    if patient_responses is not None:
                         
                         if not patient_responses:
                             st.info("No patient responses found.")
@@ -919,26 +1015,65 @@ with main_col:
                                             
                                             # Mark as processed in the database
                                             requests.post(f"http://127.0.0.1:5000/responses/{phone_number}/mark-processed")
+                                            if live_updates:
+                                                # Don't re-analyze this phone if the rerun beats the server's event
+                                                st.session_state.response_feed.mark_processed(phone_number)
                                         
                                         st.success(f"Response from {phone_number} has been automatically analyzed!")
                                         st.info("Analysis complete! You can now review the results in the respective tabs.")
                                         
                                         # Force a rerun to update all tabs
                                         st.rerun()
-                    else:
-                        st.error(f"Failed to fetch patient responses. Status code: {response.status_code}")
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
-                
-                # If auto-refresh is enabled, schedule the next refresh
-                if auto_refresh:
-                    import time
-                    st.info("Auto-refresh is enabled. Checking again in 30 seconds...")
-                    time_placeholder = st.empty()
-                    for i in range(30, 0, -1):
-                        time_placeholder.text(f"Next refresh in {i} seconds...")
-                        time.sleep(1)
-                    st.rerun()
+
+            # Results written by triage_worker.py; the dashboard only reads them
+            if QUEUE_SETTINGS["enabled"]:
+                st.subheader("Background Triage Results")
+                try:
+                    import requests
+                    jobs_response = requests.get(
+                        "http://127.0.0.1:5000/jobs", params={"status": "done", "order": "desc", "limit": 50}, timeout=5
+                    )
+                    if jobs_response.status_code == 200:
+                        jobs_data = jobs_response.json()
+                        counts = jobs_data["counts"]
+                        st.caption(
+                            f"Queued: {counts['queued']} · Running: {counts['running']} · "
+                            f"Done: {counts['done']} · Failed: {counts['failed']}"
+                        )
+                        
+                        done_jobs = jobs_data["jobs"]
+                        if not done_jobs:
+                            st.info("No background triage results yet. Start the worker with `python triage_worker.py`.")
+                        else:
+                            job_labels = {
+                                job["id"]: (
+                                    f"#{job['id']} {job['phone_number']} · "
+                                    f"{job['result']['risk_assessment'].get('risk_level', 'Unknown')} risk · {job['received_at']}"
+                                )
+                                for job in done_jobs
+                            }
+                            selected_job_id = st.selectbox(
+                                "Triage result", list(job_labels), format_func=job_labels.get
+                            )
+                            selected_job = next(job for job in done_jobs if job["id"] == selected_job_id)
+                            st.text_area("Patient message", selected_job["message"], height=80, disabled=True)
+                            
+                            if st.button("Load into workflow tabs", key="load_job_result"):
+                                job_result = selected_job["result"]
+                                st.session_state.current_patient_phone = selected_job["phone_number"]
+                                st.session_state.patient_response = selected_job["message"]
+                                st.session_state.extracted_symptoms = job_result["extracted_symptoms"]
+                                st.session_state.risk_assessment = job_result["risk_assessment"]
+                                st.session_state.care_instructions = job_result["care_instructions"]
+                                st.session_state.summary = job_result["summary"]
+                                st.session_state.current_step = 5
+                                st.success("Loaded. Review the results in the respective tabs.")
+                    else:
+                        st.error(f"Failed to fetch triage results. Status code: {jobs_response.status_code}")
+                except Exception as e:
+                    st.error(f"Error loading triage results: {str(e)}")
 
             # In the Server Configuration section of the Patient Responses tab
             with st.expander("Server Configuration"):
@@ -0,0 +1,19 @@
+import importlib
+
+import pytest
+
+from config import STORAGE_SETTINGS, QUEUE_SETTINGS
+
+
+@pytest.fixture
+def webhook(tmp_path, monkeypatch):
+    monkeypatch.setitem(STORAGE_SETTINGS, "backend", "log")
+    monkeypatch.setitem(STORAGE_SETTINGS, "path", str(tmp_path / "responses.log"))
+    monkeypatch.setitem(STORAGE_SETTINGS, "legacy_json_path", str(tmp_path / "responses.json"))
+    monkeypatch.setitem(QUEUE_SETTINGS, "path", str(tmp_path / "queue.sqlite3"))
+    import sms_webhook
+    # Reopen the module's store and queue at the temporary paths
+    sms_webhook = importlib.reload(sms_webhook)
+    yield sms_webhook
+    sms_webhook.patient_store.close()
+    sms_webhook.triage_queue.close()
@@ -0,0 +1,75 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+from agents.cache import LLMCache
+from agents.checkin_templates import template_key, history_category
+from agents.symptom_checkin import SymptomCheckInAgent
+from models.patient import Patient
+
+VALID_TEMPLATE = "Hi {first_name}, how are you feeling since {procedure_date}?"
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(SymptomCheckInAgent, "_template_locks", {})
+    monkeypatch.setattr(SymptomCheckInAgent, "_rejected_templates", {})
+    agent = SymptomCheckInAgent(use_templates=False)
+    agent.use_templates = True
+    agent.templates = LLMCache(memory_entries=8)
+    return agent
+
+
+def make_patient(procedure):
+    return Patient(id="P1", name="Pat Example", procedure=procedure, procedure_date=datetime(2025, 3, 1),
+                   contact_info="", medical_history="None")
+
+
+def test_template_key_changes_with_prompt_text():
+    key = template_key("Root canal", "diabetes", "gpt-4o-mini", "Generate a TEMPLATE for {procedure}")
+    assert key == template_key("  root canal ", "diabetes", "gpt-4o-mini", "Generate a TEMPLATE for {procedure}")
+    assert key != template_key("Root canal", "diabetes", "gpt-4o-mini", "Generate a short TEMPLATE for {procedure}")
+    assert key != template_key("Root canal", "smoker", "gpt-4o-mini", "Generate a TEMPLATE for {procedure}")
+
+
+def test_history_category():
+    assert history_category("Takes warfarin daily") == "anticoagulant"
+    assert history_category("None.") == "none"
+    assert history_category("Broke my arm in 2010") == "other"
+
+
+def test_rejected_template_is_not_regenerated_per_patient(agent, monkeypatch):
+    prompts = []
+
+    def call_gpt(prompt, system_message, use_cache=True):
+        prompts.append(prompt)
+        return "Hi {nickname}, how are you?"
+
+    monkeypatch.setattr(agent, "call_gpt", call_gpt)
+    assert agent.template_for(make_patient("Root canal")) is None
+    assert agent.template_for(make_patient("Root canal")) is None
+    assert len(prompts) == 1
+
+
+def test_templates_for_different_procedures_generate_in_parallel(agent, monkeypatch):
+    root_canal_started = threading.Event()
+    release = threading.Event()
+
+    def call_gpt(prompt, system_message, use_cache=True):
+        if "Root canal" in prompt:
+            root_canal_started.set()
+            assert release.wait(5)
+        return VALID_TEMPLATE
+
+    monkeypatch.setattr(agent, "call_gpt", call_gpt)
+    slow = threading.Thread(target=agent.template_for, args=(make_patient("Root canal"),))
+    slow.start()
+    try:
+        assert root_canal_started.wait(5)
+        # Not held up by the root canal template still being generated
+        assert agent.template_for(make_patient("Tooth extraction")) == VALID_TEMPLATE
+    finally:
+        release.set()
+        slow.join(5)
@@ -0,0 +1,23 @@
+import threading
+
+from config import EVENT_STREAM_SETTINGS
+
+
+def test_streams_beyond_the_cap_are_told_to_retry(webhook, monkeypatch):
+    monkeypatch.setattr(webhook, "stream_slots", threading.BoundedSemaphore(1))
+    client = webhook.app.test_client()
+
+    first = client.get("/events/stream")
+    assert first.status_code == 200
+    assert next(first.response).startswith(b"retry:")
+
+    refused = client.get("/events/stream")
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == str(EVENT_STREAM_SETTINGS["retry_after_seconds"])
+    assert refused.get_data(as_text=True) == f"retry: {EVENT_STREAM_SETTINGS['retry_after_seconds'] * 1000}\n\n"
+
+    # Closing the first stream gives its slot back
+    first.close()
+    second = client.get("/events/stream")
+    assert second.status_code == 200
+    second.close()
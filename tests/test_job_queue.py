@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.job_queue import TriageQueue, idempotency_key
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = TriageQueue(str(tmp_path / "queue.sqlite3"), redelivery_window=900)
+    yield queue
+    queue.close()
+
+
+def test_idempotency_key_uses_message_sid():
+    assert idempotency_key("+15550100001", "fine", message_sid="SM1") == "sid:SM1"
+    assert idempotency_key("+15550100001", "other text", message_sid="SM1") == "sid:SM1"
+
+
+def test_fallback_key_is_stable_across_redeliveries():
+    first = idempotency_key("+15550100001", "pain is a 4")
+    assert first == idempotency_key("+15550100001", "pain is a 4")
+    assert first != idempotency_key("+15550100002", "pain is a 4")
+    assert first != idempotency_key("+15550100001", "pain is a 5")
+    assert first != idempotency_key("+15550100001", "pain is a 4", sent_at="2025-03-01T10:00:00")
+
+
+def test_redelivery_with_sid_is_queued_once(queue):
+    job_id, created = queue.enqueue("+15550100001", "fine", received_at="2025-03-01T10:00:00", message_sid="SM1")
+    again, created_again = queue.enqueue("+15550100001", "fine", received_at="2025-03-01T10:00:09", message_sid="SM1")
+    assert created and not created_again
+    assert again == job_id
+    assert queue.pending("+15550100001") == 1
+
+
+def test_redelivery_without_sid_is_queued_once(queue):
+    job_id, created = queue.enqueue("+15550100001", "swelling is worse", received_at="2025-03-01T10:00:00")
+    again, created_again = queue.enqueue("+15550100001", "swelling is worse", received_at="2025-03-01T10:00:30")
+    assert created and not created_again
+    assert again == job_id
+
+
+def test_same_text_after_redelivery_window_is_a_new_message(queue):
+    job_id, _ = queue.enqueue("+15550100001", "fine")
+    queue._conn.execute("UPDATE triage_jobs SET created = created - 3600 WHERE id = ?", (job_id,))
+    new_id, created = queue.enqueue("+15550100001", "fine")
+    assert created and new_id != job_id
+    assert queue.enqueue("+15550100001", "fine") == (new_id, False)
+    assert queue.pending("+15550100001") == 2
+
+
+@pytest.mark.parametrize("message_sid", ["SMREDELIVERED", None])
+def test_redelivered_callback_is_stored_and_queued_once(webhook, message_sid):
+    form = {"From": "+15550100001", "To": "+15550000000", "Body": "still bleeding a bit"}
+    if message_sid:
+        form["MessageSid"] = message_sid
+    client = webhook.app.test_client()
+    for _ in range(2):
+        assert client.post("/sms", data=form).status_code == 200
+
+    responses = webhook.patient_store.get_patient("+15550100001")["responses"]
+    assert [response["message"] for response in responses] == ["still bleeding a bit"]
+    assert webhook.triage_queue.pending("+15550100001") == 1
+
+
+def test_redelivery_after_a_failed_enqueue_queues_the_stored_reply(webhook, monkeypatch):
+    form = {"From": "+15550100001", "To": "+15550000000", "Body": "swelling is worse", "MessageSid": "SMRETRY"}
+    client = webhook.app.test_client()
+    enqueue = webhook.triage_queue.enqueue
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(webhook.triage_queue, "enqueue", fail)
+    assert client.post("/sms", data=form).status_code == 200
+    # The reply was stored before the queue was touched
+    assert len(webhook.patient_store.get_patient("+15550100001")["responses"]) == 1
+    assert webhook.triage_queue.pending("+15550100001") == 0
+
+    monkeypatch.setattr(webhook.triage_queue, "enqueue", enqueue)
+    assert client.post("/sms", data=form).status_code == 200
+    assert len(webhook.patient_store.get_patient("+15550100001")["responses"]) == 1
+    assert webhook.triage_queue.pending("+15550100001") == 1
+
+
+@pytest.mark.parametrize("backend", ["log", "json"])
+def test_store_dedupes_keyed_appends_within_the_window(tmp_path, backend):
+    from services.response_store import create_store
+
+    store = create_store(backend, str(tmp_path / f"responses.{backend}"))
+    assert store.append_response("+15550100001", "fine", idempotency_key="sha256:abc", dedupe_window=900)
+    assert store.append_response("+15550100001", "fine", idempotency_key="sha256:abc", dedupe_window=900) is None
+    # Stored an hour ago: the same text now is a new reply
+    old = (datetime.now() - timedelta(hours=1)).isoformat()
+    assert store.append_response("+15550100002", "fine", timestamp=old, idempotency_key="sha256:def")
+    assert store.append_response("+15550100002", "fine", idempotency_key="sha256:def", dedupe_window=900)
+    assert len(store.get_patient("+15550100001")["responses"]) == 1
+    assert len(store.get_patient("+15550100002")["responses"]) == 2
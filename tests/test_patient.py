@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+
+import models.text_store
+from config import PATIENT_SETTINGS
+from models.patient import Patient, PatientInteraction, RiskLevel
+
+LONG_TEXT = "Rinse gently with warm salt water after meals. " * 10
+
+
+@pytest.fixture(autouse=True)
+def text_store(tmp_path, monkeypatch):
+    monkeypatch.setitem(PATIENT_SETTINGS, "text_store_path", str(tmp_path / "texts.sqlite3"))
+    monkeypatch.setattr(models.text_store, "_text_store", None)
+    yield
+    if models.text_store._text_store is not None:
+        models.text_store._text_store.close()
+
+
+def stored_texts():
+    store = models.text_store.get_text_store()
+    return store._conn.execute("SELECT COUNT(*) FROM interaction_texts").fetchone()[0]
+
+
+def make_patient(interactions):
+    patient = Patient(
+        id="P1", name="Pat Example", procedure="Wisdom Tooth Extraction", procedure_date=datetime(2025, 3, 1),
+        contact_info="", medical_history="", history_window=2
+    )
+    for index in range(interactions):
+        interaction = patient.add_interaction()
+        interaction.care_instructions = f"{index}: {LONG_TEXT}"
+        interaction.risk_level = "low"
+    return patient
+
+
+def test_loading_does_not_write_texts():
+    data = make_patient(5).to_dict()
+    patient = Patient.from_dict(data)
+    assert not any(interaction.offloaded for interaction in patient.interactions)
+    assert stored_texts() == 0
+
+
+def test_to_bytes_without_texts_compacts_older_interactions():
+    patient = make_patient(5)
+    data = patient.to_bytes(inline_texts=False)
+    assert [interaction.offloaded for interaction in patient.interactions] == [True, True, True, False, False]
+    assert stored_texts() == 3
+
+    loaded = Patient.from_bytes(data)
+    assert [i.care_instructions for i in loaded.interactions] == [i.care_instructions for i in patient.interactions]
+    assert loaded.interactions[0].risk_level is RiskLevel.LOW
+
+
+def test_inline_snapshot_leaves_store_alone():
+    patient = make_patient(5)
+    Patient.from_bytes(patient.to_bytes())
+    assert stored_texts() == 0
+
+
+def test_interaction_round_trip():
+    interaction = PatientInteraction(patient_response="Pain is about a 4", risk_level="HIGH",
+                                     extracted_symptoms={"bleeding": "Mild", "pain_level": 4})
+    loaded = PatientInteraction.from_bytes(interaction.to_bytes())
+    assert loaded.patient_response == "Pain is about a 4"
+    assert loaded.risk_level is RiskLevel.HIGH
+    assert loaded.extracted_symptoms == {"bleeding": "mild", "pain_level": 4}
+
+
+def test_offloaded_interaction_equals_inline_copy():
+    interaction = PatientInteraction(timestamp=datetime(2025, 3, 2), care_instructions=LONG_TEXT, risk_level="low")
+    inline = PatientInteraction.from_dict(interaction.to_dict())
+    interaction.offload()
+    assert interaction.offloaded and not inline.offloaded
+    assert interaction == inline
+    assert "care_instructions=" in repr(inline) and "_care_instructions" not in repr(inline)
+    # The repr shows a reference, not the offloaded text
+    assert LONG_TEXT not in repr(interaction)
@@ -0,0 +1,123 @@
+import multiprocessing
+from datetime import datetime
+
+import pytest
+
+import models.text_store
+from config import PATIENT_SETTINGS
+from models.patient import Patient, PatientInteraction
+from services.patient_repository import PatientRepository
+
+REPLIES_PER_PROCESS = 25
+
+
+@pytest.fixture(autouse=True)
+def text_store(tmp_path, monkeypatch):
+    monkeypatch.setitem(PATIENT_SETTINGS, "text_store_path", str(tmp_path / "texts.sqlite3"))
+    monkeypatch.setattr(models.text_store, "_text_store", None)
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "patients.sqlite3")
+    repository = PatientRepository(path)
+    repository.save(Patient(
+        id="P1", name="Pat Example", procedure="Wisdom Tooth Extraction", procedure_date=datetime(2025, 3, 1),
+        contact_info="", medical_history="", phone_number="(555) 010-0001"
+    ))
+    repository.close()
+    return path
+
+
+def record_replies(path, label):
+    repository = PatientRepository(path)
+    for index in range(REPLIES_PER_PROCESS):
+        repository.record_interaction("P1", PatientInteraction(patient_response=f"{label} {index}"))
+    repository.close()
+
+
+def test_concurrent_record_interaction_keeps_every_reply(path):
+    # Each process holds its own (soon stale) copy of P1, as the webhook and workers do
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=record_replies, args=(path, label)) for label in ("a", "b", "c")]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    repository = PatientRepository(path)
+    responses = [interaction.patient_response for interaction in repository.get("P1").interactions]
+    assert sorted(responses) == sorted(f"{label} {index}" for label in "abc" for index in range(REPLIES_PER_PROCESS))
+    # Each process's replies stay in the order it recorded them
+    for label in "abc":
+        assert [r for r in responses if r.startswith(label)] == [f"{label} {i}" for i in range(REPLIES_PER_PROCESS)]
+
+
+def test_record_interaction_unknown_patient(path):
+    repository = PatientRepository(path)
+    assert repository.record_interaction("missing", PatientInteraction()) is False
+
+
+def test_other_connection_sees_changes_incrementally(path):
+    reader = PatientRepository(path)
+    writer = PatientRepository(path)
+    untouched = reader.get("P1")
+
+    writer.save(Patient(
+        id="P2", name="Sam Example", procedure="Root Canal", procedure_date=datetime(2025, 4, 1),
+        contact_info="", medical_history="", phone_number="+15550100002"
+    ))
+    writer.record_interaction("P1", PatientInteraction(patient_response="swelling is down"))
+
+    assert reader.find_by_phone("555-010-0002").id == "P2"
+    assert [i.patient_response for i in reader.get("P1").interactions] == ["swelling is down"]
+    assert reader.get("P1") is not untouched
+
+    writer.save(Patient(
+        id="P2", name="Sam Example", procedure="Root Canal", procedure_date=datetime(2025, 4, 1),
+        contact_info="", medical_history="", phone_number="+15550100003"
+    ))
+    p1 = reader.get("P1")
+    assert reader.find_by_phone("+15550100002") is None
+    assert reader.find_by_phone("+15550100003").id == "P2"
+    # Only the patient that changed was reloaded
+    assert reader.get("P1") is p1
+
+    writer.delete("P2")
+    assert reader.get("P2") is None
+    assert len(reader) == 1
+
+
+def test_record_interaction_offloads_interaction_leaving_window(path, monkeypatch):
+    # The text store shares the repository's file, as with the default settings
+    monkeypatch.setitem(PATIENT_SETTINGS, "text_store_path", path)
+    monkeypatch.setitem(PATIENT_SETTINGS, "history_window", 2)
+    long_text = "Keep biting on the gauze and avoid straws for a few days. " * 5
+    repository = PatientRepository(path)
+    for index in range(4):
+        repository.record_interaction("P1", PatientInteraction(care_instructions=f"{index}: {long_text}"))
+
+    cached = repository.get("P1").interactions
+    assert [interaction.offloaded for interaction in cached] == [True, True, False, False]
+    loaded = PatientRepository(path).get("P1").interactions
+    assert [interaction.offloaded for interaction in loaded] == [True, True, False, False]
+    assert [interaction.care_instructions for interaction in loaded] == [f"{i}: {long_text}" for i in range(4)]
+
+
+def test_only_recent_interactions_stay_in_memory(path):
+    repository = PatientRepository(path, loaded_interactions=3)
+    for index in range(5):
+        repository.record_interaction("P1", PatientInteraction(patient_response=f"reply {index}"))
+
+    for patient in (repository.get("P1"), PatientRepository(path, loaded_interactions=3).get("P1")):
+        assert patient.interactions_offset == 2
+        assert [i.patient_response for i in patient.interactions] == ["reply 2", "reply 3", "reply 4"]
+    assert [i.patient_response for i in repository.history("P1", limit=2)] == ["reply 0", "reply 1"]
+
+    # Saving a paged patient keeps the interactions it never loaded
+    patient = repository.working_copy("+15550100001")
+    patient.interactions[-1].patient_response = "reply 5"
+    repository.save(patient)
+    assert [i.patient_response for i in repository.history("P1")] == [f"reply {index}" for index in range(6)]
+    assert [i.patient_response for i in repository.get("P1").interactions] == ["reply 3", "reply 4", "reply 5"]
@@ -0,0 +1,26 @@
+import asyncio
+
+from agents.pipeline import TriagePipeline
+
+
+def test_closing_stream_waits_for_cancelled_jobs():
+    pipeline = TriagePipeline(api_key="test-key", concurrency=2)
+    finished = []
+
+    async def process(job, semaphore, limiters):
+        try:
+            await asyncio.sleep(0 if job == "fast" else 60)
+            return job
+        finally:
+            finished.append(job)
+
+    pipeline._process = process
+
+    async def first_result():
+        results = pipeline.stream(["fast", "slow"])
+        result = await anext(results)
+        await results.aclose()
+        # The slow job has finished cancelling by the time the stream is closed
+        return result, list(finished)
+
+    assert asyncio.run(first_result()) == ("fast", ["fast", "slow"])
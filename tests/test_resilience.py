@@ -0,0 +1,144 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from agents import resilience
+from agents.resilience import CallPolicy, CircuitBreaker, CircuitOpenError, LLMUnavailableError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test-model", failure_threshold=3, reset_seconds=30)
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.allow()
+        breaker.record_failure()
+
+
+def test_stays_closed_below_threshold(breaker):
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.allow()
+    # A success resets the consecutive-failure count
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_opens_after_threshold_and_rejects(breaker):
+    trip(breaker)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_half_open_lets_one_trial_through(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+    assert breaker.state == "half-open"
+    breaker.allow()
+    # Only one trial at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_successful_trial_closes(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+    breaker.allow()
+
+
+def test_failed_trial_reopens_for_another_reset_period(breaker, clock):
+    trip(breaker)
+    clock.now += 30
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    clock.now += 1
+    breaker.allow()
+
+
+def test_call_stops_retrying_once_circuit_opens(monkeypatch):
+    monkeypatch.setitem(resilience.RESILIENCE_SETTINGS, "breaker_failure_threshold", 2)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    policy = CallPolicy("test", deadline=10, max_attempts=5, backoff_initial=0.001, backoff_max=0.001)
+    attempts = []
+
+    def request(timeout):
+        attempts.append(timeout)
+        raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.example.test"))
+
+    with pytest.raises(LLMUnavailableError):
+        policy.call("test-model", request, hedge=False)
+    assert len(attempts) == 2
+    assert resilience.get_breaker("test-model").state == "open"
+    with pytest.raises(CircuitOpenError):
+        policy.call("test-model", request, hedge=False)
+    assert len(attempts) == 2
+
+
+@pytest.fixture
+def half_open(monkeypatch, clock):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    breaker = resilience.get_breaker("trial-model")
+    trip(breaker)
+    clock.now += breaker.reset_seconds
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def test_cancelled_half_open_trial_gives_its_slot_back(half_open, clock):
+    policy = CallPolicy("test", deadline=60, max_attempts=1)
+
+    async def slow(timeout):
+        await asyncio.sleep(60)
+
+    async def cancel_trial():
+        task = asyncio.create_task(policy.acall("trial-model", slow, hedge=False))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    # The cancelled trial counts as failed: open for another reset period, then a new trial
+    assert half_open.state == "open"
+    clock.now += half_open.reset_seconds
+    assert half_open.allow() is True
+
+
+def test_expired_call_does_not_take_half_open_trial(half_open):
+    policy = CallPolicy("test", deadline=0, max_attempts=1)
+    with pytest.raises(LLMUnavailableError):
+        policy.call("trial-model", lambda timeout: "never sent", hedge=False)
+    assert half_open.state == "half-open"
+    assert half_open.allow() is True
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import services.response_store
+from services.response_store import open_store
+
+
+@pytest.fixture
+def settings(tmp_path):
+    legacy_path = tmp_path / "patient_responses.json"
+    legacy_path.write_text(json.dumps({
+        "+15550100001": {"responses": [{"timestamp": "2025-03-02T09:00:00", "message": "bit sore"}], "processed": True},
+        "+15550100002": {"responses": [{"timestamp": "2025-03-02T10:00:00", "message": "fine"}], "processed": False}
+    }))
+    return {"backend": "log", "path": str(tmp_path / "responses.log"), "legacy_json_path": str(legacy_path), "fsync": False}
+
+
+def test_open_store_migrates_legacy_json(settings):
+    store = open_store(settings)
+    assert store.get_patient("+15550100001") == {
+        "responses": [{"timestamp": "2025-03-02T09:00:00", "message": "bit sore"}], "processed": True
+    }
+    assert store.get_patient("+15550100002")["processed"] is False
+    store.close()
+
+    # Reopening doesn't migrate again
+    store = open_store(settings)
+    assert len(store.get_patient("+15550100001")["responses"]) == 1
+    store.close()
+
+
+def test_interrupted_migration_leaves_no_log(settings, monkeypatch, tmp_path):
+    def crash(json_path, store):
+        store.append_response("+15550100001", "bit sore")
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(services.response_store, "migrate_json_store", crash)
+    with pytest.raises(KeyboardInterrupt):
+        open_store(settings)
+    assert [path.name for path in tmp_path.iterdir()] == ["patient_responses.json"]
+
+    monkeypatch.undo()
+    store = open_store(settings)
+    assert sorted(store.phone_numbers()) == ["+15550100001", "+15550100002"]
+    store.close()
+
+
+def test_migration_never_replaces_a_log_created_meanwhile(settings, monkeypatch):
+    migrate = services.response_store.migrate_json_store
+
+    def racing_migrate(json_path, store):
+        # Another process finishes first and starts taking replies
+        other = services.response_store.create_store("log", settings["path"])
+        other.append_response("+15550100003", "new reply")
+        other.close()
+        return migrate(json_path, store)
+
+    monkeypatch.setattr(services.response_store, "migrate_json_store", racing_migrate)
+    store = open_store(settings)
+    assert store.phone_numbers() == ["+15550100003"]
+    store.close()
@@ -0,0 +1,45 @@
+import pytest
+
+from config import RISK_RULES
+from agents.risk_rules import RiskRulesEngine
+
+RECOVERING = {
+    "pain_level": 1,
+    "bleeding": "none",
+    "swelling": "none",
+    "fever": False,
+    "other_symptoms": [],
+    "overall_sentiment": "positive"
+}
+
+
+@pytest.fixture
+def engine():
+    return RiskRulesEngine(RISK_RULES["rules"])
+
+
+def test_trivial_recovery_is_low(engine):
+    assert engine.evaluate(RECOVERING)["rule"] == "trivial_recovery"
+
+
+@pytest.mark.parametrize("fever", [None, "no", 0])
+def test_fever_must_be_a_real_false(engine, fever):
+    assert engine.evaluate(dict(RECOVERING, fever=fever)) is None
+
+
+@pytest.mark.parametrize("field", ["fever", "other_symptoms"])
+def test_missing_field_is_not_trivial_recovery(engine, field):
+    symptoms = dict(RECOVERING)
+    del symptoms[field]
+    assert engine.evaluate(symptoms) is None
+
+
+@pytest.mark.parametrize("swelling", ["moderate", "severe"])
+def test_fever_with_significant_swelling(engine, swelling):
+    result = engine.evaluate(dict(RECOVERING, pain_level=4, fever=True, swelling=swelling))
+    assert result["risk_level"] == "High"
+    assert result["rule"] == "fever_with_significant_swelling"
+
+
+def test_failed_extraction_never_short_circuits(engine):
+    assert engine.evaluate({"error": "Failed to parse response"}) is None
@@ -0,0 +1,41 @@
+import pytest
+
+from config import SYMPTOM_EXTRACTOR_SETTINGS
+from agents.symptom_extractor import extract_symptoms, LocalSymptomExtractor
+from benchmarks.bench_symptom_extractor import check_eval_cases
+
+THRESHOLD = SYMPTOM_EXTRACTOR_SETTINGS["confidence_threshold"]
+
+
+def test_eval_cases_pass():
+    assert check_eval_cases(LocalSymptomExtractor(), THRESHOLD) == []
+
+
+@pytest.mark.parametrize("message", ["not good", "I am not okay", "don't feel great", "not doing well at all",
+                                     "no longer feeling good"])
+def test_negated_positive_is_not_read_as_recovery(message):
+    symptoms, confidence = extract_symptoms(message)
+    assert symptoms["overall_sentiment"] == "negative"
+    assert symptoms["pain_level"] == "not mentioned"
+    assert symptoms["bleeding"] == "not mentioned"
+    assert confidence < THRESHOLD
+
+
+def test_negator_in_another_clause_does_not_flip_positive():
+    symptoms, _ = extract_symptoms("Feeling better, not bleeding anymore")
+    assert symptoms["overall_sentiment"] == "positive"
+    assert symptoms["bleeding"] == "none"
+
+
+@pytest.mark.parametrize("message", ["the bleeding has not stopped", "it hasn't stopped bleeding",
+                                     "bleeding hasn't really stopped", "the bleeding never stopped"])
+def test_negated_stop_is_severe_bleeding(message):
+    symptoms, _ = extract_symptoms(message)
+    assert symptoms["bleeding"] == "severe"
+
+
+@pytest.mark.parametrize("message", ["the bleeding has stopped", "bleeding has mostly stopped", "no bleeding"])
+def test_stopped_bleeding_is_none(message):
+    symptoms, _ = extract_symptoms(message)
+    assert symptoms["bleeding"] == "none"
+
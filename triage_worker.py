@@ -0,0 +1,183 @@
+"""Background worker pool that drains the triage queue.
+
+The webhook enqueues every inbound SMS into the SQLite queue (QUEUE_SETTINGS in
+config.py). Each worker process claims a batch of jobs, runs them through the
+TriagePipeline, stores the results on the job and marks the patient processed
+once nothing else is pending for that phone number. Failed jobs are retried with
+backoff; jobs held by a crashed worker become claimable again after the
+visibility timeout.
+
+Usage:
+    python triage_worker.py [--workers 2] [--batch-size 4] [--once]
+"""
+import os
+import time
+import signal
+import socket
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from config import QUEUE_SETTINGS, STORAGE_SETTINGS, PATIENT_SETTINGS
+from models.patient import Patient
+from agents.pipeline import TriagePipeline, TriageJob
+from agents.instrumentation import call_context, new_run_id
+from services.job_queue import create_queue
+from services.response_store import open_store
+from services.patient_repository import create_repository
+from services.request_log import redact_phone
+
+logger = logging.getLogger("triage_worker")
+
+
+def build_patient(job, repository=None):
+    """Patient record to triage a queued reply against.
+
+    Uses a working copy of the patient registered under the sender's number
+    when there is one, then the patient fields stored with the job when the
+    enqueuer had them, otherwise a minimal record keyed on the phone number.
+    """
+    patient = repository.working_copy(job["phone_number"]) if repository is not None else None
+    if patient is not None:
+        return patient
+
+    details = job["patient"] or {}
+    procedure_date = details.get("procedure_date")
+    patient = Patient(
+        id=details.get("id", job["phone_number"]),
+        name=details.get("name", "Patient"),
+        procedure=details.get("procedure", "Dental procedure"),
+        procedure_date=datetime.fromisoformat(procedure_date) if procedure_date else datetime.fromisoformat(job["received_at"]),
+        contact_info=details.get("contact_info", ""),
+        medical_history=details.get("medical_history", "Not provided."),
+        phone_number=job["phone_number"]
+    )
+    patient.add_interaction()
+    return patient
+
+
+def error_kind(error):
+    """What went wrong, without the exception message, which can quote the patient's reply.
+
+    Pipeline errors read "<ExceptionClass>: <message>"; the full text stays in the job's last_error.
+    """
+    return str(error).split(":", 1)[0]
+
+
+def result_payload(result):
+    return {
+        "extracted_symptoms": result.extracted_symptoms,
+        "risk_assessment": result.risk_assessment,
+        "care_instructions": result.care_instructions,
+        "summary": result.summary,
+        "duration": result.duration,
+        "stage_durations": result.stage_durations
+    }
+
+
+def run_worker(worker_index, batch_size, once=False):
+    """Claim and process jobs until stopped (or until the queue is empty with once=True)."""
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{worker_index}"
+    triage_queue = create_queue(QUEUE_SETTINGS)
+    # The same store sms_webhook.py writes to; whichever process opens it first migrates the legacy JSON
+    store = open_store(STORAGE_SETTINGS)
+    repository = create_repository(PATIENT_SETTINGS)
+    pipeline = TriagePipeline()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Worker {worker_id} started")
+    while not stopping:
+        claimed = triage_queue.claim(worker_id, limit=batch_size)
+        if not claimed:
+            if once:
+                break
+            time.sleep(QUEUE_SETTINGS["poll_interval"])
+            continue
+
+        queued_jobs = {}
+        triage_jobs = []
+        for job in claimed:
+            triage_job = TriageJob(
+                patient=build_patient(job, repository), response_text=job["message"],
+                phone_number=job["phone_number"], queued_at=job["available_at"]
+            )
+            queued_jobs[id(triage_job)] = job
+            triage_jobs.append(triage_job)
+
+        with call_context(run_id=new_run_id()):
+            results = pipeline.run(triage_jobs)
+
+        for result in results:
+            job = queued_jobs[id(result.job)]
+            if not result.ok:
+                status = triage_queue.fail(job["id"], worker_id, result.error)
+                logger.warning(
+                    f"Job {job['id']} for {redact_phone(job['phone_number'])} attempt {job['attempts']} "
+                    f"failed ({status}): {error_kind(result.error)}"
+                )
+                continue
+
+            if not triage_queue.complete(job["id"], worker_id, result_payload(result)):
+                logger.warning(f"Job {job['id']} lease expired before completion; result discarded")
+                continue
+
+            # Registered patients keep the interaction in their history
+            repository.record_interaction(result.job.patient.id, result.job.patient.get_latest_interaction())
+
+            # A newer reply from the same patient still needs its own triage
+            if triage_queue.pending(job["phone_number"]) == 0:
+                store.mark_processed(job["phone_number"])
+            logger.info(
+                f"Job {job['id']} done for {redact_phone(job['phone_number'])} "
+                f"(risk: {result.risk_assessment.get('risk_level', 'Unknown')}, {result.duration:.1f}s)"
+            )
+
+    triage_queue.close()
+    store.close()
+    repository.close()
+    logger.info(f"Worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=QUEUE_SETTINGS["workers"], help="worker processes")
+    parser.add_argument("--batch-size", type=int, default=QUEUE_SETTINGS["batch_size"],
+                        help="jobs each worker claims and runs concurrently")
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    args = parser.parse_args()
+
+    if args.workers == 1:
+        run_worker(0, args.batch_size, args.once)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(index, args.batch_size, args.once), name=f"worker-{index}")
+        for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Workers got the SIGINT too and finish their current batch
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""Production WSGI entry point for the webhook server.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Any WSGI server works; each worker process imports this module and opens its
+own response store, triage queue and database connections.
+"""
+from sms_webhook import app  # noqa: F401